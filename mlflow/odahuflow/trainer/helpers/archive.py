@@ -0,0 +1,988 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import time
+import zlib
+from typing import Collection, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Errors of corrupted zstd stream
+_ZSTD_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+GZIP_COMPRESSION = 'gzip'
+ZSTD_COMPRESSION = 'zstd'
+COMPRESSIONS = (GZIP_COMPRESSION, ZSTD_COMPRESSION)
+
+ARCHIVE_EXTENSIONS = {
+    GZIP_COMPRESSION: '.tgz',
+    ZSTD_COMPRESSION: '.tar.zst',
+}
+DEFAULT_COMPRESSION_LEVELS = {
+    GZIP_COMPRESSION: 6,
+    ZSTD_COMPRESSION: 3,
+}
+
+# Size of uncompressed data that is compressed by one thread at once
+CHUNK_SIZE = 4 * 1024 * 1024
+# Size of data that is copied at once from previous archive
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# Index of incremental archive is stored next to it
+ARCHIVE_INDEX_SUFFIX = '.index.json'
+PREVIOUS_ARCHIVE_SUFFIX = '.previous'
+
+# Digests of archived files, it is the last entry of archive
+CHECKSUMS_FILE_NAME = 'odahuflow.checksums.json'
+# Digest of whole archive in sha256sum format is stored next to it
+ARCHIVE_DIGEST_SUFFIX = '.sha256'
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Types of indexed entries
+FILE_ENTRY = 'file'
+DIRECTORY_ENTRY = 'directory'
+SYMLINK_ENTRY = 'symlink'
+OTHER_ENTRY = 'other'
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    # file, directory, symlink or other
+    type: str
+    size: int
+
+
+class ArchiveStats(NamedTuple):
+    files: int
+    input_bytes: int
+    output_bytes: int
+    seconds: float
+    # Entries copied from previous archive without recompression
+    reused_files: int = 0
+    # SHA-256 digest of archive file if checksums are calculated
+    sha256: Optional[str] = None
+
+
+class _HashingWriter:
+    """
+    Calculates SHA-256 digest of data written to file
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.name = fileobj.name
+
+    @property
+    def closed(self) -> bool:
+        return self._fileobj.closed
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        return self._fileobj.write(data)
+
+    def tell(self) -> int:
+        return self._fileobj.tell()
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def close(self):
+        self._fileobj.close()
+
+
+class _HashingReader:
+    """
+    Calculates SHA-256 digest of data read from file
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+class _ParallelGzipCompressor:
+    """
+    Splits stream into chunks and compresses each chunk on a thread pool as a separate gzip member.
+    Concatenated gzip members form a valid gzip file, so result is readable by any gzip / tar implementation
+    """
+
+    def __init__(self, fileobj, level: int, threads: int, chunk_size: int = CHUNK_SIZE):
+        self._fileobj = fileobj
+        self._level = level
+        self._threads = threads
+        self._chunk_size = chunk_size
+
+        self._buffer = bytearray()
+        self._position = 0
+        self._pending: collections.deque = collections.deque()
+        self._executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix='odahuflow-gzip')
+
+        self._members = 0
+        # Compressed sizes of members that are written to file
+        self.member_sizes: List[int] = []
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+
+        while len(self._buffer) >= self._chunk_size:
+            self._submit(self._buffer[:self._chunk_size])
+            del self._buffer[:self._chunk_size]
+
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def end_member(self) -> int:
+        """
+        Compress buffered data as a separate gzip member
+
+        :return: number of members, data written afterwards starts a new member
+        """
+        if self._buffer:
+            self._submit(self._buffer)
+            self._buffer = bytearray()
+        return self._members
+
+    def copy_member(self, source, offset: int, size: int, uncompressed_size: int) -> None:
+        """
+        Copy already compressed gzip members as is
+
+        :param source: file with compressed data
+        :param offset: offset of members in <source>
+        :param size: compressed size of members
+        :param uncompressed_size: size of data that members contain
+        """
+        self.end_member()
+        while self._pending:
+            self._write_next()
+
+        _copy_range(source, self._fileobj, offset, size)
+
+        self._members += 1
+        self.member_sizes.append(size)
+        self._position += uncompressed_size
+
+    def close(self):
+        self.end_member()
+
+        while self._pending:
+            self._write_next()
+
+        self._executor.shutdown()
+
+    def abort(self):
+        """
+        Drop data that is not written yet
+        """
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._buffer = bytearray()
+        self._executor.shutdown()
+
+    def _submit(self, chunk: bytearray):
+        self._pending.append(self._executor.submit(_compress_gzip_member, bytes(chunk), self._level))
+        self._members += 1
+
+        # Bound memory used by compressed chunks that are not written yet
+        while len(self._pending) > 2 * self._threads:
+            self._write_next()
+
+    def _write_next(self):
+        member = self._pending.popleft().result()
+        self._fileobj.write(member)
+        self.member_sizes.append(len(member))
+
+
+def _compress_gzip_member(chunk: bytes, level: int) -> bytes:
+    # zlib releases GIL while compressing, so chunks are compressed in parallel
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(chunk) + compressor.flush()
+
+
+def _copy_range(source, target, offset: int, size: int) -> None:
+    source.seek(offset)
+    remaining = size
+    while remaining:
+        block = source.read(min(remaining, COPY_BLOCK_SIZE))
+        if not block:
+            raise ValueError(f'Archive {source.name} is truncated at {offset + size - remaining} byte')
+        target.write(block)
+        remaining -= len(block)
+
+
+class _ZstdCompressor:
+    """
+    Compresses stream with zstd using its own worker threads.
+    Members are independent zstd frames, concatenated frames form a valid zstd stream
+    """
+
+    def __init__(self, fileobj, level: int, threads: int):
+        if zstandard is None:
+            raise ValueError('zstd compression requires zstandard package. Install it or use gzip compression')
+
+        self._fileobj = fileobj
+        self._writer = zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(fileobj, closefd=False)
+        self._position = 0
+
+        self._members = 0
+        self._member_start = fileobj.tell()
+        self._member_written = False
+        # Compressed sizes of members that are written to file
+        self.member_sizes: List[int] = []
+
+    def write(self, data) -> int:
+        if data:
+            self._writer.write(data)
+            self._member_written = True
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def end_member(self) -> int:
+        """
+        Finish current zstd frame
+
+        :return: number of members, data written afterwards starts a new member
+        """
+        if self._member_written:
+            self._writer.flush(zstandard.FLUSH_FRAME)
+            self._add_member(self._fileobj.tell() - self._member_start)
+            self._member_written = False
+        return self._members
+
+    def copy_member(self, source, offset: int, size: int, uncompressed_size: int) -> None:
+        """
+        Copy already compressed zstd frames as is
+
+        :param source: file with compressed data
+        :param offset: offset of frames in <source>
+        :param size: compressed size of frames
+        :param uncompressed_size: size of data that frames contain
+        """
+        self.end_member()
+        _copy_range(source, self._fileobj, offset, size)
+        self._add_member(size)
+        self._position += uncompressed_size
+
+    def close(self):
+        self.end_member()
+        self._writer.close()
+
+    def abort(self):
+        """
+        Drop data that is not written yet, current frame is left unfinished
+        """
+        self._member_written = False
+
+    def _add_member(self, size: int):
+        self._members += 1
+        self.member_sizes.append(size)
+        self._member_start += size
+
+
+class ArchiveWriter:
+    """
+    Writes tar archive compressed by multiple threads
+    """
+
+    def __init__(self, path: str, compression: str = GZIP_COMPRESSION, level: Optional[int] = None,
+                 threads: Optional[int] = None, *, incremental: bool = False, index: bool = False,
+                 checksums: bool = False):
+        """
+        :param path: path to result archive
+        :param compression: gzip or zstd
+        :param level: compression level, default level of compression is used if not set
+        :param threads: number of compression threads, all CPUs are used if not set
+        :param incremental: write index and copy files that are not changed since previous archive
+                            from it without recompression
+        :param index: every entry is compressed as separate gzip members / zstd frames and index of entries
+                      is written next to archive, so entries can be read without decompressing whole archive
+        :param checksums: calculate SHA-256 digests of files while they are archived. Digests of files are added
+                          to archive as odahuflow.checksums.json entry, digest of archive is written next to it
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression {compression}. Supported compressions: {COMPRESSIONS}')
+
+        self.path = path
+        self.compression = compression
+        self.level = level if level is not None else DEFAULT_COMPRESSION_LEVELS[compression]
+        self.threads = threads or os.cpu_count() or 1
+        self.incremental = incremental
+        self.indexed = index or incremental
+        self.checksums = checksums
+        # SHA-256 digests of archived regular files
+        self.digests: Dict[str, str] = {}
+
+        self._started_at = time.perf_counter()
+        self._stats: Optional[ArchiveStats] = None
+        # Names of all entries added to archive
+        self.names: List[str] = []
+
+        self._index_entries: List[dict] = []
+        self._reused_files = 0
+        self._previous_entries: Dict[str, dict] = {}
+        self._previous_archive = None
+        # Archive and sidecar paths that are moved aside until new archive is complete
+        self._previous_paths: List[str] = []
+        if self.incremental:
+            self._open_previous_archive()
+
+        self._fileobj = _HashingWriter(open(path, 'wb'))  # pylint: disable=R1732
+        try:
+            if compression == ZSTD_COMPRESSION:
+                self._compressor = _ZstdCompressor(self._fileobj, self.level, self.threads)
+            else:
+                self._compressor = _ParallelGzipCompressor(self._fileobj, self.level, self.threads)
+            self._tar = tarfile.open(fileobj=self._compressor, mode='w')  # pylint: disable=R1732
+        except Exception:
+            self._fileobj.close()
+            self._remove_outputs()
+            self._close_previous_archive(restore=True)
+            raise
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Archive that is interrupted by error must not look complete
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def add_tree(self, source: str, arcname: str = '', exclude: Collection[str] = ()) -> None:
+        """
+        Add content of directory to archive
+
+        :param source: path to directory
+        :param arcname: path of directory content in archive, root of archive if empty
+        :param exclude: paths relative to <source> that are not added
+        """
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            relative_root = os.path.relpath(root, source)
+
+            for name in dirs + sorted(files):
+                if os.path.normpath(os.path.join(relative_root, name)) in exclude:
+                    continue
+                path = os.path.join(root, name)
+                self.add_file(path, os.path.normpath(os.path.join(arcname, relative_root, name)))
+
+    def add_file(self, path: str, arcname: str) -> None:
+        """
+        Add file, directory (without content) or link to archive
+
+        :param path: path to file
+        :param arcname: path in archive
+        """
+        if self.indexed:
+            self._add_indexed_entry(path, arcname)
+        else:
+            self._write_entry(path, self._tar.gettarinfo(path, arcname))
+        self.names.append(arcname)
+
+    def add_bytes(self, arcname: str, data: bytes, mode: int = 0o644) -> None:
+        """
+        Add file with provided content to archive
+
+        :param arcname: path in archive
+        :param data: content of file
+        :param mode: permissions of file
+        """
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.size = len(data)
+        tarinfo.mode = mode
+        tarinfo.mtime = int(time.time())
+
+        start = self._start_entry()
+        self._tar.addfile(tarinfo, io.BytesIO(data))
+        sha256 = self._add_digest(arcname, hashlib.sha256(data).hexdigest())
+        if self.indexed:
+            self._index_entry(tarinfo, start, sha256=sha256)
+        self.names.append(arcname)
+
+    def close(self) -> ArchiveStats:
+        """
+        Finish archive
+
+        :return: archiving statistics
+        """
+        if self._stats is not None:
+            return self._stats
+
+        try:
+            if self.checksums:
+                self._add_checksums_file()
+            self._tar.close()
+            self._compressor.close()
+        except Exception:
+            self.abort()
+            raise
+        self._fileobj.close()
+        self._close_previous_archive()
+
+        # Digests are written only for complete archive, digest and index of previous archive are removed
+        sha256 = self._fileobj.digest.hexdigest() if self.checksums else None
+        if sha256:
+            with open(self.path + ARCHIVE_DIGEST_SUFFIX, 'w', encoding='utf-8') as digest_file:
+                digest_file.write(f'{sha256}  {os.path.basename(self.path)}\n')
+        elif os.path.exists(self.path + ARCHIVE_DIGEST_SUFFIX):
+            os.unlink(self.path + ARCHIVE_DIGEST_SUFFIX)
+        if self.indexed:
+            self._write_index(sha256)
+        elif os.path.exists(self.path + ARCHIVE_INDEX_SUFFIX):
+            os.unlink(self.path + ARCHIVE_INDEX_SUFFIX)
+
+        stats = self._stats = self.stats()._replace(sha256=sha256)
+        megabytes = 1024 * 1024
+        logger.info(f'Archived {stats.files} entries to {self.path}: '
+                    f'{stats.input_bytes / megabytes:.1f} MB -> {stats.output_bytes / megabytes:.1f} MB '
+                    f'in {stats.seconds:.2f} s ({stats.input_bytes / megabytes / max(stats.seconds, 1e-9):.1f} MB/s, '
+                    f'{self.compression} level {self.level}, {self.threads} threads, '
+                    f'{stats.reused_files} unchanged files reused)')
+        return stats
+
+    def abort(self) -> None:
+        """
+        Discard archive that is not complete: partial archive is removed, index and digest are not written
+        """
+        if self._stats is not None or self._fileobj.closed:
+            return
+
+        try:
+            self._compressor.abort()
+        finally:
+            self._fileobj.close()
+            self._remove_outputs()
+            self._close_previous_archive(restore=True)
+        logger.warning(f'Archiving to {self.path} is aborted, partial archive is removed')
+
+    def _remove_outputs(self) -> None:
+        for path in (self.path, self.path + ARCHIVE_INDEX_SUFFIX, self.path + ARCHIVE_DIGEST_SUFFIX):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def stats(self) -> ArchiveStats:
+        """
+        Get archiving statistics, final statistics are returned once archive is closed
+
+        :return: archiving statistics
+        """
+        if self._stats is not None:
+            return self._stats
+
+        return ArchiveStats(
+            files=len(self.names),
+            input_bytes=self._compressor.tell(),
+            output_bytes=os.path.getsize(self.path) if self._fileobj.closed else self._fileobj.tell(),
+            seconds=time.perf_counter() - self._started_at,
+            reused_files=self._reused_files,
+        )
+
+    def _open_previous_archive(self) -> None:
+        """
+        Keep archive that is overwritten to reuse its compressed entries. Archive and its index and digest
+        are moved aside until new archive is complete, they are restored if archiving fails
+        """
+        index = read_archive_index(self.path)
+
+        for path in (self.path, self.path + ARCHIVE_INDEX_SUFFIX, self.path + ARCHIVE_DIGEST_SUFFIX):
+            if os.path.isfile(path):
+                os.replace(path, path + PREVIOUS_ARCHIVE_SUFFIX)
+                self._previous_paths.append(path)
+
+        if not index or self.path not in self._previous_paths:
+            return
+        if index.get('compression') != self.compression or index.get('level') != self.level:
+            logger.info(f'Compression of previous archive {self.path} differs, all entries are compressed')
+            return
+
+        self._previous_archive = open(self.path + PREVIOUS_ARCHIVE_SUFFIX, 'rb')  # pylint: disable=R1732
+        self._previous_entries = {entry['name']: entry for entry in index.get('entries', [])}
+
+    def _close_previous_archive(self, restore: bool = False) -> None:
+        """
+        Remove previous archive and its sidecars or put them back if <restore> is set
+        """
+        if self._previous_archive is not None:
+            self._previous_archive.close()
+            self._previous_archive = None
+
+        for path in self._previous_paths:
+            if restore:
+                os.replace(path + PREVIOUS_ARCHIVE_SUFFIX, path)
+            else:
+                os.unlink(path + PREVIOUS_ARCHIVE_SUFFIX)
+        self._previous_paths = []
+
+    def _add_indexed_entry(self, path: str, arcname: str) -> None:
+        """
+        Add entry as separate compressed members. Members of previous archive are copied if file is not changed
+        """
+        tarinfo = self._tar.gettarinfo(path, arcname)
+        start = self._start_entry()
+
+        if not tarinfo.isreg() or not self.incremental:
+            sha256 = self._write_entry(path, tarinfo)
+            self._index_entry(tarinfo, start, sha256=sha256)
+            return
+
+        header = tarinfo.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+        header_sha256 = hashlib.sha256(header).hexdigest()
+        stat = os.stat(path)
+
+        # Header contains modification time, so file with changed header has to be written anyway.
+        # File is not read to check that it is changed, changed file is hashed while it is written
+        previous = self._previous_entries.get(arcname)
+        if previous is not None and previous.get('header_sha256') == header_sha256 \
+                and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+            sha256 = previous['sha256']
+            entry_size = len(header) + _padded_size(tarinfo.size)
+
+            self._compressor.copy_member(self._previous_archive, previous['compressed_offset'],
+                                         previous['compressed_size'], entry_size)
+            # Keep tarfile aware of data written around it, it is used to finish archive
+            self._tar.offset += entry_size
+            self._tar.members.append(tarinfo)
+            self._reused_files += 1
+        else:
+            with open(path, 'rb') as stream:
+                reader = _HashingReader(stream)
+                self._tar.addfile(tarinfo, reader)
+            sha256 = reader.digest.hexdigest()
+
+        self._add_digest(arcname, sha256)
+        self._index_entry(tarinfo, start, mtime_ns=stat.st_mtime_ns, sha256=sha256, header_sha256=header_sha256)
+
+    def _write_entry(self, path: str, tarinfo: tarfile.TarInfo) -> Optional[str]:
+        """
+        Write entry to tar stream
+
+        :return: digest of content if it is regular file and checksums are calculated
+        """
+        if not tarinfo.isreg():
+            self._tar.addfile(tarinfo)
+            return None
+
+        with open(path, 'rb') as stream:
+            if not self.checksums:
+                self._tar.addfile(tarinfo, stream)
+                return None
+
+            # Content is hashed while it is read by tarfile
+            reader = _HashingReader(stream)
+            self._tar.addfile(tarinfo, reader)
+        return self._add_digest(tarinfo.name, reader.digest.hexdigest())
+
+    def _add_digest(self, arcname: str, sha256: str) -> Optional[str]:
+        if not self.checksums:
+            return None
+        self.digests[arcname] = sha256
+        return sha256
+
+    def _add_checksums_file(self) -> None:
+        content = json.dumps({'algorithm': 'sha256', 'files': self.digests}, indent=2, sort_keys=True)
+
+        tarinfo = tarfile.TarInfo(CHECKSUMS_FILE_NAME)
+        tarinfo.size = len(content)
+        tarinfo.mtime = int(time.time())
+
+        start = self._start_entry()
+        self._tar.addfile(tarinfo, io.BytesIO(content.encode('utf-8')))
+        if self.indexed:
+            self._index_entry(tarinfo, start)
+        self.names.append(CHECKSUMS_FILE_NAME)
+
+    def _start_entry(self) -> Tuple[int, int]:
+        """
+        Start new compressed member for entry
+
+        :return: number of finished members and offset of entry in uncompressed tar stream
+        """
+        return self._compressor.end_member(), self._tar.offset
+
+    def _index_entry(self, tarinfo: tarfile.TarInfo, start: Tuple[int, int], **fields) -> None:
+        """
+        Finish members of entry that is just added and remember its position
+        """
+        first_member, start_offset = start
+        last_member = self._compressor.end_member()
+
+        self._index_entries.append({
+            'name': tarinfo.name,
+            'type': _entry_type(tarinfo),
+            'size': tarinfo.size,
+            # Entry data follows tar header in decompressed members of entry
+            'data_offset': self._tar.offset - _padded_size(tarinfo.size) - start_offset,
+            'members': (first_member, last_member),
+            **{key: value for key, value in fields.items() if value is not None},
+        })
+
+    def _write_index(self, sha256: Optional[str]) -> None:
+        offsets = [0]
+        for size in self._compressor.member_sizes:
+            offsets.append(offsets[-1] + size)
+
+        entries = []
+        for entry in self._index_entries:
+            first_member, last_member = entry.pop('members')
+            entry['compressed_offset'] = offsets[first_member]
+            entry['compressed_size'] = offsets[last_member] - offsets[first_member]
+            entries.append(entry)
+
+        with open(self.path + ARCHIVE_INDEX_SUFFIX, 'w', encoding='utf-8') as stream:
+            json.dump({'compression': self.compression, 'level': self.level, 'sha256': sha256, 'entries': entries},
+                      stream)
+
+
+class ArchiveReader:
+    """
+    Reads single entries of indexed archive without decompressing the whole archive
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: path to archive written with index
+        """
+        index = read_archive_index(path)
+        if index is None:
+            raise ValueError(f'Archive {path} has no index, it must be written with index')
+
+        self.path = path
+        self.compression = index['compression']
+        self._entries = {entry['name']: entry for entry in index['entries']}
+        self._fileobj = open(path, 'rb')  # pylint: disable=R1732
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self._fileobj.close()
+
+    def members(self) -> List[ArchiveMember]:
+        """
+        List entries of archive in order they are written
+
+        :return: entries of archive
+        """
+        return [ArchiveMember(entry['name'], entry['type'], entry['size']) for entry in self._entries.values()]
+
+    def iter_content(self, name: str) -> Iterator[bytes]:
+        """
+        Read content of file entry by blocks. Only members of this entry are decompressed
+
+        :param name: path in archive
+        :return: blocks of content
+        """
+        entry = self._entries.get(os.path.normpath(name))
+        if entry is None:
+            raise KeyError(f'{name} is not found in archive {self.path}')
+
+        skip = entry['data_offset']
+        remaining = entry['size']
+        for block in _decompress(self._fileobj, entry['compressed_offset'], entry['compressed_size'],
+                                 self.compression):
+            if skip >= len(block):
+                skip -= len(block)
+                continue
+
+            block = block[skip:skip + remaining]
+            skip = 0
+            remaining -= len(block)
+            yield block
+
+            if not remaining:
+                return
+
+        if remaining:
+            raise ValueError(f'Entry {name} of archive {self.path} is truncated')
+
+    def read(self, name: str) -> bytes:
+        """
+        Read content of file entry
+
+        :param name: path in archive
+        :return: content
+        """
+        return b''.join(self.iter_content(name))
+
+    def extract(self, name: str, path: str) -> None:
+        """
+        Write content of file entry to file
+
+        :param name: path in archive
+        :param path: path to result file
+        """
+        with open(path, 'wb') as stream:
+            for block in self.iter_content(name):
+                stream.write(block)
+
+
+def verify_archive(path: str, extract_to: Optional[str] = None) -> int:
+    """
+    Verify digests of archived files and of archive itself in a single pass over archive.
+    Files can be extracted in the same pass. If archive has index, every file is verified as soon as it is read,
+    otherwise files are verified by odahuflow.checksums.json entry at the end of archive
+
+    :param path: path to archive written with checksums
+    :param extract_to: directory to extract archive to, archive is not extracted if not set
+    :return: number of verified files
+    :raises ValueError: if digest does not match, checksums are missing or archive is corrupted
+    """
+    index = read_archive_index(path) or {}
+    expected = {entry['name']: entry['sha256'] for entry in index.get('entries', []) if 'sha256' in entry}
+    actual: Dict[str, str] = {}
+
+    with open(path, 'rb') as raw:
+        archive_reader = _HashingReader(raw)
+        stream = _open_decompressing_stream(archive_reader, raw.read(len(ZSTD_MAGIC)))
+
+        try:
+            checksums = _verify_entries(stream, path, extract_to, expected, actual)
+        except (OSError, EOFError, zlib.error, tarfile.TarError, KeyError, TypeError, *_ZSTD_ERRORS) as error:
+            raise ValueError(f'Archive {path} is corrupted: {error!r}') from error
+
+        # Rest of compressed stream is not needed by tar, but it is a part of archive digest
+        while archive_reader.read(COPY_BLOCK_SIZE):
+            pass
+
+    if checksums is None:
+        raise ValueError(f'Archive {path} has no {CHECKSUMS_FILE_NAME}')
+    mismatched = sorted(name for name in checksums.keys() | actual.keys() if checksums.get(name) != actual.get(name))
+    if mismatched:
+        raise ValueError(f'Digests of files in archive {path} do not match: {mismatched}')
+
+    archive_digest = index.get('sha256') or _read_archive_digest(path)
+    if archive_digest and archive_digest != archive_reader.digest.hexdigest():
+        raise ValueError(f'Digest of archive {path} does not match')
+
+    logger.info(f'Verified {len(actual)} files of archive {path}')
+    return len(actual)
+
+
+def _verify_entries(stream, path: str, extract_to: Optional[str], expected: Dict[str, str],
+                    actual: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """
+    Hash (and extract) archived files
+
+    :param stream: decompressed tar stream
+    :param path: path to archive
+    :param extract_to: directory to extract archive to, archive is not extracted if not set
+    :param expected: digests of files known from archive index
+    :param actual: calculated digests are stored here
+    :return: digests from odahuflow.checksums.json entry, None if archive has no such entry
+    """
+    checksums = None
+
+    with tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            target = _extraction_path(extract_to, member.name) if extract_to else None
+            if member.isdir() and target:
+                os.makedirs(target, exist_ok=True)
+            if not member.isreg():
+                continue
+
+            reader = _HashingReader(tar.extractfile(member))
+            if member.name == CHECKSUMS_FILE_NAME:
+                checksums = json.loads(_copy_stream(reader, target))['files']
+                continue
+
+            _copy_stream(reader, target, keep=False)
+            actual[member.name] = reader.digest.hexdigest()
+            if member.name in expected and expected[member.name] != actual[member.name]:
+                raise ValueError(f'Digest of {member.name} in archive {path} does not match')
+
+    return checksums
+
+
+def _open_decompressing_stream(reader: '_HashingReader', magic: bytes):
+    reader.digest.update(magic)
+    prefixed = _PrefixedReader(magic, reader)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=prefixed, mode='rb')
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError('zstd archive requires zstandard package')
+        return zstandard.ZstdDecompressor().stream_reader(prefixed, read_across_frames=True)
+    raise ValueError('Unknown compression of archive')
+
+
+class _PrefixedReader:
+    """
+    Returns already read prefix of file before rest of file
+    """
+
+    def __init__(self, prefix: bytes, fileobj):
+        self._prefix = prefix
+        self._fileobj = fileobj
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            return self._fileobj.read(size)
+
+        if size < 0:
+            data, self._prefix = self._prefix + self._fileobj.read(), b''
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data + self._fileobj.read(size - len(data)) if len(data) < size else data
+
+
+def _extraction_path(directory: str, name: str) -> str:
+    path = os.path.normpath(os.path.join(directory, name))
+    if os.path.isabs(name) or not path.startswith(os.path.normpath(directory) + os.sep):
+        raise ValueError(f'Archive entry {name} is outside of extraction directory')
+    return path
+
+
+def _copy_stream(reader: '_HashingReader', path: Optional[str], keep: bool = True) -> Optional[bytes]:
+    """
+    Read stream to the end, write it to file if path is set
+
+    :return: content of stream if <keep> is set
+    """
+    blocks = []
+    with open(path, 'wb') if path else contextlib.nullcontext() as target:
+        for block in iter(lambda: reader.read(COPY_BLOCK_SIZE), b''):
+            if target:
+                target.write(block)
+            if keep:
+                blocks.append(block)
+    return b''.join(blocks) if keep else None
+
+
+def _read_archive_digest(path: str) -> Optional[str]:
+    try:
+        with open(path + ARCHIVE_DIGEST_SUFFIX, encoding='utf-8') as digest_file:
+            return digest_file.read().split()[0]
+    except (FileNotFoundError, IndexError):
+        return None
+
+
+def _decompress(fileobj, offset: int, size: int, compression: str) -> Iterator[bytes]:
+    """
+    Decompress members that are stored in range of file
+    """
+    if compression == ZSTD_COMPRESSION:
+        if zstandard is None:
+            raise ValueError('zstd archive requires zstandard package')
+        # Every entry is a single zstd frame
+        new_decompressor = zstandard.ZstdDecompressor().decompressobj
+    else:
+        def new_decompressor():
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    decompressor = new_decompressor()
+    fileobj.seek(offset)
+    remaining = size
+    while remaining:
+        data = fileobj.read(min(remaining, COPY_BLOCK_SIZE))
+        if not data:
+            raise ValueError(f'Archive {fileobj.name} is truncated')
+        remaining -= len(data)
+
+        while data:
+            yield decompressor.decompress(data)
+            if compression == GZIP_COMPRESSION and decompressor.eof:
+                # Next gzip member starts
+                data = decompressor.unused_data
+                decompressor = new_decompressor()
+            else:
+                data = b''
+
+
+def _padded_size(size: int) -> int:
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    return (blocks + (remainder > 0)) * tarfile.BLOCKSIZE
+
+
+def _entry_type(tarinfo: tarfile.TarInfo) -> str:
+    if tarinfo.isreg():
+        return FILE_ENTRY
+    if tarinfo.isdir():
+        return DIRECTORY_ENTRY
+    if tarinfo.issym():
+        return SYMLINK_ENTRY
+    return OTHER_ENTRY
+
+
+def read_archive_index(path: str) -> Optional[dict]:
+    """
+    Read index of incremental archive
+
+    :param path: path to archive
+    :return: index or None if archive has no index or it is broken
+    """
+    try:
+        with open(path + ARCHIVE_INDEX_SUFFIX, encoding='utf-8') as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning(f'Index of archive {path} is broken')
+        return None
+
+
+def archive_directory(source: str, path: str, compression: str = GZIP_COMPRESSION, level: Optional[int] = None,
+                      threads: Optional[int] = None, *, incremental: bool = False, index: bool = False,
+                      checksums: bool = False, exclude: Collection[str] = ()) -> ArchiveStats:
+    """
+    Archive content of directory
+
+    :param source: path to directory
+    :param path: path to result archive
+    :param compression: gzip or zstd
+    :param level: compression level, default level of compression is used if not set
+    :param threads: number of compression threads, all CPUs are used if not set
+    :param incremental: reuse compressed files of previous archive that are not changed
+    :param index: write index that allows to read single entries, see ArchiveReader
+    :param checksums: calculate digests of files and archive, see verify_archive
+    :param exclude: paths relative to <source> that are not archived
+    :return: archiving statistics
+    """
+    with ArchiveWriter(path, compression, level, threads, incremental=incremental, index=index,
+                       checksums=checksums) as archive:
+        archive.add_tree(source, exclude=exclude)
+    return archive.close()
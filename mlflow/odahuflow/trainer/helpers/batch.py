@@ -0,0 +1,205 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import yaml
+from odahuflow.sdk.models import ModelIdentity
+
+from odahuflow.trainer.helpers.archive import COMPRESSIONS, GZIP_COMPRESSION
+from odahuflow.trainer.helpers.mlflow_helper import convert_mlflow_model, setup_logging, FULL_VALIDATION, \
+    SCHEMA_VALIDATION, VALIDATION_LEVELS
+
+JOB_FIELDS = ('name', 'version', 'mlflow_model_path', 'gppi_model_path', 'mlflow_run_id')
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class ConversionJob(NamedTuple):
+    name: str
+    version: str
+    mlflow_model_path: str
+    gppi_model_path: str
+    mlflow_run_id: str
+
+
+class ConversionResult(NamedTuple):
+    job: ConversionJob
+    status: str
+    seconds: float
+    # Size of result archive, None if result is not archived
+    archive_bytes: Optional[int] = None
+    error: Optional[str] = None
+
+
+def read_jobs(path: str) -> List[ConversionJob]:
+    """
+    Read conversion jobs from json/yaml list of objects with name, version, mlflow_model_path,
+    gppi_model_path and mlflow_run_id fields
+
+    :param path: path to jobs file
+    :return: conversion jobs
+    """
+    with open(path, encoding='utf-8') as jobs_file:
+        # JSON is a subset of YAML
+        content = yaml.safe_load(jobs_file)
+
+    if not isinstance(content, list):
+        raise ValueError(f'Jobs file {path} must contain a list of jobs')
+
+    jobs = []
+    for number, job in enumerate(content):
+        missing = [field for field in JOB_FIELDS if not isinstance(job, dict) or job.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f'Job #{number} in {path} misses fields: {", ".join(missing)}')
+        jobs.append(ConversionJob(**{field: str(job[field]).strip() for field in JOB_FIELDS}))
+
+    return jobs
+
+
+def convert_batch(jobs: List[ConversionJob], workers: Optional[int] = None,
+                  **options: Any) -> List[ConversionResult]:
+    """
+    Convert MLflow models on a process pool. Failure of a job does not stop other jobs
+
+    :param jobs: conversion jobs
+    :param workers: number of worker processes, number of CPUs if not set
+    :param options: keyword arguments of convert_mlflow_model, they are shared by all jobs
+    :return: results in order of jobs
+    """
+    results: List[Optional[ConversionResult]] = [None] * len(jobs)
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(_convert, job, options): number for number, job in enumerate(jobs)}
+
+        for future in concurrent.futures.as_completed(futures):
+            number = futures[future]
+            try:
+                results[number] = future.result()
+            except Exception as error:
+                # Worker process died, job result is lost
+                results[number] = ConversionResult(jobs[number], FAILED, 0.0, error=f'Worker failed: {error!r}')
+
+            result = results[number]
+            if result.status == SUCCEEDED:
+                logging.info(f'Model {result.job.name}:{result.job.version} converted in {result.seconds:.2f} s')
+            else:
+                logging.error(f'Model {result.job.name}:{result.job.version} conversion failed: {result.error}')
+
+    return results
+
+
+def write_report(results: List[ConversionResult], path: str, seconds: float) -> None:
+    """
+    Write json report of batch conversion
+
+    :param results: conversion results
+    :param path: path to report
+    :param seconds: duration of batch
+    """
+    report: Dict[str, Any] = {
+        'seconds': seconds,
+        'succeeded': sum(result.status == SUCCEEDED for result in results),
+        'failed': sum(result.status == FAILED for result in results),
+        'jobs': [{**result.job._asdict(), **{key: value for key, value in result._asdict().items() if key != 'job'}}
+                 for result in results],
+    }
+
+    with open(path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+def _convert(job: ConversionJob, options: Dict[str, Any]) -> ConversionResult:
+    """
+    Convert one model in worker process
+    """
+    started_at = time.perf_counter()
+    try:
+        stats = convert_mlflow_model(model_meta=ModelIdentity(name=job.name, version=job.version),
+                                     mlflow_model_path=job.mlflow_model_path,
+                                     gppi_model_path=job.gppi_model_path,
+                                     mlflow_run_id=job.mlflow_run_id,
+                                     **options)
+    except Exception as error:
+        logging.debug(traceback.format_exc())
+        return ConversionResult(job, FAILED, time.perf_counter() - started_at, error=f'{type(error).__name__}: {error}')
+
+    return ConversionResult(job, SUCCEEDED, time.perf_counter() - started_at,
+                            archive_bytes=stats.output_bytes if stats else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts list of MLFLow models to GPPI.')
+
+    parser.add_argument('--verbose', action='store_true', help='More extensive logging')
+    parser.add_argument('--jobs', type=str, required=True,
+                        help=f'json/yaml list of jobs with fields: {", ".join(JOB_FIELDS)}')
+    parser.add_argument('--report', type=str, default='gppi_conversion_report.json',
+                        help='Path to json report with result of every job')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, number of CPUs if not set')
+    parser.add_argument('--no-tgz', dest='tgz', action='store_false', help='Prevent archiving result directories')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default=GZIP_COMPRESSION,
+                        help='Compression of result archives')
+    parser.add_argument('--compression-level', type=int, help='Compression level, default level is used if not set')
+    parser.add_argument('--compression-threads', type=int, default=1,
+                        help='Number of compression threads of each worker')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write models straight into archives without intermediate GPPI directories')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Keep result directories and archive indexes between conversions')
+    parser.add_argument('--index', action='store_true',
+                        help='Write index of archive entries next to every archive')
+    parser.add_argument('--no-checksums', dest='checksums', action='store_false',
+                        help='Do not write SHA-256 digests of archived files and archives')
+    parser.add_argument('--validation', choices=VALIDATION_LEVELS,
+                        help=f'Validation of result GPPIs, {FULL_VALIDATION} by default, '
+                             f'{SCHEMA_VALIDATION} with --stream')
+    args = parser.parse_args()
+
+    setup_logging(args)
+
+    try:
+        jobs = read_jobs(args.jobs)
+    except Exception as e:
+        logging.error(f'Can not read jobs. Message: {e}')
+        sys.exit(1)
+
+    started_at = time.perf_counter()
+    results = convert_batch(jobs, args.workers, tgz=args.tgz, stream=args.stream, compression=args.compression,
+                            level=args.compression_level, threads=args.compression_threads,
+                            incremental=args.incremental, index=args.index, checksums=args.checksums,
+                            validation=args.validation)
+    seconds = time.perf_counter() - started_at
+
+    write_report(results, args.report, seconds)
+    failed = sum(result.status == FAILED for result in results)
+    logging.info(f'Converted {len(results) - failed} of {len(results)} models in {seconds:.2f} s. '
+                 f'Report: {os.path.abspath(args.report)}')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,12 +13,24 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 #
+import atexit
+import glob
+import hashlib
 import json
 import logging
 import os
+import platform
+import re
 import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from os.path import join
-from typing import Any, Dict
+from typing import Any, Collection, Dict, List, Optional, Tuple
 
 import yaml
 from odahuflow.trainer.helpers.wrapper.entities import MLFlowWrapperOutput
@@ -30,6 +42,21 @@ MLFLOW_WRAPPER_INPUT_FILE_PATH = "mlflow-input.json"
 MLPROJECT_FILE_NAME = "mlproject"
 DEFAULT_CONDA_FILE_NAME = "conda.yaml"
 ODAHU_MODEL_CONDA_ENV_NAME = os.environ.get("ODAHU_CONDA_ENV_NAME", "odahu_model")
+# Directory of cached model conda environments, environments are not cached if it is not set
+CONDA_ENV_CACHE_DIR = os.environ.get("ODAHU_CONDA_ENV_CACHE_DIR")
+# Least recently used environments are evicted when size of cache exceeds this number of bytes
+CONDA_ENV_CACHE_MAX_SIZE = int(os.environ.get("ODAHU_CONDA_ENV_CACHE_MAX_SIZE", 20 * 1024 ** 3))
+CONDA_ENV_CACHE_ENTRY_FILE_NAME = "entry.json"
+CONDA_ENV_CACHE_ENV_DIR_NAME = "env"
+# Runs are requested from long-lived MLflow wrapper instead of starting wrapper for every run
+MLFLOW_WRAPPER_SERVER_ENABLED = os.environ.get("ODAHU_MLFLOW_WRAPPER_SERVER", "").lower() in ("1", "true", "yes")
+MLFLOW_WRAPPER_SERVER_START_TIMEOUT = 300
+MLFLOW_WRAPPER_SERVER_STOP_TIMEOUT = 30
+# Resolved model environment is recorded next to MLproject file: explicit conda package URLs with md5 and pip freeze
+CONDA_LOCK_FILE_NAME = "conda.lock.txt"
+PIP_LOCK_FILE_NAME = "requirements.lock.txt"
+# The first line of lock files, it binds them to the conda file they are resolved from
+LOCK_HEADER_PREFIX = "# odahuflow conda file sha256: "
 
 
 logger = logging.getLogger(__name__)
@@ -84,10 +111,12 @@ def _get_conda_command(conda_env_name):
     return activate_conda_env
 
 
-def update_model_conda_env(model_training: ModelTraining):
+def update_model_conda_env(model_training: ModelTraining, force_solve: bool = False):
     """
-    Update model conda dependencies
+    Update model conda dependencies. Environment is restored from cache or installed from lock files if possible,
+    conda solver is run otherwise and lock files are written
     :param model_training:
+    :param force_solve: ignore cache and lock files, solve dependencies again
     """
 
     mlproject_file_path = _find_mlproject_file_path(model_training)
@@ -110,32 +139,477 @@ def update_model_conda_env(model_training: ModelTraining):
         )
         return
 
+    work_dir = os.path.join(os.getcwd(), model_training.spec.work_dir)
+    conda_file_name = _extract_conda_file_name(ml_project)
+    conda_file_path = os.path.join(work_dir, conda_file_name)
+    prefix = _get_conda_env_prefix(ODAHU_MODEL_CONDA_ENV_NAME)
+
+    key = None
+    if CONDA_ENV_CACHE_DIR:
+        key = conda_env_cache_key(conda_file_path, prefix)
+        if force_solve:
+            shutil.rmtree(os.path.join(CONDA_ENV_CACHE_DIR, key), ignore_errors=True)
+        elif restore_cached_conda_env(CONDA_ENV_CACHE_DIR, key, prefix):
+            return
+
+    conda_file_digest = conda_file_sha256(conda_file_path)
+    if force_solve or not install_conda_env_lock(work_dir, conda_file_digest, prefix):
+        _run_conda_env_update(conda_file_name, work_dir)
+        write_conda_env_lock(work_dir, conda_file_digest, prefix)
+
+    if key:
+        store_conda_env(CONDA_ENV_CACHE_DIR, key, prefix, CONDA_ENV_CACHE_MAX_SIZE)
+
+
+def _run_conda_env_update(conda_file_name: str, work_dir: str) -> None:
+    started_at = time.perf_counter()
     io_proc_utils.run(
         "conda", "env", "update", "-n", ODAHU_MODEL_CONDA_ENV_NAME,
-        "-f", _extract_conda_file_name(ml_project),
-        cwd=os.path.join(os.getcwd(), model_training.spec.work_dir)
+        "-f", conda_file_name,
+        cwd=work_dir
     )
+    logger.info(f"Conda environment {ODAHU_MODEL_CONDA_ENV_NAME} is updated "
+                f"in {time.perf_counter() - started_at:.2f} s")
+
+
+def _get_conda_env_prefix(conda_env_name: str) -> str:
+    """
+    Find directory of conda environment by its name
+    :param conda_env_name: name of conda environment
+    :return: path to conda environment
+    """
+    _, stdout, _ = io_proc_utils.run("conda", "env", "list", "--json", stream_output=False)
+    for prefix in json.loads(stdout)["envs"]:
+        if os.path.basename(prefix) == conda_env_name:
+            return prefix
+
+    raise ValueError(f"Can't find conda environment {conda_env_name}")
+
+
+def _conda_env_python_version(prefix: str) -> Optional[str]:
+    """
+    Get python version of conda environment from its package metadata, without running interpreter
+    :param prefix: path to conda environment
+    :return: python version, None if python is not installed
+    """
+    for meta_path in glob.glob(os.path.join(prefix, "conda-meta", "python-[0-9]*.json")):
+        match = re.match(r"python-(\d+\.\d+\.\d+)", os.path.basename(meta_path))
+        if match:
+            return match.group(1)
+    return None
+
+
+def normalize_conda_env(conda_env: Dict[str, Any], conda_file_dir: str) -> Dict[str, Any]:
+    """
+    Normalize conda environment file, so files that lead to the same environment have the same content:
+    name and prefix are dropped, dependencies are sorted and stripped of whitespaces,
+    content of pip requirement files is inlined. Order of channels is kept, it sets their priority
+    :param conda_env: content of conda environment file
+    :param conda_file_dir: directory of conda environment file, pip requirement files are relative to it
+    :return: normalized environment
+    """
+    def normalize_requirement(requirement: str) -> str:
+        return re.sub(r"\s+", "", requirement)
+
+    dependencies = []
+    pip_dependencies = []
+    for dependency in conda_env.get("dependencies") or []:
+        if isinstance(dependency, dict):
+            for requirement in dependency.get("pip") or []:
+                match = re.match(r"^(-r|--requirement)\s*(\S+)$", requirement.strip())
+                if match:
+                    with open(os.path.join(conda_file_dir, match.group(2)), encoding="utf-8") as requirements_file:
+                        pip_dependencies.extend(line.split("#")[0] for line in requirements_file)
+                else:
+                    pip_dependencies.append(requirement)
+        else:
+            dependencies.append(str(dependency))
+
+    return {
+        "channels": [str(channel).strip() for channel in conda_env.get("channels") or []],
+        "dependencies": sorted(normalize_requirement(dependency) for dependency in dependencies),
+        "pip": sorted({normalize_requirement(dependency) for dependency in pip_dependencies} - {""}),
+    }
+
+
+def _read_normalized_conda_env(conda_file_path: str) -> Dict[str, Any]:
+    with open(conda_file_path, encoding="utf-8") as conda_file:
+        conda_env = yaml.safe_load(conda_file) or {}
+    return normalize_conda_env(conda_env, os.path.dirname(conda_file_path))
+
+
+def conda_file_sha256(conda_file_path: str) -> str:
+    """
+    Calculate digest of normalized conda environment file, see normalize_conda_env
+    :param conda_file_path: path to conda environment file
+    :return: hex digest
+    """
+    content = json.dumps(_read_normalized_conda_env(conda_file_path), sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def conda_env_cache_key(conda_file_path: str, prefix: str) -> str:
+    """
+    Build cache key of conda environment: digest of normalized conda file, platform, python version of environment
+    and its location (conda writes it into installed files)
+    :param conda_file_path: path to conda environment file
+    :param prefix: path to conda environment
+    :return: hex digest
+    """
+    content = {
+        "env": _read_normalized_conda_env(conda_file_path),
+        "platform": f"{sys.platform}-{platform.machine()}",
+        "python": _conda_env_python_version(prefix),
+        "prefix": os.path.abspath(prefix),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _conda_env_python(prefix: str) -> str:
+    return os.path.join(prefix, "bin", "python")
+
+
+def write_conda_env_lock(lock_dir: str, conda_file_digest: str, prefix: str) -> None:
+    """
+    Record resolved conda environment: explicit URLs and md5 of conda packages and pip freeze.
+    Packages that pip installed from local files or in editable mode are not recorded,
+    they are not a part of conda file
+    :param lock_dir: directory of lock files
+    :param conda_file_digest: digest of conda file environment is resolved from, see conda_file_sha256
+    :param prefix: path to conda environment
+    """
+    header = f"{LOCK_HEADER_PREFIX}{conda_file_digest}\n"
+
+    _, explicit, _ = io_proc_utils.run("conda", "list", "--explicit", "--md5", "--prefix", prefix,
+                                       stream_output=False)
+    with open(os.path.join(lock_dir, CONDA_LOCK_FILE_NAME), "w", encoding="utf-8") as lock_file:
+        lock_file.write(header + explicit)
+
+    requirements = []
+    if os.path.exists(_conda_env_python(prefix)):
+        _, freeze, _ = io_proc_utils.run(_conda_env_python(prefix), "-m", "pip", "freeze", "--exclude-editable",
+                                         stream_output=False)
+        requirements = [line for line in freeze.splitlines() if line.strip() and " @ file:" not in line]
+    with open(os.path.join(lock_dir, PIP_LOCK_FILE_NAME), "w", encoding="utf-8") as lock_file:
+        lock_file.write(header + "".join(f"{requirement}\n" for requirement in requirements))
 
+    logger.info(f"Conda environment {prefix} is locked in {lock_dir}")
 
-def run_mlflow_wrapper(mlflow_input: Dict[str, Any]) -> str:
+
+def read_conda_env_lock(lock_dir: str, conda_file_digest: str) -> Optional[Tuple[str, str]]:
+    """
+    Find lock files of conda file
+    :param lock_dir: directory of lock files
+    :param conda_file_digest: digest of conda file, see conda_file_sha256
+    :return: paths to conda and pip lock files, None if they are missing or resolved from another conda file
+    """
+    paths = os.path.join(lock_dir, CONDA_LOCK_FILE_NAME), os.path.join(lock_dir, PIP_LOCK_FILE_NAME)
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as lock_file:
+                header = lock_file.readline()
+        except FileNotFoundError:
+            logger.info(f"Lock file {path} is not found")
+            return None
+
+        if header.strip() != f"{LOCK_HEADER_PREFIX}{conda_file_digest}":
+            logger.warning(f"Lock file {path} is outdated, conda file is changed since it was written")
+            return None
+
+    return paths
+
+
+def install_conda_env_lock(lock_dir: str, conda_file_digest: str, prefix: str) -> bool:
     """
-    Prepare parameters and run MLFlow wrapper inside the model conda environment
+    Install locked packages into conda environment. Explicit package list is installed by conda without solving
+    :param lock_dir: directory of lock files
+    :param conda_file_digest: digest of conda file, see conda_file_sha256
+    :param prefix: path to conda environment
+    :return: False if there are no actual lock files
+    """
+    paths = read_conda_env_lock(lock_dir, conda_file_digest)
+    if paths is None:
+        return False
+    conda_lock_path, pip_lock_path = paths
+
+    started_at = time.perf_counter()
+    io_proc_utils.run("conda", "install", "--yes", "--prefix", prefix, "--file", conda_lock_path)
+    with open(pip_lock_path, encoding="utf-8") as lock_file:
+        has_pip_requirements = any(line.strip() and not line.startswith("#") for line in lock_file)
+    if has_pip_requirements:
+        io_proc_utils.run(_conda_env_python(prefix), "-m", "pip", "install", "--no-deps", "-r", pip_lock_path)
+
+    logger.info(f"Conda environment {prefix} is installed from lock files in {lock_dir} "
+                f"in {time.perf_counter() - started_at:.2f} s")
+    return True
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Different filesystems or links are not permitted
+        shutil.copy2(src, dst)
+
+
+def restore_cached_conda_env(cache_dir: str, key: str, prefix: str) -> bool:
+    """
+    Replace conda environment with cached one. Files are hard linked from cache if possible,
+    the same way conda links files from its package cache, so restoring takes seconds
+    :param cache_dir: cache directory
+    :param key: cache key, see conda_env_cache_key
+    :param prefix: path to conda environment
+    :return: False if environment is not cached
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    cached_env = os.path.join(entry_dir, CONDA_ENV_CACHE_ENV_DIR_NAME)
+    if not os.path.isdir(cached_env):
+        logger.info(f"Conda environment cache miss: {key}")
+        return False
+
+    started_at = time.perf_counter()
+    shutil.rmtree(prefix, ignore_errors=True)
+    shutil.copytree(cached_env, prefix, symlinks=True, copy_function=_link_or_copy)
+    # Modification time of entry is its last usage time
+    os.utime(os.path.join(entry_dir, CONDA_ENV_CACHE_ENTRY_FILE_NAME))
+
+    logger.info(f"Conda environment cache hit: {key}. "
+                f"Environment {prefix} is restored in {time.perf_counter() - started_at:.2f} s")
+    return True
+
+
+def store_conda_env(cache_dir: str, key: str, prefix: str, max_size: int) -> None:
+    """
+    Copy conda environment to cache and evict least recently used environments if cache is too big.
+    Environment is copied, not linked, so later changes of environment do not change cache
+    :param cache_dir: cache directory
+    :param key: cache key, see conda_env_cache_key
+    :param prefix: path to conda environment
+    :param max_size: max size of cache in bytes
+    """
+    started_at = time.perf_counter()
+    entry_dir = os.path.join(cache_dir, key)
+    # Entry is prepared aside and renamed, so concurrent trainings never see partial environment
+    temporary_dir = f"{entry_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(temporary_dir, ignore_errors=True)
+
+    shutil.copytree(prefix, os.path.join(temporary_dir, CONDA_ENV_CACHE_ENV_DIR_NAME), symlinks=True)
+    size = _directory_size(temporary_dir)
+    with open(os.path.join(temporary_dir, CONDA_ENV_CACHE_ENTRY_FILE_NAME), "w", encoding="utf-8") as entry_file:
+        json.dump({"prefix": prefix, "size": size}, entry_file)
+
+    try:
+        os.rename(temporary_dir, entry_dir)
+    except OSError:
+        # Environment is already stored by concurrent training
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        return
+
+    logger.info(f"Conda environment {prefix} ({size / 1024 / 1024:.1f} MB) is cached as {key} "
+                f"in {time.perf_counter() - started_at:.2f} s")
+    evict_conda_env_cache(cache_dir, max_size, keep=(key,))
+
+
+def evict_conda_env_cache(cache_dir: str, max_size: int, keep: Collection[str] = ()) -> List[str]:
+    """
+    Remove least recently used environments until size of cache is not greater than <max_size>
+    :param cache_dir: cache directory
+    :param max_size: max size of cache in bytes
+    :param keep: keys of environments that are never evicted
+    :return: keys of evicted environments
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry_path = os.path.join(cache_dir, key, CONDA_ENV_CACHE_ENTRY_FILE_NAME)
+        try:
+            with open(entry_path, encoding="utf-8") as entry_file:
+                size = json.load(entry_file)["size"]
+            entries.append((os.stat(entry_path).st_mtime_ns, key, size))
+        except (OSError, ValueError, KeyError):
+            # Temporary or broken entry
+            continue
+
+    total_size = sum(size for _, _, size in entries)
+    evicted = []
+    for _, key, size in sorted(entries):
+        if total_size <= max_size:
+            break
+        if key in keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total_size -= size
+        evicted.append(key)
+        logger.info(f"Conda environment {key} ({size / 1024 / 1024:.1f} MB) is evicted from cache")
+
+    return evicted
+
+
+def _directory_size(path: str) -> int:
+    size = 0
+    for directory, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(directory, file_name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
+
+
+def request_mlflow_wrapper(socket_path: str, request: Dict[str, Any]) -> MLFlowWrapperOutput:
+    """
+    Send request to MLflow wrapper server, see odahuflow.trainer.helpers.wrapper.wrapper.serve
+    :param socket_path: path to unix socket of server
+    :param request: {"input": <mlflow.projects.run parameters>} or {"shutdown": true}
+    :return: MLFlow output
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        with connection.makefile('rwb') as stream:
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            response = stream.readline()
+
+    if not response:
+        raise ConnectionError('MLflow wrapper server closed connection without response')
+    return MLFlowWrapperOutput(**json.loads(response))
+
+
+class MLFlowWrapperServer:
+    """
+    Long-lived MLflow wrapper inside the model conda environment. Shell start, conda activation
+    and MLflow import are paid once, runs are requested over unix socket
+    """
+
+    def __init__(self, conda_env_name: str = ODAHU_MODEL_CONDA_ENV_NAME):
+        self._directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self._directory, 'wrapper.sock')
+
+        args = _get_conda_command(conda_env_name)
+        # Server replaces shell, so it is the process that is stopped
+        args += [f'exec {shutil.which("odahu-flow-mlflow-wrapper")} --serve {self.socket_path}']
+        command = ' && '.join(args)
+        logger.info(f'Start MLflow wrapper server: {command}')
+        # Own process group, so processes started by conda activation are killed together with server
+        self._process = subprocess.Popen(['bash', '-c', command], start_new_session=True)  # pylint: disable=R1732
+
+        try:
+            self._wait_ready()
+        except Exception:
+            self.close()
+            raise
+
+    def _wait_ready(self):
+        started_at = time.perf_counter()
+        while True:
+            if self._process.poll() is not None:
+                raise ValueError(f'MLflow wrapper server exited with code {self._process.returncode}')
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                    connection.connect(self.socket_path)
+                break
+            except OSError:
+                if time.perf_counter() - started_at > MLFLOW_WRAPPER_SERVER_START_TIMEOUT:
+                    raise ValueError('MLflow wrapper server is not started in time') from None
+                time.sleep(0.1)
+        logger.info(f'MLflow wrapper server is started in {time.perf_counter() - started_at:.2f} s')
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def run(self, mlflow_input: Dict[str, Any]) -> str:
+        """
+        Run MLflow project in wrapper server
+        :param mlflow_input: parameters which will be passed to mlflow.run function
+        :return: MLFlow run ID
+        """
+        output = request_mlflow_wrapper(self.socket_path, {'input': mlflow_input})
+        if output.error:
+            raise ValueError(f'MLflow run failed: {output.error}')
+        return output.run_id
+
+    def close(self):
+        if self._process.poll() is None:
+            try:
+                request_mlflow_wrapper(self.socket_path, {'shutdown': True})
+                self._process.wait(timeout=MLFLOW_WRAPPER_SERVER_STOP_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired):
+                self._kill()
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _kill(self):
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process.wait()
+
+
+_mlflow_wrapper_server: Optional[MLFlowWrapperServer] = None
+# Server failed to start or died, runs are not requested from it anymore
+_mlflow_wrapper_server_failed = False
+_mlflow_wrapper_server_lock = threading.Lock()
+
+
+def get_mlflow_wrapper_server() -> Optional[MLFlowWrapperServer]:
+    """
+    Get MLflow wrapper server of the process, it is started on the first call and stopped on exit.
+    None is returned if server failed to start or died, runs fall back to wrapper subprocesses then
+    """
+    global _mlflow_wrapper_server, _mlflow_wrapper_server_failed  # pylint: disable=W0603
+    with _mlflow_wrapper_server_lock:
+        if _mlflow_wrapper_server_failed:
+            return None
+
+        if _mlflow_wrapper_server is None:
+            try:
+                _mlflow_wrapper_server = MLFlowWrapperServer()
+            except ValueError as error:
+                logger.warning(f'{error}. MLflow runs fall back to wrapper subprocesses')
+                _mlflow_wrapper_server_failed = True
+                return None
+            atexit.register(_mlflow_wrapper_server.close)
+
+        if not _mlflow_wrapper_server.alive:
+            logger.warning('MLflow wrapper server is not running. MLflow runs fall back to wrapper subprocesses')
+            _mlflow_wrapper_server_failed = True
+            return None
+        return _mlflow_wrapper_server
+
+
+def run_mlflow_wrapper(mlflow_input: Dict[str, Any], wrapper_dir: Optional[str] = None) -> str:
+    """
+    Prepare parameters and run MLFlow wrapper inside the model conda environment.
+    Run is requested from wrapper server if ODAHU_MLFLOW_WRAPPER_SERVER is enabled and server is running
     :param mlflow_input: parameters which will be passed to mlflow.run function
+    :param wrapper_dir: directory of wrapper input and output files, current directory is used if not set
     :return: MLFlow run ID
     """
-    with open(MLFLOW_WRAPPER_INPUT_FILE_PATH, 'w', encoding='utf-8') as f:
+    server = get_mlflow_wrapper_server() if MLFLOW_WRAPPER_SERVER_ENABLED else None
+    if server is not None:
+        try:
+            return server.run(mlflow_input)
+        except OSError:
+            if server.alive:
+                raise
+            # Run did not return its ID, so it is started again
+            logger.warning('MLflow wrapper server died during run. Run falls back to wrapper subprocess')
+
+    input_file_path = join(wrapper_dir or '', MLFLOW_WRAPPER_INPUT_FILE_PATH)
+    output_file_path = join(wrapper_dir or '', MLFLOW_WRAPPER_OUTPUT_FILE_PATH)
+
+    with open(input_file_path, 'w', encoding='utf-8') as f:
         json.dump(mlflow_input, f)
 
     sep = ' && '
     args = _get_conda_command(ODAHU_MODEL_CONDA_ENV_NAME)
     args += [f'{shutil.which("odahu-flow-mlflow-wrapper")} '
-             f'--input {MLFLOW_WRAPPER_INPUT_FILE_PATH} '
-             f'--output {MLFLOW_WRAPPER_OUTPUT_FILE_PATH}']
+             f'--input {input_file_path} '
+             f'--output {output_file_path}']
     command = sep.join(args)
 
     logger.info(f'Run command {command}')
 
     io_proc_utils.run('bash', '-c', command)
 
-    with open(MLFLOW_WRAPPER_OUTPUT_FILE_PATH, encoding='utf-8') as f:
+    with open(output_file_path, encoding='utf-8') as f:
         return MLFlowWrapperOutput(**json.load(f)).run_id
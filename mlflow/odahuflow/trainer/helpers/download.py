@@ -0,0 +1,283 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import base64
+import concurrent.futures
+import http.client
+import logging
+import os
+import posixpath
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib import parse
+
+from mlflow.store.artifact.artifact_repository_registry import get_artifact_repository
+
+# Large files are downloaded by parallel range requests of this size
+CHUNK_SIZE = 16 * 1024 * 1024
+# Size of data that is read from connection at once
+READ_BLOCK_SIZE = 1024 * 1024
+# Failed range request is resumed from the last received byte up to this number of times
+RETRIES = 5
+RETRY_DELAY = 0.5
+TIMEOUT = 60
+
+HTTP_SCHEMES = ('http', 'https')
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteFile(NamedTuple):
+    # Path relative to artifact root, separated by /
+    path: str
+    size: Optional[int]
+
+
+class DownloadStats(NamedTuple):
+    files: int
+    bytes: int
+    seconds: float
+
+
+def find_remote_directories(artifact_uri: str, marker: str, threads: Optional[int] = None) -> List[str]:
+    """
+    Find artifact directories that contain <marker> file. Directories below the found ones are not listed.
+    Directories are listed on a thread pool
+
+    :param artifact_uri: URI of artifact root
+    :param marker: name of file
+    :param threads: number of listing threads
+    :return: sorted paths of found directories relative to artifact root
+    """
+    found, _ = _walk(artifact_uri, '', threads, marker)
+    return sorted(found)
+
+
+def download_artifacts(artifact_uri: str, remote_path: str, target: str, threads: Optional[int] = None,
+                       chunk_size: int = CHUNK_SIZE) -> DownloadStats:
+    """
+    Download artifact file or directory. Files are downloaded concurrently,
+    files of http(s) artifact stores are split into range requests that are resumed on failure.
+    If server does not support range requests, every file is downloaded by a single request
+
+    :param artifact_uri: URI of artifact root
+    :param remote_path: path of file or directory relative to artifact root, whole root if empty
+    :param target: local directory, artifacts keep their relative paths in it
+    :param threads: number of downloading threads
+    :param chunk_size: size of range request
+    :return: downloading statistics
+    """
+    started_at = time.perf_counter()
+
+    _, files = _walk(artifact_uri, remote_path, threads)
+    if not files and remote_path:
+        # Path of file is listed as an empty directory
+        files = [RemoteFile(path=remote_path, size=None)]
+
+    repository = get_artifact_repository(artifact_uri)
+    http_store = parse.urlparse(repository.artifact_uri).scheme in HTTP_SCHEMES
+    # Support of range requests is checked once, by the first file that is split into chunks
+    ranged: Optional[bool] = None
+
+    tasks = []
+    for remote_file in files:
+        local_path = _local_path(target, remote_file.path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        if not http_store:
+            tasks.append((_download_with_repository, (repository, remote_file, target)))
+            continue
+
+        url = f'{repository.artifact_uri.rstrip("/")}/{parse.quote(remote_file.path)}'
+        size = remote_file.size if remote_file.size is not None else _content_length(url)
+        with open(local_path, 'wb') as stream:
+            stream.truncate(size)
+
+        if size > chunk_size and ranged is None:
+            ranged = _supports_ranges(url)
+            if not ranged:
+                logger.warning(f'Artifact store of {artifact_uri} does not support range requests, '
+                               f'files are downloaded by single requests')
+        if size <= chunk_size or not ranged:
+            tasks.append((_download_range, (url, local_path, 0, size, False)))
+            continue
+        for start in range(0, size, chunk_size):
+            tasks.append((_download_range, (url, local_path, start, min(start + chunk_size, size))))
+
+    with concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix='odahuflow-download') as executor:
+        futures = [executor.submit(function, *args) for function, args in tasks]
+        downloaded_bytes = sum(future.result() for future in futures)
+
+    stats = DownloadStats(files=len(files), bytes=downloaded_bytes, seconds=time.perf_counter() - started_at)
+    logger.info(f'Downloaded {stats.files} files ({stats.bytes / 1024 / 1024:.1f} MB) of {artifact_uri}/{remote_path} '
+                f'in {stats.seconds:.2f} s ({stats.bytes / 1024 / 1024 / max(stats.seconds, 1e-9):.1f} MB/s)')
+    return stats
+
+
+def _local_path(target: str, remote_path: str) -> str:
+    """
+    Get local path of artifact. Artifact path must not point outside of target directory
+
+    :param target: local directory
+    :param remote_path: path of artifact relative to artifact root, separated by /
+    :return: path in target directory
+    """
+    parts = remote_path.split('/')
+    if posixpath.isabs(remote_path) or '..' in parts or any(os.path.isabs(part) or os.sep in part for part in parts):
+        raise ValueError(f'Artifact path {remote_path} points outside of target directory')
+    return os.path.join(target, *parts)
+
+
+def _walk(artifact_uri: str, root: str, threads: Optional[int],
+          marker: Optional[str] = None) -> Tuple[List[str], List[RemoteFile]]:
+    """
+    List artifact directory recursively
+
+    :param artifact_uri: URI of artifact root
+    :param root: path of directory relative to artifact root
+    :param threads: number of listing threads
+    :param marker: directories with this file are not listed deeper
+    :return: directories with <marker> file and all listed files
+    """
+    repository = get_artifact_repository(artifact_uri)
+    found = []
+    files = []
+
+    def scan(directory: str) -> Tuple[bool, List[str], List[RemoteFile]]:
+        file_infos = repository.list_artifacts(directory or None)
+        directory_files = [RemoteFile(path=info.path, size=info.file_size) for info in file_infos if not info.is_dir]
+        if marker and any(posixpath.basename(remote_file.path) == marker for remote_file in directory_files):
+            return True, [], directory_files
+        return False, [info.path for info in file_infos if info.is_dir], directory_files
+
+    with concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix='odahuflow-list') as executor:
+        pending = {executor.submit(scan, root): root}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                is_found, subdirectories, directory_files = future.result()
+                if is_found:
+                    found.append(directory)
+                files.extend(directory_files)
+                for subdirectory in subdirectories:
+                    pending[executor.submit(scan, subdirectory)] = subdirectory
+
+    return found, files
+
+
+def _download_with_repository(repository, remote_file: RemoteFile, target: str) -> int:
+    local_path = repository.download_artifacts(remote_file.path, target)
+    return os.path.getsize(local_path)
+
+
+def _auth_headers() -> Dict[str, str]:
+    """
+    Authorization of MLflow tracking server
+    """
+    token = os.environ.get('MLFLOW_TRACKING_TOKEN')
+    if token:
+        return {'Authorization': f'Bearer {token}'}
+
+    username = os.environ.get('MLFLOW_TRACKING_USERNAME')
+    password = os.environ.get('MLFLOW_TRACKING_PASSWORD')
+    if username and password:
+        credentials = base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('ascii')
+        return {'Authorization': f'Basic {credentials}'}
+
+    return {}
+
+
+def _content_length(url: str) -> int:
+    request = urllib.request.Request(url, headers=_auth_headers(), method='HEAD')
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        length = response.headers.get('Content-Length')
+    if length is None:
+        raise ValueError(f'Size of {url} is unknown')
+    return int(length)
+
+
+def _supports_ranges(url: str) -> bool:
+    """
+    Check that server answers range request with partial content
+
+    :param url: URL of file
+    :return: whether range requests are supported
+    """
+    request = urllib.request.Request(url, headers={**_auth_headers(), 'Range': 'bytes=0-0'})
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        return response.status == http.HTTPStatus.PARTIAL_CONTENT
+
+
+def _download_range(url: str, path: str, start: int, end: int, ranged: bool = True) -> int:
+    """
+    Download bytes [start, end) of file. Failed request is resumed from the last received byte
+
+    :param url: URL of file
+    :param path: local file of full size
+    :param start: first byte
+    :param end: byte after the last one
+    :param ranged: request range of bytes, otherwise whole file is requested and received bytes are skipped on resume
+    :return: number of downloaded bytes
+    """
+    position = start
+    failures = 0
+
+    while position < end:
+        headers = _auth_headers()
+        if ranged:
+            headers['Range'] = f'bytes={position}-{end - 1}'
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=TIMEOUT) as response, open(path, 'r+b') as stream:
+                if response.status != http.HTTPStatus.PARTIAL_CONTENT:
+                    # Range is not supported, whole file is sent
+                    _skip(response, position)
+
+                stream.seek(position)
+                while position < end:
+                    block = response.read(min(READ_BLOCK_SIZE, end - position))
+                    if not block:
+                        raise ConnectionError(f'Connection is closed by server at {position} byte')
+                    stream.write(block)
+                    position += len(block)
+        except urllib.error.HTTPError as error:
+            if error.code < 500 and error.code != http.HTTPStatus.TOO_MANY_REQUESTS:
+                raise
+            failures = _retry(url, position, failures, error)
+        except (OSError, http.client.HTTPException) as error:
+            failures = _retry(url, position, failures, error)
+
+    return end - start
+
+
+def _skip(response, size: int) -> None:
+    while size:
+        block = response.read(min(READ_BLOCK_SIZE, size))
+        if not block:
+            raise ConnectionError('Connection is closed by server')
+        size -= len(block)
+
+
+def _retry(url: str, position: int, failures: int, error: Exception) -> int:
+    failures += 1
+    if failures > RETRIES:
+        raise error
+
+    logger.warning(f'Downloading of {url} failed at {position} byte: {error}. Retry {failures}/{RETRIES}')
+    time.sleep(RETRY_DELAY * 2 ** (failures - 1))
+    return failures
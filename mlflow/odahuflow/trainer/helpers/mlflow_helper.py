@@ -16,16 +16,20 @@
 #
 import argparse
 import contextlib
+import functools
 import json
 import logging
 import os
 import os.path
+import posixpath
 import shutil
 import sys
-import tarfile
-from typing import Optional
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
 from urllib import parse
 
+import pandas as pd
 import yaml
 from odahuflow.sdk.gppi.executor import GPPITrainedModelBinary
 from odahuflow.sdk.gppi.models import OdahuflowProjectManifest, OdahuflowProjectManifestBinaries, \
@@ -33,8 +37,14 @@ from odahuflow.sdk.gppi.models import OdahuflowProjectManifest, OdahuflowProject
 from odahuflow.sdk.models import K8sTrainer, ModelIdentity
 from odahuflow.sdk.models import ModelTraining
 
+from odahuflow.trainer.helpers.archive import archive_directory, ArchiveReader, ArchiveStats, ArchiveWriter, \
+    ARCHIVE_DIGEST_SUFFIX, ARCHIVE_EXTENSIONS, CHECKSUMS_FILE_NAME, COMPRESSIONS, GZIP_COMPRESSION
 from odahuflow.trainer.helpers.conda import run_mlflow_wrapper, update_model_conda_env
-from odahuflow.trainer.helpers.fs import copytree
+from odahuflow.trainer.helpers.download import download_artifacts, find_remote_directories
+from odahuflow.trainer.helpers.fs import copytree, find_directories, SYNC_MANIFEST_FILE_NAME
+from odahuflow.trainer.helpers.stages import run_stages
+from odahuflow.trainer.helpers.templates.entrypoint import build_schema, MODEL_INPUT_SAMPLE_FILE_NAME, \
+    MODEL_OUTPUT_SAMPLE_FILE_NAME, MODEL_SCHEMA_FILE_NAME
 
 import mlflow
 import mlflow.models
@@ -46,6 +56,25 @@ from mlflow.tracking import set_tracking_uri, get_tracking_uri, MlflowClient
 MODEL_SUBFOLDER = 'odahuflow_model'
 ODAHUFLOW_PROJECT_DESCRIPTION = 'odahuflow.project.yaml'
 ENTRYPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'entrypoint.py')
+MLMODEL_FILE_NAME = 'MLmodel'
+
+# GPPI validation levels, each level includes the previous ones
+MANIFEST_VALIDATION = 'manifest'
+SCHEMA_VALIDATION = 'schema'
+FULL_VALIDATION = 'full'
+VALIDATION_LEVELS = (MANIFEST_VALIDATION, SCHEMA_VALIDATION, FULL_VALIDATION)
+
+# Independent stages of training setup, see prepare_training
+EXPERIMENT_STAGE = 'experiment lookup'
+CONDA_STAGE = 'conda update'
+
+
+class DiscoveredModel(NamedTuple):
+    # Path to model directory
+    path: str
+    # Path relative to the searched directory
+    relative_path: str
+    model: mlflow.models.Model
 
 
 
@@ -74,9 +103,11 @@ def parse_model_training_entity(source_file: str) -> K8sTrainer:
     return K8sTrainer.from_dict(mt)
 
 
-def save_models(mlflow_run_id: str, model_training: ModelTraining, target_directory: str) -> None:
+def save_models(mlflow_run_id: str, model_training: ModelTraining, target_directory: str,
+                model_path: Optional[str] = None) -> None:
     """
     Save models after run
+    :param model_path: path of model relative to artifacts directory, required if run logged several models
     """
     # Using internal API for getting store and artifacts location
     store = mlflow.tracking._get_store()
@@ -84,18 +115,91 @@ def save_models(mlflow_run_id: str, model_training: ModelTraining, target_direct
     logging.info(f"Artifacts location detected. Using store {store}")
 
     parsed_url = parse.urlparse(artifact_uri)
-    if parsed_url.scheme and parsed_url.scheme != 'file':
-        raise ValueError(f'Unsupported scheme of url: {parsed_url}')
-    artifacts_path = parsed_url.path
+    if not parsed_url.scheme or parsed_url.scheme == 'file':
+        logging.info(f"Analyzing directory {artifact_uri} for models")
+        model = select_model(discover_pyfunc_models(parsed_url.path), model_path)
 
-    logging.info(f"Analyzing directory {artifact_uri} for models")
-    artifacts_abs_paths = map(lambda path: os.path.join(artifacts_path, path), os.listdir(artifacts_path))
-    found_models = list(filter(lambda path: load_pyfunc_model(path, none_on_failure=True), artifacts_abs_paths))
+        mlflow_to_gppi(model_training.spec.model, model.path, target_directory, mlflow_run_id,
+                       mlflow_model=model.model)
+        return
 
-    if len(found_models) != 1:
-        raise ValueError(f'Expected to find exactly 1 model, found {len(found_models)}')
+    with tempfile.TemporaryDirectory() as download_directory:
+        logging.info(f"Analyzing remote artifacts {artifact_uri} for models")
+        model = select_model(discover_remote_pyfunc_models(artifact_uri, download_directory), model_path)
 
-    mlflow_to_gppi(model_training.spec.model, found_models[0], target_directory, mlflow_run_id)
+        # Only the selected model is downloaded
+        download_artifacts(artifact_uri, model.relative_path, download_directory)
+
+        mlflow_to_gppi(model_training.spec.model, model.path, target_directory, mlflow_run_id,
+                       mlflow_model=model.model)
+
+
+def discover_pyfunc_models(artifacts_path: str, threads: int = 1) -> List[DiscoveredModel]:
+    """Finds MLflow models with pyfunc flavor at any depth of directory.
+    Only directories with MLmodel file are loaded
+    :param artifacts_path: directory to search in
+    :param threads: number of threads that list directories, it speeds up network filesystems
+    :return: found models
+    """
+    models = []
+    for path in find_directories(artifacts_path, MLMODEL_FILE_NAME, threads):
+        mlflow_model = load_pyfunc_model(path, none_on_failure=True)
+        relative_path = os.path.relpath(path, artifacts_path)
+        if mlflow_model is None:
+            logging.info(f"{relative_path} is not a MLflow model with {mlflow.pyfunc.FLAVOR_NAME} flavor, skipping")
+            continue
+
+        logging.info(f"Found model {relative_path} with flavors: {', '.join(mlflow_model.flavors)}")
+        models.append(DiscoveredModel(path=path, relative_path=relative_path, model=mlflow_model))
+
+    return models
+
+
+def discover_remote_pyfunc_models(artifact_uri: str, download_directory: str,
+                                  threads: Optional[int] = None) -> List[DiscoveredModel]:
+    """Finds MLflow models with pyfunc flavor in remote artifact store.
+    Only MLmodel files are downloaded, other files of models are not
+    :param artifact_uri: URI of artifacts root
+    :param download_directory: local directory where artifacts are downloaded keeping their relative paths
+    :param threads: number of threads that list and download artifacts
+    :return: found models, their paths are local paths in <download_directory>
+    """
+    models = []
+    for relative_path in find_remote_directories(artifact_uri, MLMODEL_FILE_NAME, threads):
+        download_artifacts(artifact_uri, posixpath.join(relative_path, MLMODEL_FILE_NAME), download_directory,
+                           threads)
+        path = os.path.join(download_directory, *relative_path.split('/'))
+
+        mlflow_model = load_pyfunc_model(path, none_on_failure=True)
+        if mlflow_model is None:
+            logging.info(f"{relative_path} is not a MLflow model with {mlflow.pyfunc.FLAVOR_NAME} flavor, skipping")
+            continue
+
+        logging.info(f"Found model {relative_path} with flavors: {', '.join(mlflow_model.flavors)}")
+        models.append(DiscoveredModel(path=path, relative_path=relative_path, model=mlflow_model))
+
+    return models
+
+
+def select_model(models: List[DiscoveredModel], model_path: Optional[str] = None) -> DiscoveredModel:
+    """Selects model to save
+    :param models: discovered models
+    :param model_path: path of model relative to artifacts directory, the only model is selected if not set
+    :return: selected model
+    """
+    found_paths = [model.relative_path for model in models]
+
+    if model_path is not None:
+        for model in models:
+            if model.relative_path == os.path.normpath(model_path):
+                return model
+        raise ValueError(f'Model {model_path} is not found. Found models: {found_paths}')
+
+    if len(models) != 1:
+        raise ValueError(f'Expected to find exactly 1 model, found {len(models)}: {found_paths}. '
+                         f'Select one of them by its path')
+
+    return models[0]
 
 
 def load_pyfunc_model(path: str, none_on_failure=False) -> Optional[mlflow.models.Model]:
@@ -117,17 +221,22 @@ def load_pyfunc_model(path: str, none_on_failure=False) -> Optional[mlflow.model
     return mlflow_model
 
 
-def mlflow_to_gppi(model_meta: ModelIdentity, mlflow_model_path: str, gppi_model_path: str, mlflow_run_id: str):
+def mlflow_to_gppi(model_meta: ModelIdentity, mlflow_model_path: str, gppi_model_path: str, mlflow_run_id: str,
+                   *, incremental: bool = False, validation: str = FULL_VALIDATION,
+                   mlflow_model: Optional[mlflow.models.Model] = None) -> Dict[str, float]:
     """Wraps an MLFlow model with a GPPI interface
     :param model_meta: container for model name and version
     :param mlflow_model_path: path to MLFlow model
-    :param gppi_model_path: path to target GPPI directory, should be empty
+    :param gppi_model_path: path to target GPPI directory, should be empty unless conversion is incremental
     :param mlflow_run_id: mlflow run id for model
+    :param incremental: GPPI directory keeps result of previous conversion,
+                        only files of MLflow model that are changed since then are copied
+    :param validation: validation level of result GPPI: manifest, schema or full
+    :param mlflow_model: already loaded metadata of MLflow model
+    :return: durations of validation levels
     """
-    try:
-        mlflow_model = load_pyfunc_model(mlflow_model_path)
-    except Exception as load_exception:
-        raise ValueError(f"{mlflow_model_path} is not a MLflow model: {load_exception}") from load_exception
+    if mlflow_model is None:
+        mlflow_model = _load_mlflow_model(mlflow_model_path)
 
     mlflow_target_directory = os.path.join(gppi_model_path, MODEL_SUBFOLDER)
 
@@ -135,8 +244,96 @@ def mlflow_to_gppi(model_meta: ModelIdentity, mlflow_model_path: str, gppi_model
 
     if not os.path.exists(mlflow_target_directory):
         os.makedirs(mlflow_target_directory)
-    copytree(mlflow_model_path, mlflow_target_directory)
+    sync_manifest = os.path.join(gppi_model_path, SYNC_MANIFEST_FILE_NAME) if incremental else None
+    copytree(mlflow_model_path, mlflow_target_directory, manifest=sync_manifest)
+
+    manifest = _build_manifest(model_meta, mlflow_model, mlflow_run_id)
 
+    entrypoint_target = os.path.join(mlflow_target_directory, 'entrypoint.py')
+    shutil.copyfile(ENTRYPOINT, entrypoint_target)
+
+    write_schema_file(mlflow_target_directory)
+
+    project_file_path = os.path.join(gppi_model_path, ODAHUFLOW_PROJECT_DESCRIPTION)
+
+    with open(project_file_path, 'w', encoding='utf-8') as proj_stream:
+        yaml.dump(manifest.dict(), proj_stream)
+
+    logging.info("GPPI stored. Starting GPPI validation")
+    return validate_gppi(gppi_model_path, mlflow_model, validation)
+
+
+def mlflow_to_gppi_archive(model_meta: ModelIdentity, mlflow_model_path: str, archive_path: str, mlflow_run_id: str,
+                           *, compression: str = GZIP_COMPRESSION, level: Optional[int] = None,
+                           threads: Optional[int] = None, incremental: bool = False, index: bool = False,
+                           checksums: bool = True, validation: str = SCHEMA_VALIDATION) -> ArchiveStats:
+    """Wraps an MLFlow model with a GPPI interface and writes it straight into archive,
+    without intermediate GPPI directory
+    :param model_meta: container for model name and version
+    :param mlflow_model_path: path to MLFlow model
+    :param archive_path: path to target GPPI archive
+    :param mlflow_run_id: mlflow run id for model
+    :param compression: compression of archive
+    :param level: compression level
+    :param threads: number of compression threads
+    :param incremental: reuse compressed files of previous archive that are not changed
+    :param index: write index of archive entries, see validate_gppi_archive
+    :param checksums: write digests of files and archive while archiving, see verify_archive
+    :param validation: validation level of result GPPI. Model is not unpacked, so full validation is not possible.
+                       GPPI is validated before archive is finalized, so invalid GPPI leaves no archive
+    :return: archiving statistics
+    """
+    if validation == FULL_VALIDATION:
+        logging.warning(f'Streamed GPPI can not be validated by loading model, '
+                        f'{SCHEMA_VALIDATION} validation is used instead')
+        validation = SCHEMA_VALIDATION
+
+    mlflow_model = _load_mlflow_model(mlflow_model_path)
+    manifest = _build_manifest(model_meta, mlflow_model, mlflow_run_id)
+    manifest_content = yaml.dump(manifest.dict()).encode('utf-8')
+
+    logging.info(f"Streaming MLflow model from {mlflow_model_path} to {archive_path}")
+
+    with ArchiveWriter(archive_path, compression, level, threads, incremental=incremental, index=index,
+                       checksums=checksums) as archive:
+        archive.add_file(mlflow_model_path, MODEL_SUBFOLDER)
+        archive.add_tree(mlflow_model_path, MODEL_SUBFOLDER)
+        archive.add_file(ENTRYPOINT, os.path.join(MODEL_SUBFOLDER, 'entrypoint.py'))
+
+        schema = build_schema_file(mlflow_model_path)
+        if schema is not None:
+            archive.add_bytes(os.path.join(MODEL_SUBFOLDER, MODEL_SCHEMA_FILE_NAME),
+                              json.dumps(schema, default=str).encode('utf-8'))
+
+        archive.add_bytes(ODAHUFLOW_PROJECT_DESCRIPTION, manifest_content)
+
+        # Failed validation aborts archive, so neither archive nor its index and digest are left
+        logging.info("GPPI entries are archived. Starting GPPI validation")
+        with _timed_validation(MANIFEST_VALIDATION):
+            validate_gppi_entries(archive.names, manifest_content)
+        if validation == SCHEMA_VALIDATION:
+            with _timed_validation(SCHEMA_VALIDATION):
+                validate_gppi_schema(mlflow_model, schema)
+        logging.info("GPPI is validated. OK")
+
+    return archive.close()
+
+
+def _load_mlflow_model(mlflow_model_path: str) -> mlflow.models.Model:
+    try:
+        return load_pyfunc_model(mlflow_model_path)
+    except Exception as load_exception:
+        raise ValueError(f"{mlflow_model_path} is not a MLflow model: {load_exception}") from load_exception
+
+
+def _build_manifest(model_meta: ModelIdentity, mlflow_model: mlflow.models.Model,
+                    mlflow_run_id: str) -> OdahuflowProjectManifest:
+    """Builds GPPI manifest for MLflow model
+    :param model_meta: container for model name and version
+    :param mlflow_model: MLflow model metadata
+    :param mlflow_run_id: mlflow run id for model
+    :return: GPPI manifest
+    """
     py_flavor = mlflow_model.flavors[mlflow.pyfunc.FLAVOR_NAME]
 
     env = py_flavor.get('env')
@@ -147,12 +344,7 @@ def mlflow_to_gppi(model_meta: ModelIdentity, mlflow_model_path: str, gppi_model
     conda_path = os.path.join(MODEL_SUBFOLDER, env)
     logging.info(f'Conda env located in {conda_path}')
 
-    entrypoint_target = os.path.join(mlflow_target_directory, 'entrypoint.py')
-    shutil.copyfile(ENTRYPOINT, entrypoint_target)
-
-    project_file_path = os.path.join(gppi_model_path, ODAHUFLOW_PROJECT_DESCRIPTION)
-
-    manifest = OdahuflowProjectManifest(
+    return OdahuflowProjectManifest(
         odahuflowVersion='1.0',
         binaries=OdahuflowProjectManifestBinaries(
             type='python',
@@ -174,13 +366,194 @@ def mlflow_to_gppi(model_meta: ModelIdentity, mlflow_model_path: str, gppi_model
         )
     )
 
-    with open(project_file_path, 'w', encoding='utf-8') as proj_stream:
-        yaml.dump(manifest.dict(), proj_stream)
 
-    logging.info("GPPI stored. Starting GPPI validation")
-    mb = GPPITrainedModelBinary(gppi_model_path)
-    mb.self_check()
+def validate_gppi(gppi_model_path: str, mlflow_model: mlflow.models.Model,
+                  validation: str = FULL_VALIDATION) -> Dict[str, float]:
+    """Validates GPPI directory. Levels are cumulative:
+    manifest - manifest is parsed and files it refers to exist,
+    schema - schema of samples matches signature of already loaded MLflow model metadata,
+    full - model is loaded in its conda environment and predicts input sample
+    :param gppi_model_path: path to GPPI directory
+    :param mlflow_model: MLflow model metadata
+    :param validation: validation level
+    :return: durations of passed validation levels
+    """
+    if validation not in VALIDATION_LEVELS:
+        raise ValueError(f'Unknown validation level {validation}. Supported levels: {VALIDATION_LEVELS}')
+    levels = VALIDATION_LEVELS[:VALIDATION_LEVELS.index(validation) + 1]
+    timings = {}
+
+    with _timed_validation(MANIFEST_VALIDATION, timings):
+        with open(os.path.join(gppi_model_path, ODAHUFLOW_PROJECT_DESCRIPTION), 'rb') as manifest_stream:
+            manifest_content = manifest_stream.read()
+        entries = [os.path.relpath(os.path.join(root, name), gppi_model_path)
+                   for root, dirs, files in os.walk(gppi_model_path) for name in dirs + files]
+        validate_gppi_entries(entries, manifest_content)
+
+    if SCHEMA_VALIDATION in levels:
+        with _timed_validation(SCHEMA_VALIDATION, timings):
+            schema_path = os.path.join(gppi_model_path, MODEL_SUBFOLDER, MODEL_SCHEMA_FILE_NAME)
+            schema = None
+            if os.path.exists(schema_path):
+                with open(schema_path, encoding='utf-8') as schema_stream:
+                    schema = json.load(schema_stream)
+            validate_gppi_schema(mlflow_model, schema)
+
+    if FULL_VALIDATION in levels:
+        with _timed_validation(FULL_VALIDATION, timings):
+            GPPITrainedModelBinary(gppi_model_path).self_check()
+
     logging.info("GPPI is validated. OK")
+    return timings
+
+
+def validate_gppi_archive(archive_path: str, validation: str = SCHEMA_VALIDATION) -> Dict[str, float]:
+    """Validates indexed GPPI archive. Only manifest, MLmodel and schema entries are decompressed
+    :param archive_path: path to archive written with index
+    :param validation: manifest or schema, model is not unpacked so full validation is not possible
+    :return: durations of passed validation levels
+    """
+    if validation not in (MANIFEST_VALIDATION, SCHEMA_VALIDATION):
+        raise ValueError(f'Archive can be validated on {MANIFEST_VALIDATION} or {SCHEMA_VALIDATION} level only')
+    timings = {}
+
+    with ArchiveReader(archive_path) as archive:
+        names = [member.name for member in archive.members()]
+
+        with _timed_validation(MANIFEST_VALIDATION, timings):
+            validate_gppi_entries(names, archive.read(ODAHUFLOW_PROJECT_DESCRIPTION))
+
+        if validation == SCHEMA_VALIDATION:
+            with _timed_validation(SCHEMA_VALIDATION, timings):
+                mlflow_model = mlflow.models.Model.from_dict(
+                    yaml.safe_load(archive.read(os.path.join(MODEL_SUBFOLDER, MLMODEL_FILE_NAME)))
+                )
+                schema_name = os.path.join(MODEL_SUBFOLDER, MODEL_SCHEMA_FILE_NAME)
+                schema = json.loads(archive.read(schema_name)) if schema_name in names else None
+                validate_gppi_schema(mlflow_model, schema)
+
+    return timings
+
+
+@contextlib.contextmanager
+def _timed_validation(level: str, timings: Optional[Dict[str, float]] = None):
+    started_at = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - started_at
+    logging.info(f'GPPI {level} validation passed in {seconds:.2f} s')
+    if timings is not None:
+        timings[level] = seconds
+
+
+def validate_gppi_schema(mlflow_model: mlflow.models.Model, schema: Optional[Dict[str, Any]]) -> None:
+    """Validates schema of model samples without loading model: samples must have uniquely named columns
+    and input sample must have all inputs of MLflow model signature
+    :param mlflow_model: MLflow model metadata
+    :param schema: schema of samples, see build_schema_file
+    :raises ValueError: if schema is not valid
+    """
+    if schema is None:
+        logging.info('Model samples are not found, schema is not validated')
+        return
+
+    for sample in ('input', 'output'):
+        columns = schema.get(sample)
+        if columns is None:
+            continue
+
+        names = [str(column['name']) for column in columns]
+        if not names:
+            raise ValueError(f'GPPI is not valid, {sample} sample has no columns')
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f'GPPI is not valid, {sample} sample has duplicated columns: {duplicates}')
+
+    signature = getattr(mlflow_model, 'signature', None)
+    if signature is None or schema.get('input') is None:
+        return
+
+    # Names of inputs are called column names before MLflow 1.14
+    inputs = signature.inputs
+    has_input_names = getattr(inputs, 'has_input_names', None) or inputs.has_column_names
+    input_names = getattr(inputs, 'input_names', None) or inputs.column_names
+    if not has_input_names():
+        return
+
+    sample_names = {str(column['name']) for column in schema['input']}
+    missing = [name for name in input_names() if str(name) not in sample_names]
+    if missing:
+        raise ValueError(f'GPPI is not valid, input sample misses columns of model signature: {missing}')
+
+
+def validate_gppi_entries(entries: Iterable[str], manifest_content: bytes) -> None:
+    """Validates GPPI layout without unpacking it: manifest is parsed
+    and files it refers to are checked against the list of GPPI entries
+    :param entries: relative paths of all GPPI files
+    :param manifest_content: content of GPPI manifest
+    :raises ValueError: if GPPI is not valid
+    """
+    try:
+        manifest = OdahuflowProjectManifest(**yaml.safe_load(manifest_content))
+    except Exception as manifest_exception:
+        raise ValueError(f'GPPI manifest is in incorrect format: {manifest_exception}') from manifest_exception
+
+    entries = {os.path.normpath(entry) for entry in entries}
+    required_entries = [
+        ODAHUFLOW_PROJECT_DESCRIPTION,
+        os.path.join(manifest.model.workDir, f'{manifest.model.entrypoint}.py'),
+        os.path.join(manifest.model.workDir, mlflow.models.model.MLMODEL_FILE_NAME),
+        manifest.binaries.conda_path,
+    ]
+
+    missing_entries = [entry for entry in required_entries if os.path.normpath(entry) not in entries]
+    if missing_entries:
+        raise ValueError(f'GPPI is not valid, missing files: {missing_entries}')
+
+
+def write_schema_file(model_path: str) -> None:
+    """
+    Precompute schema of model's input and output samples, so entrypoint does not unpickle samples on start
+    :param model_path: path to model directory with samples
+    """
+    schema = build_schema_file(model_path)
+    schema_path = os.path.join(model_path, MODEL_SCHEMA_FILE_NAME)
+    if schema is None:
+        # Schema of previous incremental conversion must not outlive samples
+        if os.path.exists(schema_path):
+            logging.info(f'Model samples are not found, removing outdated schema {schema_path}')
+            os.unlink(schema_path)
+        return
+
+    logging.info(f'Writing schema of model samples to {schema_path}')
+    with open(schema_path, 'w', encoding='utf-8') as schema_stream:
+        json.dump(schema, schema_stream, default=str)
+
+
+def build_schema_file(model_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Build content of schema file from model's input and output samples
+    :param model_path: path to model directory with samples
+    :return: schema or None if samples are not found or can not be loaded
+    """
+    samples = {}
+    for sample_file_name in (MODEL_INPUT_SAMPLE_FILE_NAME, MODEL_OUTPUT_SAMPLE_FILE_NAME):
+        sample_path = os.path.join(model_path, sample_file_name)
+        if not os.path.exists(sample_path):
+            samples[sample_file_name] = None
+            continue
+
+        try:
+            samples[sample_file_name] = pd.read_pickle(sample_path)
+        except Exception as load_exception:
+            logging.warning(f'Can not load sample {sample_path}: {load_exception}. '
+                            f'Schema file is not created, entrypoint will load samples on start')
+            return None
+
+    if all(sample is None for sample in samples.values()):
+        logging.info('Model samples are not found. Schema file is not created')
+        return None
+
+    return build_schema(samples[MODEL_INPUT_SAMPLE_FILE_NAME], samples[MODEL_OUTPUT_SAMPLE_FILE_NAME])
 
 
 def get_or_create_experiment(experiment_name, artifact_location=None) -> str:
@@ -203,12 +576,39 @@ def get_or_create_experiment(experiment_name, artifact_location=None) -> str:
     return experiment_id
 
 
-def train_models(model_training: ModelTraining, experiment_id: str) -> str:
+def prepare_training(model_training: ModelTraining, artifact_location: Optional[str] = None,
+                     force_solve: bool = False, stages: Optional[Dict[str, Callable[[], Any]]] = None) -> str:
+    """
+    Look up MLflow experiment and update model conda environment concurrently, see run_stages
+    :param model_training: model training
+    :param artifact_location: artifact location of experiment if it is created
+    :param force_solve: solve conda dependencies again even if they are cached or locked
+    :param stages: additional independent stages that run together with experiment lookup and conda update
+    :return: experiment id
+    """
+    results = run_stages({
+        EXPERIMENT_STAGE: functools.partial(get_or_create_experiment, model_training.spec.model.name,
+                                            artifact_location=artifact_location),
+        CONDA_STAGE: functools.partial(update_model_conda_env, model_training, force_solve=force_solve),
+        **(stages or {}),
+    })
+    return results[EXPERIMENT_STAGE]
+
+
+def train_models(model_training: ModelTraining, experiment_id: str,
+                 hyper_parameters: Optional[Dict[str, str]] = None, wrapper_dir: Optional[str] = None,
+                 work_dir: Optional[str] = None) -> str:
     """
-    Start MLfLow run
+    Start MLfLow run. Model conda environment must be updated beforehand, see prepare_training
+    :param hyper_parameters: parameters of run, hyper parameters of model training are used if not set
+    :param wrapper_dir: directory of wrapper input and output files, parallel runs must have different ones
+    :param work_dir: MLflow project directory, work directory of model training is used if not set.
+                     Parallel runs must have different ones, otherwise they overwrite files of each other
     """
-    logging.info('Downloading conda dependencies')
-    update_model_conda_env(model_training)
+    if hyper_parameters is None:
+        hyper_parameters = model_training.spec.hyper_parameters
+    if work_dir is None:
+        work_dir = model_training.spec.work_dir
 
     logging.info('Getting of tracking URI')
     tracking_uri = get_tracking_uri()
@@ -220,22 +620,22 @@ def train_models(model_training: ModelTraining, experiment_id: str) -> str:
     set_tracking_uri(tracking_uri)
 
     # Starting run and awaiting of finish of run
-    logging.info(f"Starting MLflow's run function. Parameters: [project directory: {model_training.spec.work_dir}, "
+    logging.info(f"Starting MLflow's run function. Parameters: [project directory: {work_dir}, "
                  f"entry point: {model_training.spec.entrypoint}, "
-                 f"hyper parameters: {model_training.spec.hyper_parameters}, "
+                 f"hyper parameters: {hyper_parameters}, "
                  f"experiment id={experiment_id}]")
 
     mlflow_input = {
-        "uri": model_training.spec.work_dir,
+        "uri": work_dir,
         "entry_point": model_training.spec.entrypoint,
-        "parameters": model_training.spec.hyper_parameters,
+        "parameters": hyper_parameters,
         "experiment_id": experiment_id,
         "backend": 'local',
         "synchronous": True,
         "use_conda": False,
     }
 
-    run_id = run_mlflow_wrapper(mlflow_input)
+    run_id = run_mlflow_wrapper(mlflow_input, wrapper_dir)
 
     # TODO: refactor
     client = MlflowClient()
@@ -258,23 +658,75 @@ def setup_logging(args: argparse.Namespace) -> None:
                         level=log_level)
 
 
-@contextlib.contextmanager
-def _remember_cwd():
-    curdir = os.getcwd()
+def convert_mlflow_model(model_meta: ModelIdentity, mlflow_model_path: str, gppi_model_path: str,
+                         mlflow_run_id: str, *, tgz: bool = True, stream: bool = False,
+                         compression: str = GZIP_COMPRESSION, level: Optional[int] = None,
+                         threads: Optional[int] = None, incremental: bool = False, index: bool = False,
+                         checksums: bool = True, validation: Optional[str] = None) -> Optional[ArchiveStats]:
+    """Converts MLflow model to GPPI directory and archives it
+    :param model_meta: container for model name and version
+    :param mlflow_model_path: path to MLFlow model
+    :param gppi_model_path: path to result GPPI directory, archive path is built from it
+    :param mlflow_run_id: mlflow run id for model
+    :param tgz: archive result directory and remove it
+    :param stream: write model straight into archive without intermediate GPPI directory
+    :param compression: compression of archive
+    :param level: compression level
+    :param threads: number of compression threads
+    :param incremental: keep result directory and archive index between conversions
+    :param index: write index of archive entries, so they can be read without decompressing whole archive
+    :param checksums: write digests of files and archive while archiving, see verify_archive
+    :param validation: validation level of result GPPI: manifest, schema or full.
+                       Full for GPPI directory and schema for streamed archive if not set
+    :return: archiving statistics, None if result is not archived
+    """
+    if validation is None:
+        validation = SCHEMA_VALIDATION if stream else FULL_VALIDATION
+    archive_path = f'{gppi_model_path.rstrip(os.sep)}{ARCHIVE_EXTENSIONS[compression]}'
+
+    if stream:
+        if not tgz:
+            raise ValueError('Streaming conversion always produces archive')
+        return mlflow_to_gppi_archive(model_meta=model_meta,
+                                      mlflow_model_path=mlflow_model_path,
+                                      archive_path=archive_path,
+                                      mlflow_run_id=mlflow_run_id,
+                                      compression=compression,
+                                      level=level,
+                                      threads=threads,
+                                      incremental=incremental,
+                                      index=index,
+                                      checksums=checksums,
+                                      validation=validation)
+
     try:
-        yield
-    finally:
-        os.chdir(curdir)
+        os.makedirs(gppi_model_path, exist_ok=True)
+    except FileExistsError as error:
+        raise ValueError(f'A file already exists with the same name: {gppi_model_path}\n'
+                         'Rename file or directory and try again.') from error
 
+    if not incremental and len(os.listdir(gppi_model_path)) > 0:
+        logging.error("Result directory must be empty!")
 
-def mlflow_to_gppi_cli():
+    mlflow_to_gppi(model_meta=model_meta,
+                   mlflow_model_path=mlflow_model_path,
+                   gppi_model_path=gppi_model_path,
+                   mlflow_run_id=mlflow_run_id,
+                   incremental=incremental,
+                   validation=validation)
 
-    def make_dir(string):
-        try:
-            os.makedirs(string, exist_ok=True)
-        except FileExistsError as error:
-            raise ValueError(f'A file already exists with the same name: {string}\n'
-                             'Rename file or directory and try again.') from error
+    if not tgz:
+        return None
+
+    stats = archive_directory(gppi_model_path, archive_path, compression=compression, level=level, threads=threads,
+                              incremental=incremental, index=index, checksums=checksums,
+                              exclude=(SYNC_MANIFEST_FILE_NAME,))
+    if not incremental:
+        shutil.rmtree(gppi_model_path)
+    return stats
+
+
+def mlflow_to_gppi_cli():
 
     def dir_type(string):
         if not os.path.isdir(string):
@@ -292,29 +744,50 @@ def mlflow_to_gppi_cli():
                         type=str, help='Path to result GPPI model directory')
     parser.add_argument('--mlflow-run-id', type=str, required=True, help='Run ID for MLFlow model')
     parser.add_argument('--no-tgz', dest='tgz', action='store_false', help='Prevent archiving result directory')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default=GZIP_COMPRESSION,
+                        help='Compression of result archive')
+    parser.add_argument('--compression-level', type=int, help='Compression level, default level is used if not set')
+    parser.add_argument('--compression-threads', type=int,
+                        help='Number of compression threads, all CPUs are used if not set')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write model straight into archive without intermediate GPPI directory. '
+                             'GPPI is validated by its manifest and list of files, model is not loaded')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Keep result directory and archive index between conversions. '
+                             'Only files that are changed since previous conversion are copied and compressed')
+    parser.add_argument('--index', action='store_true',
+                        help='Compress every archive entry separately and write index of entries next to archive, '
+                             'so single entries can be read without decompressing whole archive')
+    parser.add_argument('--no-checksums', dest='checksums', action='store_false',
+                        help=f'Do not write SHA-256 digests of archived files ({CHECKSUMS_FILE_NAME} entry) '
+                             f'and of archive ({ARCHIVE_DIGEST_SUFFIX} file next to it)')
+    parser.add_argument('--validation', choices=VALIDATION_LEVELS,
+                        help='Validation of result GPPI: manifest and its files, schema of samples against '
+                             'model signature or full check that loads model and predicts input sample. '
+                             f'{FULL_VALIDATION} by default, {SCHEMA_VALIDATION} with --stream')
     args = parser.parse_args()
 
     setup_logging(args)
-    gppi_model_path: str = args.gppi_model_path
-
-    make_dir(gppi_model_path)
+    model_meta = ModelIdentity(name=args.model_name.strip(), version=args.model_version.strip())
 
-    if len(os.listdir(gppi_model_path)) > 0:
-        logging.error("Result directory must be empty!")
+    if args.stream and not args.tgz:
+        logging.error('--stream can not be used together with --no-tgz')
+        sys.exit(1)
 
     try:
-        mlflow_to_gppi(model_meta=ModelIdentity(name=args.model_name.strip(), version=args.model_version.strip()),
-                       mlflow_model_path=args.mlflow_model_path,
-                       gppi_model_path=gppi_model_path,
-                       mlflow_run_id=args.mlflow_run_id)
-
-        if args.tgz:
-            with _remember_cwd(), tarfile.open(f'{gppi_model_path}.tgz', 'w:gz') as tar:  # type: tarfile.TarFile
-                os.chdir(args.gppi_model_path)
-                for s in os.listdir('.'):
-                    tar.add(s)
-            shutil.rmtree(gppi_model_path)
-
+        convert_mlflow_model(model_meta=model_meta,
+                             mlflow_model_path=args.mlflow_model_path,
+                             gppi_model_path=args.gppi_model_path,
+                             mlflow_run_id=args.mlflow_run_id,
+                             tgz=args.tgz,
+                             stream=args.stream,
+                             compression=args.compression,
+                             level=args.compression_level,
+                             threads=args.compression_threads,
+                             incremental=args.incremental,
+                             index=args.index,
+                             checksums=args.checksums,
+                             validation=args.validation)
     except Exception as e:
         error_message = f'Exception occurs during model conversion. Message: {e}'
 
@@ -0,0 +1,71 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def run_stages(stages: Dict[str, Callable[[], Any]], threads: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Run independent stages concurrently on a thread pool and log wall-clock time of every stage.
+    If a stage fails, stages that are not started yet are cancelled and the error of the first failed stage
+    is raised once running stages are finished: threads and their subprocesses can not be interrupted safely
+
+    :param stages: functions without arguments by stage names
+    :param threads: number of threads, all stages are started at once if not set
+    :return: results of stages by their names
+    """
+    started_at = time.perf_counter()
+    # Worker can take the next stage before failure is noticed by the main thread
+    failed = threading.Event()
+
+    def run(name: str, function: Callable[[], Any]) -> Any:
+        if failed.is_set():
+            logger.info(f'Stage "{name}" is cancelled')
+            return None
+
+        stage_started_at = time.perf_counter()
+        try:
+            result = function()
+        except Exception:
+            failed.set()
+            logger.error(f'Stage "{name}" failed in {time.perf_counter() - stage_started_at:.2f} s')
+            raise
+        logger.info(f'Stage "{name}" finished in {time.perf_counter() - stage_started_at:.2f} s')
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(threads or max(len(stages), 1),
+                                               thread_name_prefix='odahuflow-stage') as executor:
+        futures = {name: executor.submit(run, name, function) for name, function in stages.items()}
+        _, pending = concurrent.futures.wait(futures.values(), return_when=concurrent.futures.FIRST_EXCEPTION)
+        for future in pending:
+            if future.cancel():
+                logger.info(f'Stage "{_stage_name(futures, future)}" is cancelled')
+
+    errors = [future.exception() for future in futures.values() if not future.cancelled() and future.exception()]
+    if errors:
+        raise errors[0]
+
+    logger.info(f'Stages {", ".join(stages)} finished in {time.perf_counter() - started_at:.2f} s')
+    return {name: future.result() for name, future in futures.items()}
+
+
+def _stage_name(futures: Dict[str, concurrent.futures.Future], future: concurrent.futures.Future) -> str:
+    return next(name for name, stage_future in futures.items() if stage_future is future)
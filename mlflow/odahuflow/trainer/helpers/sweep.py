@@ -0,0 +1,197 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import concurrent.futures
+import itertools
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import yaml
+from odahuflow.sdk.models import ModelTraining
+
+from odahuflow.trainer.helpers.fs import copytree
+from odahuflow.trainer.helpers.mlflow_helper import train_models
+
+from mlflow.tracking import MlflowClient
+
+MAXIMIZE = 'maximize'
+MINIMIZE = 'minimize'
+GOALS = (MAXIMIZE, MINIMIZE)
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+# Tag of the run that is selected by sweep
+BEST_RUN_TAG = 'sweep_best_run'
+# Copy of project directory in directory of every run
+PROJECT_COPY_DIR = 'project'
+
+
+class Sweep(NamedTuple):
+    # Hyper parameters of every run, they override hyper parameters of model training
+    parameter_sets: List[Dict[str, str]]
+    # Metric that selects the best run
+    metric: str
+    goal: str = MAXIMIZE
+    # Number of parallel runs, CPU quota of container is used if not set
+    workers: Optional[int] = None
+
+
+def read_sweep(path: str) -> Sweep:
+    """
+    Read sweep from json/yaml file with metric, optional goal (maximize or minimize) and workers fields
+    and either grid of parameter values (all combinations are run) or list of parameter sets
+
+    :param path: path to sweep file
+    :return: sweep
+    """
+    with open(path, encoding='utf-8') as sweep_file:
+        # JSON is a subset of YAML
+        content = yaml.safe_load(sweep_file)
+
+    if not isinstance(content, dict) or not content.get('metric'):
+        raise ValueError(f'Sweep file {path} must contain metric')
+    if ('grid' in content) == ('parameters' in content):
+        raise ValueError(f'Sweep file {path} must contain either grid or parameters')
+
+    goal = content.get('goal', MAXIMIZE)
+    if goal not in GOALS:
+        raise ValueError(f'Goal of sweep must be one of {GOALS}, got {goal}')
+
+    workers = content.get('workers')
+    if workers is not None and (not isinstance(workers, int) or isinstance(workers, bool) or workers < 1):
+        raise ValueError(f'Workers of sweep must be a positive integer, got {workers!r}')
+
+    if 'grid' in content:
+        grid = content['grid']
+        if not isinstance(grid, dict) or not all(isinstance(values, list) for values in grid.values()):
+            raise ValueError(f'Grid of sweep file {path} must map parameter names to lists of values')
+        names = list(grid)
+        parameter_sets = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    else:
+        parameter_sets = content['parameters']
+        if not isinstance(parameter_sets, list) or not all(isinstance(parameters, dict)
+                                                           for parameters in parameter_sets):
+            raise ValueError(f'Parameters of sweep file {path} must be a list of parameter mappings')
+
+    if not parameter_sets:
+        raise ValueError(f'Sweep file {path} contains no parameter sets')
+
+    return Sweep(parameter_sets=[{str(name): str(value) for name, value in parameters.items()}
+                                 for parameters in parameter_sets],
+                 metric=str(content['metric']),
+                 goal=goal,
+                 workers=workers)
+
+
+def cpu_quota(cgroup_root: str = CGROUP_ROOT) -> int:
+    """
+    Get number of CPUs available to container: CFS quota of cgroup v2 or v1,
+    CPUs the process may run on if quota is not set
+
+    :param cgroup_root: mount point of cgroup filesystem
+    :return: number of CPUs, at least 1
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        with open(os.path.join(cgroup_root, 'cpu.max'), encoding='utf-8') as cpu_max:
+            quota, period = cpu_max.read().split()
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_quota_us'), encoding='utf-8') as quota_file, \
+                    open(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_period_us'), encoding='utf-8') as period_file:
+                quota, period = quota_file.read().strip(), period_file.read().strip()
+        except OSError:
+            pass
+
+    # Quota is "max" (v2) or -1 (v1) if it is not set
+    if quota is None or quota in ('max', '-1'):
+        return max(cpus, 1)
+    return max(min(math.ceil(int(quota) / int(period)), cpus), 1)
+
+
+def select_best_run(metrics: Dict[str, Optional[float]], goal: str = MAXIMIZE) -> str:
+    """
+    Select run with the best metric
+
+    :param metrics: metric values by run ids, None if run did not log metric
+    :param goal: maximize or minimize
+    :return: id of the best run
+    """
+    measured = {run_id: value for run_id, value in metrics.items() if value is not None}
+    if not measured:
+        raise ValueError('None of sweep runs logged the metric')
+
+    select = max if goal == MAXIMIZE else min
+    return select(measured, key=measured.get)
+
+
+def run_sweep(model_training: ModelTraining, experiment_id: str, sweep: Sweep) -> str:
+    """
+    Run MLflow runs with parameter sets of sweep on a bounded thread pool. Every run has its own directory
+    of wrapper files and its own copy of the project directory, so files that training writes relative
+    to the project do not overwrite files of other runs. Failed runs do not stop other runs
+
+    :param model_training: model training
+    :param experiment_id: experiment of runs
+    :param sweep: sweep
+    :return: id of the best run, it is tagged with sweep_best_run tag
+    """
+    started_at = time.perf_counter()
+    workers = min(sweep.workers or cpu_quota(), len(sweep.parameter_sets))
+    logging.info(f'Running sweep of {len(sweep.parameter_sets)} runs on {workers} workers')
+
+    project_dir = os.path.join(os.getcwd(), model_training.spec.work_dir)
+
+    def run(parameters: Dict[str, str]) -> str:
+        wrapper_dir = tempfile.mkdtemp(prefix='odahuflow-sweep-')
+        try:
+            work_dir = os.path.join(wrapper_dir, PROJECT_COPY_DIR)
+            os.mkdir(work_dir)
+            copytree(project_dir, work_dir)
+            return train_models(model_training, experiment_id,
+                                hyper_parameters={**(model_training.spec.hyper_parameters or {}), **parameters},
+                                wrapper_dir=wrapper_dir, work_dir=work_dir)
+        finally:
+            shutil.rmtree(wrapper_dir, ignore_errors=True)
+
+    client = MlflowClient()
+    metrics: Dict[str, Optional[float]] = {}
+    with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='odahuflow-sweep') as executor:
+        futures = {executor.submit(run, parameters): index for index, parameters in enumerate(sweep.parameter_sets)}
+        for future in concurrent.futures.as_completed(futures):
+            parameters = sweep.parameter_sets[futures[future]]
+            try:
+                run_id = future.result()
+            except Exception as error:
+                logging.error(f'Sweep run with parameters {parameters} failed: {error}')
+                continue
+            metrics[run_id] = client.get_run(run_id).data.metrics.get(sweep.metric)
+            logging.info(f'Sweep run {run_id} with parameters {parameters}: {sweep.metric}={metrics[run_id]}')
+
+    if not metrics:
+        raise ValueError('All sweep runs failed')
+
+    best_run_id = select_best_run(metrics, sweep.goal)
+    client.set_tag(best_run_id, BEST_RUN_TAG, 'true')
+    logging.info(f'Sweep finished in {time.perf_counter() - started_at:.2f} s, {len(metrics)} of '
+                 f'{len(sweep.parameter_sets)} runs succeeded. Best run: {best_run_id}, '
+                 f'{sweep.metric}={metrics[best_run_id]}')
+    return best_run_id
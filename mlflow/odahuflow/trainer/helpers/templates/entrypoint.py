@@ -13,9 +13,20 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 #
+# Template is copied to GPPI model as a single file, so it can not be split into modules
+# pylint: disable=C0302
+import atexit
+import bisect
+import collections
 import functools
+import gc
+import json
+import multiprocessing
 import os
-from typing import Optional, List, Dict, Union, Any, Tuple, Type
+import queue
+import threading
+import time
+from typing import Optional, List, Dict, Union, Any, Tuple, Type, NamedTuple, Iterable, Iterator
 
 import numpy as np
 import pandas as pd
@@ -24,15 +35,81 @@ import pandas.api.types as pdt
 import mlflow.models
 import mlflow.pyfunc
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8, data is pickled to replicas
+    shared_memory = None
+
 # Storage of loaded prediction function
 MODEL_FLAVOR = None
 
 # Path to model's root
 MODEL_LOCATION = os.getenv('MODEL_LOCATION', '.')
+# Optional. Number of model replicas loaded in worker processes. Model is loaded in current process if 0
+MODEL_REPLICAS = int(os.getenv('MODEL_REPLICAS', '0'))
+# Optional. Load model once and fork replicas that share its memory pages instead of loading model in each replica
+MODEL_PREFORK = os.getenv('MODEL_PREFORK', 'false').lower() == 'true'
 
 # Optional. Examples of input and output pandas DataFrames
-MODEL_INPUT_SAMPLE_FILE = os.path.join(MODEL_LOCATION, 'head_input.pkl')
-MODEL_OUTPUT_SAMPLE_FILE = os.path.join(MODEL_LOCATION, 'head_output.pkl')
+MODEL_INPUT_SAMPLE_FILE_NAME = 'head_input.pkl'
+MODEL_OUTPUT_SAMPLE_FILE_NAME = 'head_output.pkl'
+MODEL_INPUT_SAMPLE_FILE = os.path.join(MODEL_LOCATION, MODEL_INPUT_SAMPLE_FILE_NAME)
+MODEL_OUTPUT_SAMPLE_FILE = os.path.join(MODEL_LOCATION, MODEL_OUTPUT_SAMPLE_FILE_NAME)
+# Optional. Column names, dtypes and OpenAPI types of input and output samples, precomputed by converter.
+# Samples are loaded only if the file is missing
+MODEL_SCHEMA_FILE_NAME = 'head_schema.json'
+MODEL_SCHEMA_FILE = os.path.join(MODEL_LOCATION, MODEL_SCHEMA_FILE_NAME)
+
+# Optional. Max number of rows in a batch of concurrent requests. Batching is disabled if 0
+MODEL_BATCH_MAX_SIZE = int(os.getenv('MODEL_BATCH_MAX_SIZE', '0'))
+# Optional. Max time (ms) that request waits for other requests to be batched with
+MODEL_BATCH_MAX_WAIT_MS = float(os.getenv('MODEL_BATCH_MAX_WAIT_MS', '5'))
+
+# Optional. Number of predictions on input sample rows that init() makes before model is reported as ready
+MODEL_WARMUP_PREDICTIONS = int(os.getenv('MODEL_WARMUP_PREDICTIONS', '0'))
+
+# Optional. Memory budget (bytes) of cache of predicted rows. Caching is disabled if 0
+MODEL_CACHE_MAX_BYTES = int(os.getenv('MODEL_CACHE_MAX_BYTES', '0'))
+# Optional. Time to live (seconds) of cached rows. Rows do not expire if 0
+MODEL_CACHE_TTL = float(os.getenv('MODEL_CACHE_TTL', '0'))
+
+# Optional. Collect latency histograms of prediction stages, see metrics()
+MODEL_METRICS = os.getenv('MODEL_METRICS', 'false').lower() == 'true'
+
+# Storage of batching engine. Created by init() if batching is enabled
+BATCHER = None
+# Storage of model replicas pool. Created by init() if replicas are enabled
+REPLICAS = None
+# Storage of prediction cache. Created by init() if caching is enabled
+CACHE = None
+# Storage of model load and warmup timings. Created by init()
+INIT_REPORT = None
+# Storage of latency histograms of prediction stages. Created by init() if metrics are enabled
+METRICS = None
+
+
+class _InitReport(NamedTuple):
+    """
+    Cold start timings of model (seconds)
+    """
+    load_time: float
+    warmup_predictions: int
+    # Time of first prediction after model is loaded. None if warmup is not made
+    first_predict_time: Optional[float]
+    # Mean time of predictions after the first one. None if less than 2 warmup predictions are made
+    steady_predict_time: Optional[float]
+
+
+class _SchemaPlan(NamedTuple):
+    """
+    Model schema precomputed from input and output samples, applied to every prediction request
+    """
+    # Ordered names of model's input columns. None if input sample is not provided
+    input_columns: Optional[Tuple[str, ...]]
+    # Target dtype for each input column. None means that dtype is inferred from the request
+    input_dtypes: Tuple[Optional[np.dtype], ...]
+    # Names of model's output columns
+    output_columns: Tuple[str, ...]
 
 
 # pylint: disable=R0911
@@ -73,15 +150,93 @@ def init() -> str:
 
     :return: prediction type (matrix or objects)
     """
+    load_started_at = time.perf_counter()
+
     model = mlflow.models.Model.load(MODEL_LOCATION)
     if mlflow.pyfunc.FLAVOR_NAME not in model.flavors:
         raise ValueError(f'{mlflow.pyfunc.FLAVOR_NAME} not in model\'s flavors')
 
-    global MODEL_FLAVOR
-    MODEL_FLAVOR = mlflow.pyfunc.load_model(MODEL_LOCATION)
+    plan = _schema_plan()
+
+    global METRICS
+    if MODEL_METRICS and METRICS is None:
+        METRICS = _StageMetrics()
+
+    global MODEL_FLAVOR, REPLICAS
+    if MODEL_REPLICAS > 0 and MODEL_PREFORK:
+        if REPLICAS is None:
+            MODEL_FLAVOR = mlflow.pyfunc.load_model(MODEL_LOCATION)
+            REPLICAS = _prefork_replicas(plan, MODEL_REPLICAS)
+            atexit.register(REPLICAS.close)
+    elif MODEL_REPLICAS > 0:
+        if REPLICAS is None:
+            REPLICAS = _ModelReplicaPool(functools.partial(mlflow.pyfunc.load_model, MODEL_LOCATION), plan,
+                                         replicas=MODEL_REPLICAS)
+            atexit.register(REPLICAS.close)
+    else:
+        MODEL_FLAVOR = mlflow.pyfunc.load_model(MODEL_LOCATION)
+
+    global BATCHER
+    if MODEL_BATCH_MAX_SIZE > 0 and BATCHER is None:
+        BATCHER = _MicroBatcher(functools.partial(_dispatch_predict, plan=plan),
+                                max_batch_size=MODEL_BATCH_MAX_SIZE,
+                                max_wait=MODEL_BATCH_MAX_WAIT_MS / 1000,
+                                workers=max(MODEL_REPLICAS, 1))
+        atexit.register(BATCHER.close)
+
+    global CACHE
+    if MODEL_CACHE_MAX_BYTES > 0 and CACHE is None:
+        CACHE = _PredictionCache(max_bytes=MODEL_CACHE_MAX_BYTES, ttl=MODEL_CACHE_TTL)
+
+    load_time = time.perf_counter() - load_started_at
+
+    global INIT_REPORT
+    INIT_REPORT = _warmup(plan, MODEL_WARMUP_PREDICTIONS, load_time)
+
     return 'matrix'
 
 
+def _warmup(plan: _SchemaPlan, predictions: int, load_time: float) -> _InitReport:
+    """
+    Make predictions on input sample, so lazy imports, JIT and allocations are done before first request
+
+    :param plan: model's schema plan
+    :param predictions: number of warmup predictions
+    :param load_time: time of model loading
+    :return: cold start timings
+    """
+    input_sample = _input_df_sample()
+    if input_sample is None or predictions <= 0:
+        return _InitReport(load_time=load_time, warmup_predictions=0,
+                           first_predict_time=None, steady_predict_time=None)
+
+    timings = []
+    for _ in range(predictions):
+        started_at = time.perf_counter()
+        # Cache is bypassed, otherwise only the first prediction reaches the model
+        _batched_predict(input_sample, plan)
+        timings.append(time.perf_counter() - started_at)
+
+    steady_timings = timings[1:]
+    return _InitReport(
+        load_time=load_time,
+        warmup_predictions=predictions,
+        first_predict_time=timings[0],
+        steady_predict_time=sum(steady_timings) / len(steady_timings) if steady_timings else None
+    )
+
+
+def init_report() -> Optional[Dict[str, Any]]:
+    """
+    Get model load time, first prediction time and steady state prediction time
+
+    :return: cold start timings (seconds) or None if model is not initialized
+    """
+    if INIT_REPORT is None:
+        return None
+    return INIT_REPORT._asdict()
+
+
 def predict_on_matrix(input_matrix: List[List[Any]], provided_columns_names: Optional[List[str]] = None) \
         -> Tuple[np.ndarray, Tuple[str, ...]]:
     """
@@ -91,23 +246,236 @@ def predict_on_matrix(input_matrix: List[List[Any]], provided_columns_names: Opt
     :param provided_columns_names: Name of columns for provided matrix
     :return: result matrix as np.array[np.array[Any]] and result column names
     """
-    if provided_columns_names:
-        input_matrix = pd.DataFrame(input_matrix, columns=provided_columns_names)
+    started_at = _clock()
+    plan = _schema_plan()
+
+    if provided_columns_names and plan.input_columns is not None:
+        input_df = _matrix_to_df(input_matrix, provided_columns_names, plan)
     else:
-        input_matrix = pd.DataFrame(input_matrix)
+        if provided_columns_names:
+            input_df = pd.DataFrame(input_matrix, columns=provided_columns_names)
+        else:
+            input_df = pd.DataFrame(input_matrix)
 
-    input_sample = _input_df_sample()
-    output_sample = _output_df_sample()
+        if started_at is not None:
+            _observe('dataframe', started_at)
+
+    result = _predict_on_df(input_df, plan)
+
+    if started_at is not None:
+        _observe('total', started_at)
+    return result
+
+
+def predict_on_columns(input_data: Any, provided_columns_names: Optional[List[str]] = None) \
+        -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Make prediction on columnar data without converting it row by row.
+    Input is passed to the model with at most one copy.
+
+    :param input_data: 2-D np.ndarray, mapping of column name to 1-D array or pyarrow RecordBatch / Table
+    :param provided_columns_names: Name of columns for provided 2-D np.ndarray
+    :return: result matrix as np.array[np.array[Any]] and result column names
+    """
+    started_at = stage_started_at = _clock()
+    plan = _schema_plan()
+
+    input_df, columns_provided = _columnar_to_df(input_data, provided_columns_names)
+    if stage_started_at is not None:
+        stage_started_at = _observe('dataframe', stage_started_at)
+
+    if columns_provided and plan.input_columns is not None:
+        input_df = _align_df(input_df, plan)
+        if stage_started_at is not None:
+            _observe('align', stage_started_at)
+
+    result = _predict_on_df(input_df, plan)
+
+    if started_at is not None:
+        _observe('total', started_at)
+    return result
+
+
+def predict_stream(source: Union[str, os.PathLike, Iterable[Any]], provided_columns_names: Optional[List[str]] = None,
+                   chunk_size: int = 10000) -> Iterator[Tuple[np.ndarray, Tuple[str, ...]]]:
+    """
+    Make prediction chunk by chunk, so only one chunk of input and result is kept in memory
+
+    :param source: path to CSV or Parquet file or iterable of chunks.
+                   Chunk is a Matrix of values or any data accepted by predict_on_columns
+    :param provided_columns_names: Name of columns for provided chunks. Files provide column names themselves
+    :param chunk_size: max number of rows in a chunk read from file
+    :return: result matrix as np.array[np.array[Any]] and result column names for every chunk
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = _read_chunks(os.fspath(source), chunk_size)
+
+    for chunk in source:
+        if isinstance(chunk, list):
+            yield predict_on_matrix(chunk, provided_columns_names)
+        else:
+            yield predict_on_columns(chunk, provided_columns_names)
+
+
+def _read_chunks(path: str, chunk_size: int) -> Iterator[Any]:
+    """
+    Read CSV or Parquet file by chunks
+
+    :param path: path to file
+    :param chunk_size: max number of rows in a chunk
+    :return: DataFrames or pyarrow RecordBatches
+    """
+    file_name = path.lower()
+
+    if file_name.endswith(('.csv', '.csv.gz', '.csv.bz2', '.csv.zip', '.csv.xz')):
+        reader = pd.read_csv(path, chunksize=chunk_size)
+        try:
+            yield from reader
+        finally:
+            reader.close()
+    elif file_name.endswith(('.parquet', '.pq')):
+        # pyarrow is optional and required only for Parquet files
+        import pyarrow.parquet  # pylint: disable=C0415
+
+        yield from pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size)
+    else:
+        raise ValueError(f'Unsupported file format: {path}. Use CSV or Parquet file')
+
+
+def _columnar_to_df(input_data: Any, provided_columns_names: Optional[List[str]] = None) \
+        -> Tuple[pd.DataFrame, bool]:
+    """
+    Wrap columnar data into a DataFrame, reusing provided buffers where possible
+
+    :param input_data: 2-D np.ndarray, mapping of column name to 1-D array or pyarrow RecordBatch / Table
+    :param provided_columns_names: Name of columns for provided 2-D np.ndarray
+    :return: DataFrame and flag whether data has named columns
+    """
+    if isinstance(input_data, pd.DataFrame):
+        return input_data, True
+
+    # pyarrow is optional, so RecordBatch and Table are detected by their interface
+    if hasattr(input_data, 'to_pandas') and hasattr(input_data, 'schema'):
+        return input_data.to_pandas(), True
+
+    if isinstance(input_data, dict):
+        return pd.DataFrame(input_data, copy=False), True
+
+    input_data = np.asarray(input_data)
+    if input_data.ndim != 2:
+        raise ValueError(f'Expected 2-D array, got array with {input_data.ndim} dimension(s)')
+
+    if provided_columns_names:
+        return pd.DataFrame(input_data, columns=provided_columns_names, copy=False), True
+
+    return pd.DataFrame(input_data, copy=False), False
+
+
+def _predict_on_df(input_df: pd.DataFrame, plan: _SchemaPlan) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Make prediction on DataFrame which is already aligned with model's input schema
+
+    :param input_df: data for prediction
+    :param plan: model's schema plan
+    :return: result matrix as np.array[np.array[Any]] and result column names
+    """
+    if CACHE is not None:
+        return _cached_predict(input_df, plan)
+
+    return _batched_predict(input_df, plan)
+
+
+def _batched_predict(input_df: pd.DataFrame, plan: _SchemaPlan) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Make prediction through batching engine if it is enabled
+
+    :param input_df: data for prediction
+    :param plan: model's schema plan
+    :return: result matrix as np.array[np.array[Any]] and result column names
+    """
+    if BATCHER is not None:
+        return BATCHER.predict(input_df)
+
+    return _dispatch_predict(input_df, plan)
+
+
+def _cached_predict(input_df: pd.DataFrame, plan: _SchemaPlan) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Take rows from prediction cache, only missed rows are passed to model
+
+    :param input_df: data for prediction
+    :param plan: model's schema plan
+    :return: result matrix as np.array[np.array[Any]] and result column names
+    """
+    if input_df.empty:
+        # Nothing to take from cache, model builds empty result itself
+        return _batched_predict(input_df, plan)
+
+    try:
+        keys = _row_keys(input_df)
+    except TypeError:
+        # Some values (e.g. lists) can not be hashed
+        return _batched_predict(input_df, plan)
+
+    rows, result_columns = CACHE.get_many(keys)
+    missing = [position for position, row in enumerate(rows) if row is None]
+    if not missing:
+        return np.stack(rows), result_columns
+
+    missing_df = input_df if len(missing) == len(rows) else input_df.iloc[missing]
+    result, result_columns = _batched_predict(missing_df, plan)
+
+    if len(result) != len(missing_df):
+        # Result rows can not be matched with input rows
+        if len(missing) == len(rows):
+            return result, result_columns
+        return _batched_predict(input_df, plan)
+
+    CACHE.put_many([keys[position] for position in missing], result, result_columns)
+    if len(missing) == len(rows):
+        return result, result_columns
+
+    for position, row in zip(missing, result):
+        rows[position] = row
+    return np.stack(rows), result_columns
+
+
+def _dispatch_predict(input_df: pd.DataFrame, plan: _SchemaPlan) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Make prediction on idle model replica or on model loaded in current process
+
+    :param input_df: data for prediction
+    :param plan: model's schema plan
+    :return: result matrix as np.array[np.array[Any]] and result column names
+    """
+    if REPLICAS is not None:
+        started_at = _clock()
+        result = REPLICAS.predict(input_df)
+        # Replica converts result itself, so both stages are measured as prediction
+        if started_at is not None:
+            _observe('predict', started_at)
+        return result
+
+    return _model_predict(input_df, plan)
+
+
+def _model_predict(input_df: pd.DataFrame, plan: _SchemaPlan) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Invoke model and convert its output to result matrix
 
-    if provided_columns_names and input_sample is not None:
-        input_matrix = input_matrix.reindex(columns=input_sample.columns)
+    :param input_df: data for prediction
+    :param plan: model's schema plan
+    :return: result matrix as np.array[np.array[Any]] and result column names
+    """
+    started_at = _clock()
 
     py_func_output = Union[pd.DataFrame, pd.Series, np.ndarray, list]
-    result: py_func_output = MODEL_FLAVOR.predict(input_matrix)
+    result: py_func_output = MODEL_FLAVOR.predict(input_df)
 
-    result_columns = []
-    if output_sample is not None:
-        result_columns = output_sample.columns
+    if started_at is not None:
+        started_at = _observe('predict', started_at)
+
+    result_columns = plan.output_columns
 
     # Register column names, overwrite if we've a sample
     if hasattr(result, 'columns'):
@@ -119,9 +487,1055 @@ def predict_on_matrix(input_matrix: List[List[Any]], provided_columns_names: Opt
     if isinstance(result, list):
         result = np.array(result)
 
+    if started_at is not None:
+        _observe('result', started_at)
+
     return result, tuple(result_columns)
 
 
+@functools.lru_cache()
+def _schema_plan() -> _SchemaPlan:
+    """
+    Internal function for building schema plan from input and output samples
+
+    :return: schema plan
+    """
+    schema = _schema_file()
+    if schema is not None:
+        input_schema, output_schema = schema['input'], schema['output']
+
+        input_columns = None
+        input_dtypes = ()
+        if input_schema is not None:
+            input_columns = tuple(prop['name'] for prop in input_schema)
+            input_dtypes = tuple(_plan_dtype(_parse_dtype(prop['dtype'])) for prop in input_schema)
+
+        output_columns = tuple(prop['name'] for prop in output_schema or ())
+
+        return _SchemaPlan(input_columns=input_columns, input_dtypes=input_dtypes, output_columns=output_columns)
+
+    input_sample = _input_df_sample()
+    output_sample = _output_df_sample()
+
+    input_columns = None
+    input_dtypes = ()
+    if input_sample is not None:
+        input_columns = tuple(input_sample.columns)
+        input_dtypes = tuple(_plan_dtype(dtype) for dtype in input_sample.dtypes)
+
+    output_columns = ()
+    if output_sample is not None:
+        output_columns = tuple(output_sample.columns)
+
+    return _SchemaPlan(input_columns=input_columns, input_dtypes=input_dtypes, output_columns=output_columns)
+
+
+def _parse_dtype(dtype: str) -> Optional[np.dtype]:
+    """
+    Parse numpy dtype stored in schema file
+
+    :param dtype: name of dtype
+    :return: dtype or None if it is not a numpy dtype (e.g. pandas extension dtype)
+    """
+    try:
+        return np.dtype(dtype)
+    except TypeError:
+        return None
+
+
+def _plan_dtype(dtype: Any) -> Optional[np.dtype]:
+    """
+    Get dtype which provided values are coerced to. Only plain numpy numeric and boolean dtypes are coerced
+
+    :param dtype: dtype of sample column
+    :return: target dtype or None if it has to be inferred
+    """
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        return dtype
+    return None
+
+
+@functools.lru_cache(maxsize=128)
+def _column_permutation(input_columns: Tuple[str, ...], provided_columns: Tuple[str, ...]) -> Tuple[int, ...]:
+    """
+    Find position of every model's input column in provided columns
+
+    :param input_columns: model's input columns
+    :param provided_columns: columns provided in request
+    :raises ValueError: if some of model's input columns are not provided
+    :return: index of provided column for every model's input column
+    """
+    positions = {name: position for position, name in enumerate(provided_columns)}
+
+    missing_columns = [name for name in input_columns if name not in positions]
+    if missing_columns:
+        raise ValueError(f'Missing columns: {missing_columns}')
+
+    # Extra columns are ignored
+    return tuple(positions[name] for name in input_columns)
+
+
+def _coerce_column(values: np.ndarray, dtype: Optional[np.dtype]) -> Union[np.ndarray, pd.Series]:
+    """
+    Convert column of provided numeric values to numeric target dtype.
+    Falls back to type inference if values are not numbers or can not be converted without losses
+
+    :param values: column values
+    :param dtype: target dtype
+    :return: converted column
+    """
+    if dtype is not None and values.dtype == dtype:
+        return values
+
+    if dtype is not None and dtype.kind in 'iuf' and _is_numeric_column(values):
+        try:
+            coerced = values.astype(dtype)
+        except (TypeError, ValueError, OverflowError):
+            coerced = None
+
+        # Casting to integers silently truncates values
+        if coerced is not None and (dtype.kind not in 'iu' or (coerced == values).all()):
+            return coerced
+
+    if values.dtype == object:
+        return pd.Series(values).infer_objects()
+    return values
+
+
+def _is_numeric_column(values: np.ndarray) -> bool:
+    """
+    Check that column contains only numbers, booleans and strings are not numbers
+
+    :param values: column values
+    :return: whether values are numbers
+    """
+    if values.dtype != object:
+        return values.dtype.kind in 'iuf'
+    return all(isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+               for value in values)
+
+
+def _matrix_to_df(input_matrix: List[List[Any]], provided_columns_names: List[str], plan: _SchemaPlan) \
+        -> pd.DataFrame:
+    """
+    Build DataFrame aligned with model's input schema from a Matrix of values
+
+    :param input_matrix: data for prediction
+    :param provided_columns_names: Name of columns for provided matrix
+    :param plan: model's schema plan
+    :return: DataFrame with model's input columns
+    """
+    started_at = _clock()
+    permutation = _column_permutation(plan.input_columns, tuple(provided_columns_names))
+
+    if not input_matrix:
+        return pd.DataFrame({
+            name: np.empty(0, dtype=dtype if dtype is not None else object)
+            for name, dtype in zip(plan.input_columns, plan.input_dtypes)
+        })
+
+    values = np.empty((len(input_matrix), len(provided_columns_names)), dtype=object)
+    values[:] = input_matrix
+
+    if started_at is not None:
+        started_at = _observe('dataframe', started_at)
+
+    input_df = pd.DataFrame({
+        name: _coerce_column(values[:, position], dtype)
+        for name, position, dtype in zip(plan.input_columns, permutation, plan.input_dtypes)
+    }, copy=False)
+
+    if started_at is not None:
+        _observe('align', started_at)
+    return input_df
+
+
+def _align_df(input_df: pd.DataFrame, plan: _SchemaPlan) -> pd.DataFrame:
+    """
+    Reorder columns of DataFrame according to model's input schema.
+    Columns are converted to target dtypes only if it can be done without losses
+
+    :param input_df: DataFrame with named columns
+    :param plan: model's schema plan
+    :return: DataFrame with model's input columns
+    """
+    permutation = _column_permutation(plan.input_columns, tuple(input_df.columns))
+    if permutation != tuple(range(len(input_df.columns))):
+        input_df = input_df.iloc[:, list(permutation)]
+
+    casts = {
+        name: dtype
+        for name, column_dtype, dtype in zip(plan.input_columns, input_df.dtypes, plan.input_dtypes)
+        if dtype is not None and column_dtype != dtype and isinstance(column_dtype, np.dtype)
+        and np.can_cast(column_dtype, dtype, casting='safe')
+    }
+    if casts:
+        input_df = input_df.astype(casts)
+
+    return input_df
+
+
+class _BatchRequest:
+    """
+    Prediction request waiting in the batching queue
+    """
+
+    __slots__ = ('input_df', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, input_df: pd.DataFrame):
+        self.input_df = input_df
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Optional[Tuple[np.ndarray, Tuple[str, ...]]] = None
+        self.error: Optional[BaseException] = None
+
+
+class _MicroBatcher:
+    """
+    Collects concurrent prediction requests into one DataFrame,
+    invokes model once and scatters result rows back to each request
+    """
+
+    def __init__(self, predict_func, max_batch_size: int, max_wait: float, workers: int = 1):
+        """
+        :param predict_func: function that makes prediction on DataFrame
+        :param max_batch_size: max number of rows in a batch
+        :param max_wait: max time (seconds) that first request of a batch waits for other requests
+        :param workers: number of batches that are predicted simultaneously
+        """
+        self._predict_func = predict_func
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+
+        self._pending: collections.deque = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._rows = 0
+        self._max_batch_rows = 0
+        self._queue_wait_sum = 0.0
+        self._queue_wait_max = 0.0
+
+        self._workers = [threading.Thread(target=self._run, name=f'odahuflow-model-batcher-{index}', daemon=True)
+                         for index in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def predict(self, input_df: pd.DataFrame) -> Tuple[np.ndarray, Tuple[str, ...]]:
+        """
+        Enqueue request and wait for its result
+
+        :param input_df: data for prediction
+        :return: result matrix as np.array[np.array[Any]] and result column names
+        """
+        request = _BatchRequest(input_df)
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Micro batcher is closed')
+            self._pending.append(request)
+            self._condition.notify()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def close(self):
+        """
+        Stop worker threads once requests that are already enqueued are predicted
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get batch size and queue wait statistics
+
+        :return: statistics
+        """
+        with self._stats_lock:
+            batches = self._batches or 1
+            return {
+                'batches': self._batches,
+                'requests': self._requests,
+                'rows': self._rows,
+                'mean_batch_rows': self._rows / batches,
+                'max_batch_rows': self._max_batch_rows,
+                'mean_batch_requests': self._requests / batches,
+                'mean_queue_wait_ms': self._queue_wait_sum / (self._requests or 1) * 1000,
+                'max_queue_wait_ms': self._queue_wait_max * 1000,
+            }
+
+    def _next_batch(self) -> List[_BatchRequest]:
+        """
+        Wait for requests and take batch of compatible requests from the queue head
+
+        :return: requests of a batch, empty if batcher is closed
+        """
+        with self._condition:
+            while not self._pending:
+                if self._closed:
+                    return []
+                self._condition.wait()
+
+            first = self._pending.popleft()
+            batch = [first]
+            rows = len(first.input_df)
+            key = _batch_key(first.input_df)
+            deadline = first.enqueued_at + self._max_wait
+
+            while rows < self._max_batch_size:
+                if self._pending:
+                    head = self._pending[0]
+                    if _batch_key(head.input_df) != key or rows + len(head.input_df) > self._max_batch_size:
+                        break
+
+                    batch.append(self._pending.popleft())
+                    rows += len(head.input_df)
+                    continue
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._closed:
+                    break
+                self._condition.wait(remaining)
+
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._record(batch)
+
+            try:
+                if len(batch) == 1:
+                    # Result of single request is returned as is, like without batching
+                    batch[0].result = self._predict_func(batch[0].input_df)
+                else:
+                    input_df = pd.concat([request.input_df for request in batch], ignore_index=True)
+                    result, result_columns = self._predict_func(input_df)
+
+                    if len(result) != len(input_df):
+                        raise ValueError(f'Model returned {len(result)} rows for batch of {len(input_df)} rows')
+
+                    offsets = np.cumsum([len(request.input_df) for request in batch])[:-1]
+                    for request, request_result in zip(batch, np.split(result, offsets)):
+                        request.result = request_result, result_columns
+            except Exception as predict_error:
+                for request in batch:
+                    request.error = predict_error
+
+            for request in batch:
+                request.done.set()
+
+    def _record(self, batch: List[_BatchRequest]):
+        dispatched_at = time.perf_counter()
+        rows = sum(len(request.input_df) for request in batch)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._rows += rows
+            self._max_batch_rows = max(self._max_batch_rows, rows)
+            for request in batch:
+                queue_wait = dispatched_at - request.enqueued_at
+                self._queue_wait_sum += queue_wait
+                self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+
+
+def _batch_key(input_df: pd.DataFrame) -> Tuple[Tuple[Any, ...], Tuple[Any, ...]]:
+    """
+    Requests can be batched together only if they have the same columns and dtypes
+
+    :param input_df: data for prediction
+    :return: batch compatibility key
+    """
+    return tuple(input_df.columns), tuple(input_df.dtypes)
+
+
+def batching_stats() -> Optional[Dict[str, float]]:
+    """
+    Get batch size and queue wait statistics of batching engine
+
+    :return: statistics or None if batching is disabled
+    """
+    if BATCHER is None:
+        return None
+    return BATCHER.stats()
+
+
+class _PredictionCache:
+    """
+    LRU cache of predicted rows with memory budget and optional time to live
+    """
+
+    # Approximate memory taken by key and bookkeeping of each entry
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes: int, ttl: float = 0):
+        """
+        :param max_bytes: memory budget in bytes
+        :param ttl: time to live of entries in seconds, entries do not expire if 0
+        """
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_many(self, keys: List[Tuple[int, ...]]) -> Tuple[List[Optional[np.ndarray]], Tuple[str, ...]]:
+        """
+        Find cached rows
+
+        :param keys: keys of rows
+        :return: cached row or None for every key and result column names of cached rows
+        """
+        now = time.monotonic()
+        rows: List[Optional[np.ndarray]] = []
+        result_columns: Tuple[str, ...] = ()
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] and entry[2] < now:
+                    self._remove(key)
+                    entry = None
+
+                if entry is None:
+                    self._misses += 1
+                    rows.append(None)
+                else:
+                    self._hits += 1
+                    self._entries.move_to_end(key)
+                    rows.append(entry[0])
+                    result_columns = entry[1]
+
+        return rows, result_columns
+
+    def put_many(self, keys: List[Tuple[int, ...]], result: np.ndarray, result_columns: Tuple[str, ...]):
+        """
+        Store predicted rows, least recently used rows are evicted to fit into memory budget
+
+        :param keys: keys of rows
+        :param result: predicted rows
+        :param result_columns: result column names
+        """
+        expires_at = time.monotonic() + self._ttl if self._ttl else 0
+
+        with self._lock:
+            for key, row in zip(keys, result):
+                # Copy row, so the whole result matrix is not kept alive by the view
+                row = np.array(row)
+                size = row.nbytes + self.ENTRY_OVERHEAD
+                if size > self._max_bytes:
+                    continue
+
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (row, result_columns, expires_at, size)
+                self._bytes += size
+
+            while self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get hit rate and memory usage statistics
+
+        :return: statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': self._evictions,
+            }
+
+    def _remove(self, key: Tuple[int, ...]):
+        self._bytes -= self._entries.pop(key)[3]
+
+
+def _row_keys(input_df: pd.DataFrame) -> List[Tuple[int, ...]]:
+    """
+    Hash every row of DataFrame. Two 64-bit hashes make collisions negligible
+
+    :param input_df: data for prediction
+    :return: key of every row
+    """
+    schema_key = hash(_batch_key(input_df))
+    first = pd.util.hash_pandas_object(input_df, index=False).to_numpy().tolist()
+    second = pd.util.hash_pandas_object(input_df, index=False, hash_key='odahuflow-model0').to_numpy().tolist()
+
+    return [(schema_key, first_hash, second_hash) for first_hash, second_hash in zip(first, second)]
+
+
+def cache_stats() -> Optional[Dict[str, float]]:
+    """
+    Get hit rate and memory usage statistics of prediction cache
+
+    :return: statistics or None if caching is disabled
+    """
+    if CACHE is None:
+        return None
+    return CACHE.stats()
+
+
+class _LatencyHistogram:
+    """
+    Histogram of latencies with exponential buckets from 10us to ~20 minutes
+    """
+
+    BOUNDS = tuple(0.00001 * 2 ** power for power in range(27))
+
+    __slots__ = ('count', 'sum', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        # The last bucket is for values above the last bound
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate percentile as upper bound of bucket where it falls
+
+        :param fraction: percentile as a fraction, e.g. 0.99
+        :return: latency in seconds
+        """
+        threshold = fraction * self.count
+        accumulated = 0
+        for index, bucket in enumerate(self.buckets):
+            accumulated += bucket
+            if accumulated >= threshold and accumulated > 0:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+class _StageMetrics:
+    """
+    Latency histograms of prediction stages
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, _LatencyHistogram] = collections.defaultdict(_LatencyHistogram)
+
+    def observe(self, stage: str, value: float):
+        with self._lock:
+            self._histograms[stage].observe(value)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: histogram.summary() for stage, histogram in self._histograms.items()}
+
+
+def _clock() -> Optional[float]:
+    """
+    Get start time of a stage
+
+    :return: current time or None if metrics are disabled
+    """
+    return time.perf_counter() if METRICS is not None else None
+
+
+def _observe(stage: str, started_at: float) -> float:
+    """
+    Record latency of a stage
+
+    :param stage: name of stage
+    :param started_at: start time of stage
+    :return: current time, start time of the next stage
+    """
+    now = time.perf_counter()
+    METRICS.observe(stage, now - started_at)
+    return now
+
+
+def metrics() -> Optional[Dict[str, Any]]:
+    """
+    Get latency histograms (count, sum, p50, p95, p99 and max in seconds) of prediction stages:
+    dataframe - building DataFrame, align - aligning it with model's schema,
+    predict - model invocation, result - conversion of model's output, total - whole request.
+    Batching and cache statistics are included if they are enabled
+
+    :return: metrics or None if metrics are disabled
+    """
+    if METRICS is None:
+        return None
+
+    report: Dict[str, Any] = {'stages': METRICS.summary()}
+    if BATCHER is not None:
+        report['batching'] = BATCHER.stats()
+    if CACHE is not None:
+        report['cache'] = CACHE.stats()
+    return report
+
+
+class _ReplicaSlot:
+    """
+    Connection to model replica process and shared memory buffers for its inputs and outputs
+    """
+
+    __slots__ = ('process', 'connection', 'input_buffer', 'output_buffer')
+
+    def __init__(self, process: multiprocessing.Process, connection):
+        self.process = process
+        self.connection = connection
+        self.input_buffer = None
+        self.output_buffer = None
+
+
+class _ModelReplicaPool:
+    """
+    Pool of worker processes, each with its own model replica.
+    Requests are routed to idle replicas. Numeric inputs and outputs are passed through shared memory
+    """
+
+    def __init__(self, loader, plan: _SchemaPlan, replicas: int, start_method: str = 'spawn'):
+        """
+        :param loader: picklable function that loads model in replica process
+        :param plan: model's schema plan
+        :param replicas: number of replica processes
+        :param start_method: multiprocessing start method
+        """
+        self._context = multiprocessing.get_context(start_method)
+        self._loader = loader
+        self._plan = plan
+
+        # Idle replicas, None means that none of replicas is alive
+        self._idle: queue.Queue = queue.Queue()
+        self._slots: List[_ReplicaSlot] = []
+        self._lock = threading.Lock()
+
+        for index in range(replicas):
+            self._slots.append(_ReplicaSlot(*self._start_process(f'odahuflow-model-replica-{index}')))
+
+        for slot in self._slots:
+            try:
+                self._wait_ready(slot)
+            except RuntimeError:
+                self.close()
+                raise
+
+            self._idle.put(slot)
+
+    def _start_process(self, name: str) -> Tuple[multiprocessing.Process, Any]:
+        """
+        Start replica process
+
+        :param name: name of process
+        :return: process and connection to it
+        """
+        connection, child_connection = self._context.Pipe()
+        process = self._context.Process(target=_replica_main, args=(child_connection, self._loader, self._plan),
+                                        name=name, daemon=True)
+        process.start()
+        child_connection.close()
+        return process, connection
+
+    @staticmethod
+    def _wait_ready(slot: _ReplicaSlot):
+        """
+        Wait until replica loads model
+
+        :param slot: replica slot
+        """
+        try:
+            status, payload = slot.connection.recv()
+        except EOFError:
+            status, payload = 'error', f'process exited with code {slot.process.exitcode}'
+
+        if status != 'ready':
+            raise RuntimeError(f'Model replica {slot.process.name} failed to start: {payload}')
+
+    def _respawn(self, slot: _ReplicaSlot):
+        """
+        Replace dead replica process with a new one. Slot is returned to the pool if replica starts,
+        otherwise it is dropped and waiting requests are failed once none of replicas is alive
+
+        :param slot: slot of dead replica
+        """
+        slot.connection.close()
+        if slot.process.is_alive():
+            slot.process.terminate()
+        slot.process.join(timeout=5)
+
+        slot.process, slot.connection = self._start_process(slot.process.name)
+        try:
+            self._wait_ready(slot)
+        except RuntimeError:
+            slot.connection.close()
+            slot.process.join(timeout=5)
+            with self._lock:
+                self._slots.remove(slot)
+                if not self._slots:
+                    self._idle.put(None)
+            for buffer in (slot.input_buffer, slot.output_buffer):
+                _release_buffer(buffer)
+            raise
+
+        self._idle.put(slot)
+
+    def predict(self, input_df: pd.DataFrame) -> Tuple[np.ndarray, Tuple[str, ...]]:
+        """
+        Make prediction on idle replica. Replica that died during prediction is respawned
+
+        :param input_df: data for prediction
+        :return: result matrix as np.array[np.array[Any]] and result column names
+        """
+        slot: Optional[_ReplicaSlot] = self._idle.get()
+        if slot is None:
+            # Wake up next waiting request
+            self._idle.put(None)
+            raise RuntimeError('None of model replicas is alive')
+
+        try:
+            input_message = _pack_frame(slot, input_df)
+        except Exception:
+            # Replica is not touched, e.g. shared memory could not be allocated
+            self._idle.put(slot)
+            raise
+
+        try:
+            slot.connection.send(('predict', input_message, _buffer_name(slot.output_buffer)))
+            status, payload = slot.connection.recv()
+        except (EOFError, OSError) as connection_error:
+            name = slot.process.name
+            try:
+                self._respawn(slot)
+            except RuntimeError as respawn_error:
+                raise RuntimeError(f'Model replica {name} is not available') from respawn_error
+            raise RuntimeError(f'Model replica {name} is not available') from connection_error
+
+        try:
+            if status != 'ok':
+                raise RuntimeError(f'Model replica {slot.process.name} failed: {payload}')
+
+            result, result_columns = payload
+            if result[0] == 'shm':
+                _, shape, dtype = result
+                result = np.ndarray(shape, dtype=dtype, buffer=slot.output_buffer.buf).copy()
+            else:
+                result = result[1]
+                # Grow output buffer, so next result of the same size is passed through shared memory
+                if _is_numeric_array(result) and shared_memory is not None:
+                    slot.output_buffer = _ensure_buffer(slot.output_buffer, result.nbytes)
+
+            return result, result_columns
+        finally:
+            self._idle.put(slot)
+
+    def pids(self) -> List[int]:
+        """
+        Get PIDs of replica processes
+
+        :return: PIDs
+        """
+        return [slot.process.pid for slot in self._slots]
+
+    def close(self):
+        """
+        Stop replica processes and release shared memory
+        """
+        for slot in self._slots:
+            try:
+                slot.connection.send(None)
+            except OSError:
+                pass
+            slot.process.join(timeout=5)
+            if slot.process.is_alive():
+                slot.process.terminate()
+
+            for buffer in (slot.input_buffer, slot.output_buffer):
+                _release_buffer(buffer)
+            slot.input_buffer = slot.output_buffer = None
+
+
+def _prefork_replicas(plan: _SchemaPlan, replicas: int) -> _ModelReplicaPool:
+    """
+    Fork replicas from current process, so model loaded here is shared through copy-on-write pages
+
+    :param plan: model's schema plan
+    :param replicas: number of replica processes
+    :return: pool of replicas
+    """
+    # Warm up caches, so they are computed once and shared too
+    info()
+
+    # Objects that survived until now are moved to permanent generation,
+    # so garbage collection in replicas does not touch (and copy) their pages
+    gc.collect()
+    if not hasattr(gc, 'freeze'):
+        return _ModelReplicaPool(_inherited_model, plan, replicas=replicas, start_method='fork')
+
+    gc.freeze()
+    try:
+        return _ModelReplicaPool(_inherited_model, plan, replicas=replicas, start_method='fork')
+    finally:
+        # Replicas keep their copy of permanent generation, parent collects its objects as usual
+        gc.unfreeze()
+
+
+def _inherited_model():
+    """
+    Model loader for forked replicas, model is already in memory
+
+    :return: model loaded by parent process
+    """
+    return MODEL_FLAVOR
+
+
+def _process_memory(pid: int) -> Dict[str, Optional[int]]:
+    """
+    Get memory usage of process from /proc/<pid>/smaps_rollup (Linux only)
+
+    :param pid: process ID
+    :return: RSS, PSS, unique (private) and shared RSS in bytes. Values are None if they can not be read
+    """
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Private_Clean': 'unique', 'Private_Dirty': 'unique',
+              'Shared_Clean': 'shared', 'Shared_Dirty': 'shared'}
+    memory: Dict[str, Optional[int]] = {'pid': pid, 'rss': None, 'pss': None, 'unique': None, 'shared': None}
+
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as smaps:
+            lines = smaps.readlines()
+    except OSError:
+        return memory
+
+    for line in lines:
+        name, _, value = line.partition(':')
+        if name in fields:
+            key = fields[name]
+            # Values are reported in kB
+            memory[key] = (memory[key] or 0) + int(value.split()[0]) * 1024
+
+    return memory
+
+
+def replicas_memory() -> Optional[List[Dict[str, Optional[int]]]]:
+    """
+    Get memory report for current process and every model replica.
+    Unique RSS shows memory which is not shared with other processes
+
+    :return: memory report or None if replicas are disabled
+    """
+    if REPLICAS is None:
+        return None
+    return [_process_memory(pid) for pid in [os.getpid()] + REPLICAS.pids()]
+
+
+def _is_numeric_array(array: Any) -> bool:
+    return isinstance(array, np.ndarray) and array.dtype.kind in 'biufc'
+
+
+def _buffer_name(buffer) -> Optional[str]:
+    return buffer.name if buffer is not None else None
+
+
+def _ensure_buffer(buffer, size: int):
+    """
+    Get shared memory buffer of at least provided size. Buffer is reallocated if it is too small
+
+    :param buffer: current buffer or None
+    :param size: required size in bytes
+    :return: buffer
+    """
+    if buffer is not None and buffer.size >= size:
+        return buffer
+
+    if buffer is not None:
+        # Grow geometrically to avoid reallocation on every slightly bigger request
+        size = max(size, 2 * buffer.size)
+        _release_buffer(buffer)
+
+    return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+
+def _release_buffer(buffer):
+    if buffer is not None:
+        buffer.close()
+        buffer.unlink()
+
+
+def _pack_frame(slot: _ReplicaSlot, input_df: pd.DataFrame) -> Tuple[Any, ...]:
+    """
+    Put DataFrame into replica's input buffer. Non numeric DataFrames are pickled
+
+    :param slot: replica slot
+    :param input_df: data for prediction
+    :return: message that describes location of data
+    """
+    dtypes = list(input_df.dtypes)
+    if shared_memory is None or not all(isinstance(dtype, np.dtype) and dtype.kind in 'biufc' for dtype in dtypes):
+        return ('pickle', input_df)
+
+    rows = len(input_df)
+    columns = tuple(input_df.columns)
+
+    if len(set(dtypes)) == 1:
+        # Single block is stored column by column, so replica wraps it into DataFrame without copying
+        dtype = dtypes[0]
+        slot.input_buffer = _ensure_buffer(slot.input_buffer, dtype.itemsize * rows * len(columns))
+        block = np.ndarray((len(columns), rows), dtype=dtype, buffer=slot.input_buffer.buf)
+        block[:] = input_df.to_numpy(dtype=dtype).T
+        return ('block', slot.input_buffer.name, rows, columns, dtype.str)
+
+    layout = []
+    offset = 0
+    for dtype in dtypes:
+        layout.append((dtype.str, offset))
+        # Keep every column aligned to 8 bytes
+        offset += -(-dtype.itemsize * rows // 8) * 8
+
+    slot.input_buffer = _ensure_buffer(slot.input_buffer, offset)
+    for position, (dtype, column_offset) in enumerate(layout):
+        column = np.ndarray((rows,), dtype=dtype, buffer=slot.input_buffer.buf, offset=column_offset)
+        column[:] = input_df.iloc[:, position].to_numpy()
+
+    return ('columns', slot.input_buffer.name, rows, columns, tuple(layout))
+
+
+def _unpack_frame(message: Tuple[Any, ...], buffers: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Build DataFrame from message created by _pack_frame
+
+    :param message: message that describes location of data
+    :param buffers: shared memory buffers attached by replica, by name
+    :return: data for prediction
+    """
+    if message[0] == 'pickle':
+        return message[1]
+
+    kind, name, rows, columns, layout = message
+    buffer = _attach_buffer(buffers, name)
+
+    if kind == 'block':
+        block = np.ndarray((len(columns), rows), dtype=layout, buffer=buffer.buf)
+        return pd.DataFrame(block.T, columns=list(columns), copy=False)
+
+    input_df = pd.DataFrame({
+        position: np.ndarray((rows,), dtype=dtype, buffer=buffer.buf, offset=offset)
+        for position, (dtype, offset) in enumerate(layout)
+    }, copy=False)
+    # Columns are positions first, names may repeat. set_axis is not used: it works in place on pandas < 1.0
+    input_df.columns = list(columns)
+    return input_df
+
+
+def _attach_buffer(buffers: Dict[str, Any], name: str):
+    """
+    Attach shared memory buffer by name. Buffers which are replaced by parent process are detached
+
+    :param buffers: shared memory buffers attached by replica, by name
+    :param name: name of buffer
+    :return: buffer
+    """
+    if name not in buffers:
+        for stale_name in list(buffers):
+            try:
+                buffers.pop(stale_name).close()
+            except BufferError:
+                # DataFrame of previous request is still alive, buffer is released with it
+                pass
+        buffers[name] = shared_memory.SharedMemory(name=name)
+    return buffers[name]
+
+
+def _replica_main(connection, loader, plan: _SchemaPlan):
+    """
+    Entrypoint of model replica process
+
+    :param connection: connection to parent process
+    :param loader: function that loads model
+    :param plan: model's schema plan
+    """
+    global MODEL_FLAVOR
+    try:
+        MODEL_FLAVOR = loader()
+    except Exception as load_error:
+        connection.send(('error', f'{type(load_error).__name__}: {load_error}'))
+        return
+
+    connection.send(('ready', os.getpid()))
+
+    input_buffers: Dict[str, Any] = {}
+    output_buffers: Dict[str, Any] = {}
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        _, input_message, output_name = message
+        try:
+            result, result_columns = _model_predict(_unpack_frame(input_message, input_buffers), plan)
+        except Exception as predict_error:
+            connection.send(('error', f'{type(predict_error).__name__}: {predict_error}'))
+            continue
+
+        if output_name is not None and _is_numeric_array(result):
+            output_buffer = _attach_buffer(output_buffers, output_name)
+            if result.nbytes <= output_buffer.size:
+                np.ndarray(result.shape, dtype=result.dtype, buffer=output_buffer.buf)[...] = result
+                connection.send(('ok', (('shm', result.shape, result.dtype.str), result_columns)))
+                continue
+
+        connection.send(('ok', (('pickle', result), result_columns)))
+
+
+@functools.lru_cache()
+def _schema_file() -> Optional[Dict[str, Any]]:
+    """
+    Internal function for getting precomputed schema of input and output samples
+
+    :return: schema if provided
+    """
+    if os.path.exists(MODEL_SCHEMA_FILE):
+        with open(MODEL_SCHEMA_FILE, encoding='utf-8') as schema_file:
+            return json.load(schema_file)
+    else:
+        return None
+
+
 @functools.lru_cache()
 def _input_df_sample() -> Optional[pd.DataFrame]:
     """
@@ -175,7 +1589,37 @@ def info() -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
 
     :return: OpenAPI specifications. Each specification is assigned as (input / output)
     """
+    schema = _schema_file()
+    if schema is not None:
+        return _strip_dtypes(schema['input']), _strip_dtypes(schema['output'])
+
     input_sample = _input_df_sample()
     output_sample = _output_df_sample()
 
     return _extract_df_properties(input_sample), _extract_df_properties(output_sample)
+
+
+def _strip_dtypes(schema: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Convert schema stored in schema file to OpenAPI specification
+
+    :param schema: schema of sample
+    :return: OpenAPI specification for parameters (each columns is parameter)
+    """
+    return [{key: value for key, value in prop.items() if key != 'dtype'} for prop in schema or ()]
+
+
+def build_schema(input_sample: Optional[pd.DataFrame], output_sample: Optional[pd.DataFrame]) -> Dict[str, Any]:
+    """
+    Build content of schema file from input and output samples
+
+    :param input_sample: input sample if provided
+    :param output_sample: output sample if provided
+    :return: schema of samples, serializable to JSON
+    """
+    def sample_schema(df: Optional[pd.DataFrame]) -> Optional[List[Dict[str, Any]]]:
+        if df is None:
+            return None
+        return [dict(prop, dtype=str(dtype)) for prop, dtype in zip(_extract_df_properties(df), df.dtypes)]
+
+    return {'input': sample_schema(input_sample), 'output': sample_schema(output_sample)}
@@ -17,4 +17,6 @@ import typing
 
 
 class MLFlowWrapperOutput(typing.NamedTuple):
-    run_id: str
+    run_id: typing.Optional[str]
+    # Error of failed run, it is sent by wrapper server only
+    error: typing.Optional[str] = None
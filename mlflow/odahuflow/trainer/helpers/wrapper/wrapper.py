@@ -21,6 +21,8 @@ Because the wrapper only must requires the Python STD library and MLFlow depende
 import argparse
 import json
 import logging
+import os
+import socketserver
 import sys
 from typing import Any, Dict
 
@@ -33,6 +35,28 @@ import mlflow.projects
 import mlflow.pyfunc
 import mlflow.tracking
 
+def check_mlflow_version():
+    logging.debug('Validating MLflow version')
+    try:
+        pkg_resources_require('mlflow >= 1.0, <2.0')
+    except VersionConflict as error:
+        raise ImportError(f'Unsupported version: {error.dist}. Please use {error.req}') from None
+
+
+def run_project(mlflow_input: Dict[str, Any]) -> MLFlowWrapperOutput:
+    """
+    Run mlflow project
+
+    :param mlflow_input: parameters of mlflow.projects.run function
+    :return: MLFlow output
+    """
+    logging.debug('Running mlflow project')
+    run = mlflow.projects.run(
+        **mlflow_input
+    )
+    return MLFlowWrapperOutput(run_id=run.run_id)
+
+
 def work(input_file_path: str, output_file_path: str):
     """
     Launch mlflow run process
@@ -40,38 +64,87 @@ def work(input_file_path: str, output_file_path: str):
     :param input_file_path: file with MLFlow input parameters
     :param output_file_path: file where MLFlow output will be stored
     """
-    logging.debug('Validating MLflow version')
-    try:
-        pkg_resources_require('mlflow >= 1.0, <2.0')
-    except VersionConflict as error:
-        raise ImportError(f'Unsupported version: {error.dist}. Please use {error.req}') from None
+    check_mlflow_version()
 
     logging.debug("Reading mlflow input parameters")
     with open(input_file_path, encoding='utf-8') as f:
         mlflow_input: Dict[str, Any] = json.load(f)
 
-    logging.debug('Running mlflow project')
-    run = mlflow.projects.run(
-        **mlflow_input
-    )
+    output = run_project(mlflow_input)
 
     with open(output_file_path, 'w', encoding='utf-8') as f:
-        json.dump(MLFlowWrapperOutput(run_id=run.run_id)._asdict(), f)
+        json.dump(output._asdict(), f)
+
+
+class _WrapperServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _WrapperRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one JSON line request: {"input": <mlflow.projects.run parameters>} or {"shutdown": true}.
+    Response is JSON line of MLFlowWrapperOutput, its error is set if run failed
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line.strip():
+            # Readiness probe connects and closes connection without request
+            return
+        request = json.loads(line)
+
+        if request.get('shutdown'):
+            self._respond(MLFlowWrapperOutput(run_id=None))
+            # Handler runs in its own thread, so serving loop can be stopped from here
+            self.server.shutdown()
+            return
+
+        try:
+            output = run_project(request['input'])
+        except Exception as error:
+            logging.exception('Exception occurs during model training')
+            output = MLFlowWrapperOutput(run_id=None, error=f'{type(error).__name__}: {error}')
+        self._respond(output)
+
+    def _respond(self, output: MLFlowWrapperOutput):
+        self.wfile.write(json.dumps(output._asdict()).encode('utf-8') + b'\n')
+
+
+def serve(socket_path: str):
+    """
+    Serve mlflow runs on unix socket until shutdown request, so conda activation and MLflow import are paid once.
+    Concurrent requests are run concurrently
+
+    :param socket_path: path to unix socket
+    """
+    check_mlflow_version()
+
+    with _WrapperServer(socket_path, _WrapperRequestHandler) as server:
+        logging.info(f'Serving MLflow runs on {socket_path}')
+        server.serve_forever()
+    os.unlink(socket_path)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", type=str, required=True,
+    parser.add_argument("--input", type=str,
                         help="json/yaml file with a mode training resource")
-    parser.add_argument("--output", type=str, required=True,
+    parser.add_argument("--output", type=str,
                         help="json/yaml file with a mode training resource")
+    parser.add_argument("--serve", type=str, metavar="SOCKET",
+                        help="serve runs on unix socket instead of running single one from --input file")
     args = parser.parse_args()
+    if not args.serve and not (args.input and args.output):
+        parser.error("--input and --output are required unless --serve is set")
 
     # Setup logging
     logging.basicConfig(level=logging.DEBUG)
 
     try:
-        work(args.input, args.output)
+        if args.serve:
+            serve(args.serve)
+        else:
+            work(args.input, args.output)
     except Exception:
         logging.exception('Exception occurs during model training')
         sys.exit(2)
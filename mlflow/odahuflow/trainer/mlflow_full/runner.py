@@ -18,8 +18,9 @@ import logging
 import sys
 
 from odahuflow.trainer.helpers.log import setup_logging
-from odahuflow.trainer.helpers.mlflow_helper import parse_model_training_entity, train_models, save_models, \
-    get_or_create_experiment
+from odahuflow.trainer.helpers.mlflow_helper import parse_model_training_entity, prepare_training, train_models, \
+    save_models
+from odahuflow.trainer.helpers.sweep import read_sweep, run_sweep
 
 
 def main():
@@ -29,6 +30,16 @@ def main():
                         help="json/yaml file with a mode training resource")
     parser.add_argument("--target", type=str, default='mlflow_output',
                         help="directory where result model will be saved")
+    parser.add_argument("--model-path", type=str,
+                        help="path of model relative to run artifacts, required if run logged several models")
+    parser.add_argument("--artifact-location", type=str, default='/ml_experiment',
+                        help="artifact location of created experiment, local or remote (http, s3, ...) URI. "
+                             "Default location of tracking server is used if empty")
+    parser.add_argument("--force-solve", action='store_true',
+                        help="solve conda dependencies again, ignoring cached environment and lock files")
+    parser.add_argument("--sweep", type=str,
+                        help="json/yaml file with grid or list of hyper parameter sets and metric. "
+                             "Runs are run in parallel and the best one is saved")
     args = parser.parse_args()
 
     # Setup logging
@@ -36,16 +47,22 @@ def main():
     try:
         # Parse ModelTraining entity
         model_training = parse_model_training_entity(args.mt_file).model_training
+        # Sweep file is read before long setup stages, so its errors are reported at once
+        sweep = read_sweep(args.sweep) if args.sweep else None
 
-        # Force local artifact location to copy local artifacts to GPPI archive
-        experiment_id = get_or_create_experiment(model_training.spec.model.name,
-                                                 artifact_location='/ml_experiment')
+        # Local artifact location is used by default, remote artifacts are downloaded to build GPPI archive.
+        # Experiment is looked up while conda environment is updated
+        experiment_id = prepare_training(model_training, artifact_location=args.artifact_location or None,
+                                         force_solve=args.force_solve)
 
         # Start MLflow training process
-        mlflow_run_id = train_models(model_training, experiment_id=experiment_id)
+        if sweep:
+            mlflow_run_id = run_sweep(model_training, experiment_id, sweep)
+        else:
+            mlflow_run_id = train_models(model_training, experiment_id=experiment_id)
 
         # Save MLflow models as odahuflow artifact
-        save_models(mlflow_run_id, model_training, args.target)
+        save_models(mlflow_run_id, model_training, args.target, args.model_path)
     except Exception as e:
         error_message = f'Exception occurs during model training. Message: {e}'
 
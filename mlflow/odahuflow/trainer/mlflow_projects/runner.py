@@ -14,6 +14,7 @@
 #    limitations under the License.
 #
 import argparse
+import functools
 import logging
 import os
 import shutil
@@ -23,12 +24,32 @@ import tempfile
 import yaml
 from odahuflow.sdk.models import ModelTraining
 from odahuflow.trainer.helpers.log import setup_logging
-from odahuflow.trainer.helpers.fs import copytree
-from odahuflow.trainer.helpers.mlflow_helper import parse_model_training_entity, train_models, get_or_create_experiment
+from odahuflow.trainer.helpers.fs import copytree, SYNC_MANIFEST_FILE_NAME
+from odahuflow.trainer.helpers.mlflow_helper import parse_model_training_entity, prepare_training, train_models
 
 OUTPUT_DIR = "ODAHUFLOW_OUTPUT_DIR"
 STATIC_ARTIFACTS_DIR = "STATIC_ARTIFACTS_DIR"
 ODAHUFLOW_PROJECT_DESCRIPTION = "odahuflow.project.yaml"
+STATIC_ARTIFACTS_STAGE = "static artifacts copy"
+
+
+def copy_static_artifacts(model_training: ModelTraining, output_dir: str):
+    """
+    Copy content of STATIC_ARTIFACTS_DIR directory of project to output directory
+    """
+    static_artifacts_dir = os.environ.get(STATIC_ARTIFACTS_DIR)
+    logging.info(f'Static artifacts directory: {static_artifacts_dir}')
+    if not static_artifacts_dir:
+        return
+
+    static_artifacts_dir = os.path.join(model_training.spec.work_dir, static_artifacts_dir)
+    # Copy STATIC_ARTIFACTS_DIR content to output destination
+    if os.path.isdir(static_artifacts_dir):
+        logging.info(f'Copying content of static artifacts dir {static_artifacts_dir} '
+                     f'to output dir {output_dir}')
+        copytree(static_artifacts_dir, output_dir)
+    else:
+        logging.error(f'Path not found or not a directory: {static_artifacts_dir}')
 
 
 def create_project_file(model_training: ModelTraining, project_file_path: str, mlflow_run_id: str):
@@ -51,6 +72,10 @@ def main():
                         help="json/yaml file with a mode training resource")
     parser.add_argument("--target", type=str, default='mlflow_output',
                         help="directory where result model will be saved")
+    parser.add_argument("--incremental", action='store_true',
+                        help="copy only files that are changed since previous training to target directory")
+    parser.add_argument("--force-solve", action='store_true',
+                        help="solve conda dependencies again, ignoring cached environment and lock files")
     args = parser.parse_args()
 
     # Setup logging
@@ -63,19 +88,10 @@ def main():
         # Parse ModelTraining entity
         model_training = parse_model_training_entity(args.mt_file).model_training
 
-        static_artifacts_dir = os.environ.get(STATIC_ARTIFACTS_DIR)
-        logging.info(f'Static artifacts directory: {static_artifacts_dir}')
-        if static_artifacts_dir:
-            static_artifacts_dir = os.path.join(model_training.spec.work_dir, static_artifacts_dir)
-            # Copy STATIC_ARTIFACTS_DIR content to output destination
-            if os.path.isdir(static_artifacts_dir):
-                logging.info(f'Copying content of static artifacts dir {static_artifacts_dir} '
-                             f'to output dir {output_dir}')
-                copytree(static_artifacts_dir, output_dir)
-            else:
-                logging.error(f'Path not found or not a directory: {static_artifacts_dir}')
-
-        experiment_id = get_or_create_experiment(model_training.spec.model.name)
+        # Experiment lookup, conda update and static artifacts copy do not depend on each other
+        experiment_id = prepare_training(model_training, force_solve=args.force_solve, stages={
+            STATIC_ARTIFACTS_STAGE: functools.partial(copy_static_artifacts, model_training, output_dir),
+        })
 
         # Start MLflow training process
         mlflow_run_id = train_models(model_training, experiment_id=experiment_id)
@@ -88,7 +104,9 @@ def main():
         logging.info('Preparing target directory')
         if not os.path.exists(args.target):
             os.makedirs(args.target)
-        copytree(output_dir, args.target)
+        # Output directory is removed right after copying, so its files can be linked instead of copied
+        sync_manifest = os.path.join(args.target, SYNC_MANIFEST_FILE_NAME) if args.incremental else None
+        copytree(output_dir, args.target, link=True, manifest=sync_manifest)
 
         # rm temp directory
         shutil.rmtree(output_dir)
@@ -62,10 +62,14 @@ setup(
             'odahu-flow-mlflow-project-runner=odahuflow.trainer.mlflow_projects.runner:main',
             'odahu-flow-mlflow-wrapper=odahuflow.trainer.helpers.wrapper.wrapper:main',
             'odahu-flow-mlflow-gppi-converter=odahuflow.trainer.helpers.mlflow_helper:mlflow_to_gppi_cli',
+            'odahu-flow-mlflow-gppi-batch-converter=odahuflow.trainer.helpers.batch:main',
         ],
     },
     install_requires=requirements,
     extras_require={
+        'zstd': [
+            'zstandard>=0.16.0'
+        ],
         'testing': [
             'pytest>=5.1.2',
             'pytest-mock>=1.10.4',
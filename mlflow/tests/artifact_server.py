@@ -0,0 +1,100 @@
+import http.server
+import json
+import os
+import re
+import threading
+from urllib import parse
+
+ARTIFACTS_ENDPOINT = '/api/2.0/mlflow-artifacts/artifacts'
+
+
+class ArtifactServer(http.server.ThreadingHTTPServer):
+    """
+    Stand-in of MLflow artifact proxy: lists directories and serves files with range requests
+    unless `ranges` is unset. The first response for every file listed in `broken_files` is cut in the middle
+    """
+
+    def __init__(self, root: str):
+        super().__init__(('127.0.0.1', 0), _ArtifactHandler)
+        self.root = root
+        self.broken_files = set()
+        self.ranges = True
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def artifact_uri(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}{ARTIFACTS_ENDPOINT}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class _ArtifactHandler(http.server.BaseHTTPRequestHandler):
+    server: ArtifactServer
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+    def do_HEAD(self):  # pylint: disable=C0103
+        path = self._local_path()
+        self.send_response(200)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+
+    def do_GET(self):  # pylint: disable=C0103
+        url = parse.urlparse(self.path)
+        self.server.requests.append((url.path, self.headers.get('Range')))
+
+        if url.path == ARTIFACTS_ENDPOINT:
+            self._list(parse.parse_qs(url.query).get('path', [''])[0])
+        else:
+            self._send_file()
+
+    def _local_path(self) -> str:
+        relative_path = parse.unquote(parse.urlparse(self.path).path)[len(ARTIFACTS_ENDPOINT):].lstrip('/')
+        return os.path.join(self.server.root, relative_path)
+
+    def _list(self, relative_path: str):
+        path = os.path.join(self.server.root, relative_path)
+        # Listing of file contains the file itself
+        if os.path.isdir(path):
+            directory, names = path, sorted(os.listdir(path))
+        else:
+            directory, names = os.path.dirname(path), [os.path.basename(path)]
+        files = [{'path': name, 'is_dir': os.path.isdir(os.path.join(directory, name)),
+                  'file_size': os.path.getsize(os.path.join(directory, name))}
+                 for name in names]
+        content = json.dumps({'files': files}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_file(self):
+        path = self._local_path()
+        with open(path, 'rb') as stream:
+            content = stream.read()
+
+        start, end = 0, len(content)
+        match = self.server.ranges and re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+
+        # Probe of range support is not broken
+        if path in self.server.broken_files and end - start > 1:
+            self.server.broken_files.discard(path)
+            self.wfile.write(content[start:start + (end - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(content[start:end])
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from odahuflow.trainer.helpers.archive import CHUNK_SIZE
+from odahuflow.trainer.helpers.templates import entrypoint
+from tests.model_stubs import SumModel
+
+
+@pytest.fixture
+def sum_model(monkeypatch):
+    model = SumModel()
+    monkeypatch.setattr(entrypoint, 'MODEL_FLAVOR', model)
+    return model
+
+
+@pytest.fixture
+def samples(monkeypatch):
+    input_sample = pd.DataFrame({'a': np.array([1], dtype='int64'), 'b': np.array([1.], dtype='float32')})
+    output_sample = pd.DataFrame({'sum': [1.]})
+    monkeypatch.setattr(entrypoint, '_input_df_sample', lambda: input_sample)
+    monkeypatch.setattr(entrypoint, '_output_df_sample', lambda: output_sample)
+    entrypoint._schema_plan.cache_clear()
+    yield input_sample, output_sample
+    entrypoint._schema_plan.cache_clear()
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    source = tmp_path / 'model'
+    (source / 'odahuflow_model' / 'data').mkdir(parents=True)
+    (source / 'odahuflow.project.yaml').write_text('name: model')
+    (source / 'odahuflow_model' / 'MLmodel').write_text('flavors: {}')
+    # Spans several compression chunks
+    (source / 'odahuflow_model' / 'data' / 'weights.bin').write_bytes(os.urandom(2 * CHUNK_SIZE + 1))
+    return source
+
+
+@pytest.fixture
+def mlflow_model_dir(tmp_path):
+    model_path = tmp_path / 'mlflow_model'
+    model_path.mkdir()
+    (model_path / 'MLmodel').write_text(
+        'flavors:\n'
+        '  python_function:\n'
+        '    env: conda.yaml\n'
+        '    loader_module: mlflow.sklearn\n'
+        '    model_path: model.pkl\n'
+    )
+    (model_path / 'conda.yaml').write_text('name: model\ndependencies:\n  - python=3.7\n')
+    (model_path / 'model.pkl').write_bytes(os.urandom(1024))
+    pd.DataFrame({'a': [1], 'b': [1.]}).to_pickle(model_path / entrypoint.MODEL_INPUT_SAMPLE_FILE_NAME)
+    return model_path
@@ -0,0 +1,21 @@
+import pandas as pd
+
+
+class SumModel:
+    """
+    Model stub that sums up all columns of a row
+    """
+
+    def __init__(self):
+        self.inputs = []
+
+    def predict(self, df: pd.DataFrame) -> pd.DataFrame:
+        self.inputs.append(df)
+        return pd.DataFrame({'sum': df.sum(axis=1)})
+
+
+def broken_model():
+    """
+    Model loader stub that fails
+    """
+    raise ValueError('model is broken')
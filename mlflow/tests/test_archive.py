@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import tarfile
+
+import pytest
+
+from odahuflow.trainer.helpers.archive import archive_directory, read_archive_index, verify_archive, ArchiveReader, \
+    ArchiveWriter, ARCHIVE_DIGEST_SUFFIX, ARCHIVE_INDEX_SUFFIX, CHECKSUMS_FILE_NAME, CHUNK_SIZE, GZIP_COMPRESSION, \
+    ZSTD_COMPRESSION
+
+
+def _read_members(tar: tarfile.TarFile):
+    return {member.name: tar.extractfile(member).read() for member in tar.getmembers() if member.isfile()}
+
+
+def _expected_members(source):
+    return {str(path.relative_to(source)): path.read_bytes() for path in source.rglob('*') if path.is_file()}
+
+
+def test_parallel_gzip_archive_is_readable_by_tarfile(model_dir, tmp_path):
+    archive_path = str(tmp_path / 'model.tgz')
+
+    stats = archive_directory(str(model_dir), archive_path, compression=GZIP_COMPRESSION, level=1, threads=4)
+
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        assert _read_members(tar) == _expected_members(model_dir)
+    assert stats.files == 5
+    assert stats.output_bytes == os.path.getsize(archive_path)
+    assert stats.input_bytes > 2 * CHUNK_SIZE
+
+
+def test_zstd_archive(model_dir, tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    archive_path = str(tmp_path / 'model.tar.zst')
+
+    archive_directory(str(model_dir), archive_path, compression=ZSTD_COMPRESSION, threads=2)
+
+    with open(archive_path, 'rb') as archive, \
+            zstandard.ZstdDecompressor().stream_reader(archive) as reader, \
+            tarfile.open(fileobj=reader, mode='r|') as tar:
+        members = {member.name: tar.extractfile(member).read() for member in tar if member.isfile()}
+    assert members == _expected_members(model_dir)
+
+
+def test_incremental_archive_reuses_unchanged_files(model_dir, tmp_path):
+    archive_path = str(tmp_path / 'model.tgz')
+    archive_directory(str(model_dir), archive_path, level=1, threads=4, incremental=True,
+                      exclude=('odahuflow.project.yaml',))
+    (model_dir / 'odahuflow_model' / 'MLmodel').write_text('flavors: {changed: true}')
+
+    stats = archive_directory(str(model_dir), archive_path, level=1, threads=4, incremental=True,
+                              exclude=('odahuflow.project.yaml',))
+
+    expected = _expected_members(model_dir)
+    del expected['odahuflow.project.yaml']
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        assert _read_members(tar) == expected
+    assert stats.reused_files == 1
+    assert {entry['name'] for entry in read_archive_index(archive_path)['entries'] if entry['type'] == 'file'} \
+        == set(expected)
+    assert sorted(os.listdir(tmp_path)) == ['model', 'model.tgz', 'model.tgz.index.json']
+
+
+@pytest.mark.parametrize('compression', [GZIP_COMPRESSION, ZSTD_COMPRESSION])
+def test_indexed_archive_reads_single_entries(model_dir, tmp_path, compression):
+    if compression == ZSTD_COMPRESSION:
+        pytest.importorskip('zstandard')
+    archive_path = str(tmp_path / 'model.tar')
+
+    archive_directory(str(model_dir), archive_path, compression=compression, level=1, threads=4, index=True)
+
+    expected = _expected_members(model_dir)
+    with ArchiveReader(archive_path) as archive:
+        members = archive.members()
+        assert {member.name: archive.read(member.name) for member in members if member.type == 'file'} == expected
+        archive.extract('odahuflow_model/MLmodel', str(tmp_path / 'MLmodel'))
+    assert [member.type for member in members].count('directory') == 2
+    assert (tmp_path / 'MLmodel').read_text() == 'flavors: {}'
+
+
+@pytest.mark.parametrize('compression,index', [(GZIP_COMPRESSION, False), (GZIP_COMPRESSION, True),
+                                               (ZSTD_COMPRESSION, True)])
+def test_archive_checksums_are_verified_in_one_pass(model_dir, tmp_path, compression, index):
+    if compression == ZSTD_COMPRESSION:
+        pytest.importorskip('zstandard')
+    archive_path = tmp_path / 'model.tar'
+
+    stats = archive_directory(str(model_dir), str(archive_path), compression=compression, level=1, threads=4,
+                              index=index, checksums=True)
+
+    expected = _expected_members(model_dir)
+    digests = {name: hashlib.sha256(content).hexdigest() for name, content in expected.items()}
+    assert stats.sha256 == hashlib.sha256(archive_path.read_bytes()).hexdigest()
+    assert (tmp_path / f'model.tar{ARCHIVE_DIGEST_SUFFIX}').read_text() == f'{stats.sha256}  model.tar\n'
+    assert verify_archive(str(archive_path), extract_to=str(tmp_path / 'extracted')) == 3
+    assert json.loads((tmp_path / 'extracted' / CHECKSUMS_FILE_NAME).read_text())['files'] == digests
+    assert (tmp_path / 'extracted' / 'odahuflow_model' / 'MLmodel').read_text() == 'flavors: {}'
+
+
+def test_corrupted_archive_is_not_verified(model_dir, tmp_path):
+    archive_path = tmp_path / 'model.tgz'
+    archive_directory(str(model_dir), str(archive_path), level=1, threads=4, checksums=True)
+    content = bytearray(archive_path.read_bytes())
+    content[len(content) // 2] ^= 0xFF
+    archive_path.write_bytes(bytes(content))
+
+    with pytest.raises(ValueError):
+        verify_archive(str(archive_path))
+
+
+@pytest.mark.parametrize('compression', [GZIP_COMPRESSION, ZSTD_COMPRESSION])
+def test_failed_archiving_leaves_no_archive(model_dir, tmp_path, compression):
+    if compression == ZSTD_COMPRESSION:
+        pytest.importorskip('zstandard')
+    archive_path = tmp_path / 'model.tar'
+
+    with pytest.raises(FileNotFoundError):
+        with ArchiveWriter(str(archive_path), compression, level=1, threads=4, index=True, checksums=True) as archive:
+            archive.add_tree(str(model_dir))
+            archive.add_file(str(tmp_path / 'missing'), 'missing')
+
+    assert not archive_path.exists()
+    assert not (tmp_path / f'model.tar{ARCHIVE_INDEX_SUFFIX}').exists()
+    assert not (tmp_path / f'model.tar{ARCHIVE_DIGEST_SUFFIX}').exists()
+
+
+def test_incremental_archive_hashes_changed_files_once(model_dir, tmp_path, monkeypatch):
+    archive_path = tmp_path / 'model.tgz'
+    archive_directory(str(model_dir), str(archive_path), level=1, threads=4, incremental=True, checksums=True)
+    weights = model_dir / 'odahuflow_model' / 'data' / 'weights.bin'
+    weights.write_bytes(b'changed' + weights.read_bytes())
+
+    opened = []
+    original_open = open
+
+    def counting_open(path, *args, **kwargs):
+        opened.append(str(path))
+        return original_open(path, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', counting_open)
+    stats = archive_directory(str(model_dir), str(archive_path), level=1, threads=4, incremental=True,
+                              checksums=True)
+    monkeypatch.undo()
+
+    assert opened.count(str(weights)) == 1
+    assert stats.reused_files == 2
+    assert verify_archive(str(archive_path)) == 3
+
+    # Digest of archive written without checksums is not left from the previous archive
+    archive_directory(str(model_dir), str(archive_path), level=1, threads=4)
+    assert not (tmp_path / f'model.tgz{ARCHIVE_DIGEST_SUFFIX}').exists()
+
+
+def test_failed_incremental_archiving_restores_previous_archive(model_dir, tmp_path):
+    archive_path = tmp_path / 'model.tgz'
+    archive_directory(str(model_dir), str(archive_path), level=1, threads=4, incremental=True, checksums=True)
+    previous = {path.name: path.read_bytes() for path in tmp_path.iterdir() if path.is_file()}
+
+    with pytest.raises(FileNotFoundError):
+        with ArchiveWriter(str(archive_path), level=1, threads=4, incremental=True, checksums=True) as archive:
+            archive.add_tree(str(model_dir))
+            archive.add_file(str(tmp_path / 'missing'), 'missing')
+
+    assert {path.name: path.read_bytes() for path in tmp_path.iterdir() if path.is_file()} == previous
+    assert verify_archive(str(archive_path)) == 3
@@ -0,0 +1,27 @@
+import json
+import tarfile
+
+from odahuflow.trainer.helpers.batch import convert_batch, read_jobs, write_report, FAILED, SUCCEEDED
+
+
+def test_batch_conversion_reports_every_job(mlflow_model_dir, tmp_path):
+    jobs_path = tmp_path / 'jobs.yaml'
+    jobs_path.write_text(
+        f'- {{name: good, version: 1, mlflow_model_path: {mlflow_model_dir}, '
+        f'gppi_model_path: {tmp_path / "good"}, mlflow_run_id: run}}\n'
+        f'- {{name: bad, version: 1, mlflow_model_path: {tmp_path / "missing"}, '
+        f'gppi_model_path: {tmp_path / "bad"}, mlflow_run_id: run}}\n'
+    )
+    report_path = tmp_path / 'report.json'
+
+    results = convert_batch(read_jobs(str(jobs_path)), workers=2, stream=True, threads=1)
+    write_report(results, str(report_path), 1.0)
+
+    assert [result.status for result in results] == [SUCCEEDED, FAILED]
+    assert 'not a MLflow model' in results[1].error
+    with tarfile.open(tmp_path / 'good.tgz') as tar:
+        assert 'odahuflow.project.yaml' in tar.getnames()
+    report = json.loads(report_path.read_text())
+    assert (report['succeeded'], report['failed']) == (1, 1)
+    assert report['jobs'][0]['name'] == 'good'
+    assert report['jobs'][0]['archive_bytes'] == (tmp_path / 'good.tgz').stat().st_size
@@ -0,0 +1,102 @@
+import os
+
+from odahuflow.sdk import io_proc_utils
+
+from odahuflow.trainer.helpers.conda import conda_env_cache_key, conda_file_sha256, evict_conda_env_cache, \
+    install_conda_env_lock, restore_cached_conda_env, store_conda_env, write_conda_env_lock, CONDA_LOCK_FILE_NAME, \
+    PIP_LOCK_FILE_NAME
+
+
+def _conda_env(root, name='env'):
+    prefix = root / name
+    (prefix / 'conda-meta').mkdir(parents=True)
+    (prefix / 'conda-meta' / 'python-3.8.5-h7579374_1.json').write_text('{}')
+    (prefix / 'bin').mkdir()
+    (prefix / 'bin' / 'python3.8').write_bytes(b'python' * 1024)
+    (prefix / 'bin' / 'python').symlink_to('python3.8')
+    return prefix
+
+
+def test_cache_key_ignores_formatting_of_conda_file(tmp_path):
+    prefix = _conda_env(tmp_path)
+    (tmp_path / 'requirements.txt').write_text('mlflow == 1.13  # tracking\n\nscikit-learn\n')
+    (tmp_path / 'a.yaml').write_text(
+        'name: a\nchannels: [conda-forge, defaults]\n'
+        'dependencies: [python=3.8, numpy = 1.19, {pip: [-r requirements.txt]}]\n'
+    )
+    (tmp_path / 'b.yaml').write_text(
+        'name: b\nchannels: [conda-forge, defaults]\n'
+        'dependencies: [numpy=1.19, python=3.8, {pip: [scikit-learn, mlflow==1.13]}]\n'
+    )
+    (tmp_path / 'c.yaml').write_text(
+        'name: c\nchannels: [defaults, conda-forge]\n'
+        'dependencies: [numpy=1.19, python=3.8, {pip: [scikit-learn, mlflow==1.13]}]\n'
+    )
+
+    keys = [conda_env_cache_key(str(tmp_path / name), str(prefix)) for name in ('a.yaml', 'b.yaml', 'c.yaml')]
+
+    assert keys[0] == keys[1]
+    # Order of channels sets their priority
+    assert keys[1] != keys[2]
+    (prefix / 'conda-meta' / 'python-3.8.5-h7579374_1.json').rename(prefix / 'conda-meta' / 'python-3.9.1-0.json')
+    assert conda_env_cache_key(str(tmp_path / 'a.yaml'), str(prefix)) != keys[0]
+
+
+def test_cached_env_is_restored_by_links(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    prefix = _conda_env(tmp_path)
+
+    assert not restore_cached_conda_env(str(cache_dir), 'key', str(prefix))
+    store_conda_env(str(cache_dir), 'key', str(prefix), max_size=1024 ** 3)
+    (prefix / 'bin' / 'pip').write_text('installed later')
+
+    assert restore_cached_conda_env(str(cache_dir), 'key', str(prefix))
+    assert sorted(os.listdir(prefix / 'bin')) == ['python', 'python3.8']
+    assert os.readlink(prefix / 'bin' / 'python') == 'python3.8'
+    assert os.stat(prefix / 'bin' / 'python3.8').st_ino == \
+        os.stat(cache_dir / 'key' / 'env' / 'bin' / 'python3.8').st_ino
+
+
+def test_least_recently_used_envs_are_evicted(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    prefix = _conda_env(tmp_path)
+    for number, key in enumerate(('old', 'used', 'new')):
+        store_conda_env(str(cache_dir), key, str(prefix), max_size=1024 ** 3)
+        os.utime(cache_dir / key / 'entry.json', ns=(number * 10 ** 9, number * 10 ** 9))
+    restore_cached_conda_env(str(cache_dir), 'used', str(prefix))
+
+    evicted = evict_conda_env_cache(str(cache_dir), max_size=2 * 8 * 1024, keep=('new',))
+
+    assert evicted == ['old']
+    assert sorted(os.listdir(cache_dir)) == ['new', 'used']
+
+
+def test_locked_env_is_installed_without_solving(tmp_path, monkeypatch):
+    prefix = _conda_env(tmp_path)
+    conda_file = tmp_path / 'conda.yaml'
+    conda_file.write_text('dependencies: [python=3.8, {pip: [mlflow]}]\n')
+    commands = []
+
+    def run(*args, **_):
+        commands.append(args)
+        if args[:2] == ('conda', 'list'):
+            return 0, '@EXPLICIT\nhttps://conda.anaconda.org/python-3.8.5.tar.bz2#md5\n', ''
+        return 0, 'mlflow==1.13.1\nodahu-flow-mlflow @ file:///opt/odahu\n', ''
+    monkeypatch.setattr(io_proc_utils, 'run', run)
+
+    assert not install_conda_env_lock(str(tmp_path), conda_file_sha256(str(conda_file)), str(prefix))
+    write_conda_env_lock(str(tmp_path), conda_file_sha256(str(conda_file)), str(prefix))
+    commands.clear()
+
+    assert install_conda_env_lock(str(tmp_path), conda_file_sha256(str(conda_file)), str(prefix))
+    assert (tmp_path / PIP_LOCK_FILE_NAME).read_text().splitlines()[1:] == ['mlflow==1.13.1']
+    assert commands == [
+        ('conda', 'install', '--yes', '--prefix', str(prefix), '--file', str(tmp_path / CONDA_LOCK_FILE_NAME)),
+        (str(prefix / 'bin' / 'python'), '-m', 'pip', 'install', '--no-deps', '-r', str(tmp_path / PIP_LOCK_FILE_NAME)),
+    ]
+
+    # Lock files are outdated when conda file is changed
+    conda_file.write_text('dependencies: [python=3.8, {pip: [mlflow, pandas]}]\n')
+    assert not install_conda_env_lock(str(tmp_path), conda_file_sha256(str(conda_file)), str(prefix))
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pytest
+
+from odahuflow.trainer.helpers import download
+from odahuflow.trainer.helpers.download import download_artifacts
+from odahuflow.trainer.helpers.mlflow_helper import discover_remote_pyfunc_models, select_model
+from tests.artifact_server import ArtifactServer
+
+
+def test_remote_model_is_downloaded_by_ranges(mlflow_model_dir, tmp_path):
+    root = tmp_path / 'server'
+    shutil.copytree(mlflow_model_dir, root / 'run' / 'models' / 'model')
+    (root / 'run' / 'metrics.json').write_text('{}')
+    weights = root / 'run' / 'models' / 'model' / 'weights.bin'
+    weights.write_bytes(os.urandom(10 * 1024 + 1))
+    download_dir = tmp_path / 'download'
+
+    with ArtifactServer(str(root)) as server:
+        artifact_uri = f'{server.artifact_uri}/run'
+        models = discover_remote_pyfunc_models(artifact_uri, str(download_dir), threads=4)
+        assert os.listdir(download_dir / 'models' / 'model') == ['MLmodel']
+
+        server.broken_files.add(str(weights))
+        stats = download_artifacts(artifact_uri, select_model(models).relative_path, str(download_dir),
+                                   threads=4, chunk_size=4096)
+
+    model_dir = download_dir / 'models' / 'model'
+    assert models[0].path == str(model_dir)
+    assert sorted(os.listdir(model_dir)) == sorted(os.listdir(root / 'run' / 'models' / 'model'))
+    assert (model_dir / 'weights.bin').read_bytes() == weights.read_bytes()
+    assert stats.files == 5
+    assert not (download_dir / 'metrics.json').exists()
+    ranges = [header for path, header in server.requests if path.endswith('weights.bin')]
+    # Probe of range support and three chunks, the broken one is resumed
+    assert len(ranges) == 5
+
+
+def test_file_is_downloaded_by_single_request_without_range_support(tmp_path):
+    root = tmp_path / 'server'
+    root.mkdir()
+    weights = root / 'weights.bin'
+    weights.write_bytes(os.urandom(10 * 1024 + 1))
+
+    with ArtifactServer(str(root)) as server:
+        server.ranges = False
+        stats = download_artifacts(server.artifact_uri, '', str(tmp_path / 'download'), threads=4, chunk_size=4096)
+
+    assert (tmp_path / 'download' / 'weights.bin').read_bytes() == weights.read_bytes()
+    assert stats.bytes == len(weights.read_bytes())
+    # Probe of range support and a single request instead of three chunks
+    assert len([path for path, _ in server.requests if path.endswith('weights.bin')]) == 2
+
+
+@pytest.mark.parametrize('remote_path', ['../escaped', 'model/../../escaped', '/etc/passwd'])
+def test_artifact_path_can_not_escape_target(tmp_path, remote_path):
+    with pytest.raises(ValueError, match='outside of target directory'):
+        download._local_path(str(tmp_path), remote_path)
@@ -1,6 +1,16 @@
+import concurrent.futures
+import functools
+import gc
+import os
+import signal
+
 import numpy as np
 import pandas as pd
+import pytest
+
+from odahuflow.trainer.helpers.templates import entrypoint
 from odahuflow.trainer.helpers.templates.entrypoint import _extract_df_properties
+from tests.model_stubs import SumModel, broken_model
 
 
 def test_extract_df_properties():
@@ -26,3 +36,296 @@ def test_extract_df_properties():
 
 def test_extract_empty_df_properties():
     assert _extract_df_properties(pd.DataFrame({})) == []
+
+
+def test_predict_on_columns_matches_predict_on_matrix(sum_model):
+    matrix = [[1, 2.5], [3, 4.5]]
+
+    expected, expected_columns = entrypoint.predict_on_matrix(matrix, ['a', 'b'])
+    from_array, array_columns = entrypoint.predict_on_columns(np.array(matrix), ['a', 'b'])
+    from_dict, dict_columns = entrypoint.predict_on_columns({'a': np.array([1, 3]), 'b': np.array([2.5, 4.5])})
+
+    assert expected_columns == array_columns == dict_columns == ('sum',)
+    np.testing.assert_array_equal(expected, from_array)
+    np.testing.assert_array_equal(expected, from_dict)
+    assert list(sum_model.inputs[-1].dtypes) == [np.dtype('int64'), np.dtype('float64')]
+
+
+@pytest.mark.usefixtures('sum_model')
+def test_predict_on_columns_rejects_1d_input():
+    with pytest.raises(ValueError):
+        entrypoint.predict_on_columns(np.array([1, 2, 3]))
+
+
+@pytest.mark.usefixtures('samples')
+def test_schema_plan_reorders_and_coerces_columns(sum_model):
+    result, columns = entrypoint.predict_on_matrix([[2.5, 1, 'extra'], [4.5, 3, 'extra']], ['b', 'a', 'c'])
+
+    assert columns == ('sum',)
+    np.testing.assert_array_equal(result, [[3.5], [7.5]])
+
+    model_input = sum_model.inputs[-1]
+    assert list(model_input.columns) == ['a', 'b']
+    assert list(model_input.dtypes) == [np.dtype('int64'), np.dtype('float32')]
+
+
+@pytest.mark.usefixtures('samples')
+def test_schema_plan_does_not_truncate_values(sum_model):
+    entrypoint.predict_on_matrix([[1.5, 2.5]], ['a', 'b'])
+
+    assert sum_model.inputs[-1]['a'].tolist() == [1.5]
+
+
+@pytest.fixture
+def int32_samples(samples, monkeypatch):
+    input_sample = pd.DataFrame({'a': np.array([1], dtype='int32'), 'b': np.array([1.], dtype='float32')})
+    monkeypatch.setattr(entrypoint, '_input_df_sample', lambda: input_sample)
+    entrypoint._schema_plan.cache_clear()
+    return input_sample, samples[1]
+
+
+@pytest.mark.usefixtures('int32_samples')
+def test_schema_plan_keeps_values_that_overflow_column(sum_model):
+    entrypoint.predict_on_matrix([[2 ** 40, 0.5]], ['a', 'b'])
+    assert sum_model.inputs[-1]['a'].tolist() == [2 ** 40]
+
+    entrypoint.predict_on_columns({'a': np.array([2 ** 40]), 'b': np.array([0.5])})
+    assert sum_model.inputs[-1]['a'].tolist() == [2 ** 40]
+    assert sum_model.inputs[-1]['b'].dtype == np.dtype('float64')
+
+
+@pytest.mark.usefixtures('samples')
+def test_schema_plan_does_not_coerce_non_numbers(sum_model):
+    entrypoint.predict_on_matrix([[True, 1.5]], ['a', 'b'])
+
+    assert sum_model.inputs[-1]['a'].dtype == np.dtype('bool')
+    assert entrypoint._coerce_column(np.array(['2.5'], dtype=object), np.dtype('float32')).tolist() == ['2.5']
+
+
+@pytest.mark.usefixtures('samples')
+def test_schema_plan_predicts_empty_matrix(sum_model):
+    result, columns = entrypoint.predict_on_matrix([], ['a', 'b'])
+
+    assert columns == ('sum',)
+    assert len(result) == 0
+    assert list(sum_model.inputs[-1].dtypes) == [np.dtype('int64'), np.dtype('float32')]
+
+
+@pytest.mark.usefixtures('sum_model', 'samples')
+def test_schema_plan_rejects_missing_columns():
+    with pytest.raises(ValueError, match='Missing columns'):
+        entrypoint.predict_on_matrix([[1]], ['a'])
+
+
+def test_micro_batcher_scatters_batch_results(sum_model, monkeypatch):
+    batcher = entrypoint._MicroBatcher(
+        functools.partial(entrypoint._model_predict, plan=entrypoint._schema_plan()),
+        max_batch_size=10, max_wait=0.5
+    )
+    monkeypatch.setattr(entrypoint, 'BATCHER', batcher)
+
+    requests = [[[i, i]] for i in range(4)]
+    try:
+        with concurrent.futures.ThreadPoolExecutor(len(requests)) as pool:
+            results = list(pool.map(lambda request: entrypoint.predict_on_matrix(request, ['a', 'b']), requests))
+    finally:
+        batcher.close()
+
+    for i, (result, columns) in enumerate(results):
+        assert columns == ('sum',)
+        np.testing.assert_array_equal(result, [[2 * i]])
+
+    stats = entrypoint.batching_stats()
+    assert stats['requests'] == 4
+    assert stats['rows'] == 4
+    assert stats['batches'] == len(sum_model.inputs) < 4
+
+
+def test_micro_batcher_passes_single_request_result_as_is():
+    # Model aggregates rows, so its result can not be split between merged requests
+    def predict_total(df):
+        return np.array([[df.to_numpy().sum()]]), ('total',)
+    batcher = entrypoint._MicroBatcher(predict_total, max_batch_size=10, max_wait=0)
+    try:
+        result, columns = batcher.predict(pd.DataFrame({'a': [1, 2], 'b': [3, 4]}))  # pylint: disable=E0633
+    finally:
+        batcher.close()
+
+    assert columns == ('total',)
+    np.testing.assert_array_equal(result, [[10]])
+    with pytest.raises(RuntimeError, match='closed'):
+        batcher.predict(pd.DataFrame({'a': [1]}))
+
+
+def test_replica_pool_predicts_in_worker_processes():
+    pool = entrypoint._ModelReplicaPool(SumModel, entrypoint._schema_plan(), replicas=2)
+    try:
+        numeric, numeric_columns = pool.predict(pd.DataFrame({'a': [1., 2.], 'b': [3., 4.]}))
+        mixed, _ = pool.predict(pd.DataFrame({'a': np.array([1, 2], dtype='int32'), 'b': [3., 4.5]}))
+        objects, _ = pool.predict(pd.DataFrame({'a': ['x', 'y'], 'b': ['z', 'w']}))
+    finally:
+        pool.close()
+
+    assert numeric_columns == ('sum',)
+    np.testing.assert_array_equal(numeric, [[4.], [6.]])
+    np.testing.assert_array_equal(mixed, [[4.], [6.5]])
+    np.testing.assert_array_equal(objects, [['xz'], ['yw']])
+
+
+def _kill_replica(pool):
+    process = pool._slots[0].process
+    os.kill(process.pid, signal.SIGKILL)
+    process.join(timeout=10)
+
+
+def test_replica_pool_respawns_killed_replica(monkeypatch):
+    pool = entrypoint._ModelReplicaPool(SumModel, entrypoint._schema_plan(), replicas=1)
+    df = pd.DataFrame({'a': [1., 2.], 'b': [3., 4.]})
+    try:
+        killed_pid = pool.pids()[0]
+        _kill_replica(pool)
+        with pytest.raises(RuntimeError, match='is not available'):
+            pool.predict(df)
+
+        assert pool.pids() != [killed_pid]
+        np.testing.assert_array_equal(pool.predict(df)[0], [[4.], [6.]])
+
+        # Replica is healthy if input could not be packed, so it stays in the pool
+        def fail_pack(*_):
+            raise OSError('No space left on device')
+        with monkeypatch.context() as patch:
+            patch.setattr(entrypoint, '_pack_frame', fail_pack)
+            with pytest.raises(OSError):
+                pool.predict(df)
+        np.testing.assert_array_equal(pool.predict(df)[0], [[4.], [6.]])
+
+        # Replica can not be respawned, so pool has no replicas left
+        pool._loader = broken_model
+        _kill_replica(pool)
+        with pytest.raises(RuntimeError, match='is not available'):
+            pool.predict(df)
+        with pytest.raises(RuntimeError, match='None of model replicas is alive'):
+            pool.predict(df)
+    finally:
+        pool.close()
+
+
+def test_prefork_replicas_share_loaded_model(sum_model, monkeypatch):
+    pool = entrypoint._prefork_replicas(entrypoint._schema_plan(), replicas=1)
+    monkeypatch.setattr(entrypoint, 'REPLICAS', pool)
+    try:
+        result, _ = pool.predict(pd.DataFrame({'a': [1., 2.], 'b': [3., 4.]}))
+        memory = entrypoint.replicas_memory()
+    finally:
+        pool.close()
+
+    np.testing.assert_array_equal(result, [[4.], [6.]])
+    # Objects are frozen for replicas only
+    assert gc.get_freeze_count() == 0
+    # Prediction was made in the replica, on the model inherited from this process
+    assert not sum_model.inputs
+    assert [report['pid'] for report in memory][1:] == pool.pids()
+
+
+@pytest.mark.usefixtures('samples')
+def test_warmup_reports_cold_start_timings(sum_model):
+    report = entrypoint._warmup(entrypoint._schema_plan(), predictions=3, load_time=1.5)
+
+    assert len(sum_model.inputs) == 3
+    assert report.load_time == 1.5
+    assert report.warmup_predictions == 3
+    assert report.first_predict_time > 0
+    assert report.steady_predict_time > 0
+
+
+def test_warmup_is_skipped_without_input_sample(sum_model):
+    report = entrypoint._warmup(entrypoint._schema_plan(), predictions=3, load_time=1.5)
+
+    assert not sum_model.inputs
+    assert report.first_predict_time is None
+
+
+def test_prediction_cache_predicts_only_missed_rows(sum_model, monkeypatch):
+    monkeypatch.setattr(entrypoint, 'CACHE', entrypoint._PredictionCache(max_bytes=10 ** 6))
+
+    entrypoint.predict_on_matrix([[1, 1], [2, 2]], ['a', 'b'])
+    result, columns = entrypoint.predict_on_matrix([[3, 3], [1, 1], [2, 2]], ['a', 'b'])
+
+    assert columns == ('sum',)
+    np.testing.assert_array_equal(result, [[6], [2], [4]])
+    assert sum_model.inputs[-1].values.tolist() == [[3, 3]]
+
+    stats = entrypoint.cache_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 3, 3)
+
+
+@pytest.mark.usefixtures('samples')
+def test_prediction_cache_passes_empty_request_to_model(sum_model, monkeypatch):
+    monkeypatch.setattr(entrypoint, 'CACHE', entrypoint._PredictionCache(max_bytes=10 ** 6))
+
+    result, columns = entrypoint.predict_on_matrix([], ['a', 'b'])
+
+    assert columns == ('sum',)
+    assert len(result) == 0
+    assert len(sum_model.inputs) == 1
+
+
+def test_prediction_cache_evicts_least_recently_used_rows():
+    entry_size = entrypoint._PredictionCache.ENTRY_OVERHEAD + 8
+    cache = entrypoint._PredictionCache(max_bytes=2 * entry_size)
+
+    cache.put_many([(1,), (2,)], np.array([[1.], [2.]]), ('sum',))
+    cache.get_many([(1,)])
+    cache.put_many([(3,)], np.array([[3.]]), ('sum',))
+
+    rows, _ = cache.get_many([(1,), (2,), (3,)])
+    assert [row is not None for row in rows] == [True, False, True]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_predict_stream_reads_csv_by_chunks(sum_model, tmp_path):
+    source = tmp_path / 'input.csv'
+    pd.DataFrame({'a': range(5), 'b': range(5)}).to_csv(source, index=False)
+
+    chunks = list(entrypoint.predict_stream(str(source), chunk_size=2))
+
+    assert [len(result) for result, _ in chunks] == [2, 2, 1]
+    np.testing.assert_array_equal(np.concatenate([result for result, _ in chunks]), [[0], [2], [4], [6], [8]])
+    assert max(len(model_input) for model_input in sum_model.inputs) == 2
+
+
+@pytest.mark.usefixtures('samples')
+def test_predict_stream_aligns_chunks_with_schema(sum_model):
+    chunks = [[[2.5, 1]], np.array([[4.5, 3]])]
+
+    results = [result for result, _ in entrypoint.predict_stream(chunks, ['b', 'a'])]
+
+    np.testing.assert_array_equal(np.concatenate(results), [[3.5], [7.5]])
+    assert all(list(model_input.columns) == ['a', 'b'] for model_input in sum_model.inputs)
+
+
+@pytest.mark.usefixtures('sum_model', 'samples')
+def test_metrics_record_prediction_stages(monkeypatch):
+    assert entrypoint.metrics() is None
+
+    monkeypatch.setattr(entrypoint, 'METRICS', entrypoint._StageMetrics())
+    entrypoint.predict_on_matrix([[1, 2.5]], ['a', 'b'])
+    entrypoint.predict_on_columns({'b': np.array([2.5]), 'a': np.array([1])})
+
+    stages = entrypoint.metrics()['stages']
+    assert set(stages) == {'dataframe', 'align', 'predict', 'result', 'total'}
+    assert all(stage['count'] == 2 for stage in stages.values())
+    assert stages['total']['p50'] <= stages['total']['max'] <= stages['total']['sum']
+
+
+def test_latency_histogram_percentiles():
+    histogram = entrypoint._LatencyHistogram()
+    for _ in range(99):
+        histogram.observe(0.001)
+    histogram.observe(1.0)
+
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert 0.001 <= summary['p50'] < 0.002
+    assert summary['p99'] < 0.002
+    assert summary['max'] == 1.0
@@ -0,0 +1,83 @@
+import os
+
+from odahuflow.trainer.helpers.fs import copytree
+
+WEIGHTS = os.path.join('odahuflow_model', 'data', 'weights.bin')
+
+
+def _tree(root):
+    return {str(path.relative_to(root)): path.read_bytes() for path in root.rglob('*') if path.is_file()}
+
+
+def test_copytree_copies_content_and_metadata(model_dir, tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir()
+    os.utime(model_dir / WEIGHTS, ns=(1_000_000_000, 1_000_000_000))
+
+    stats = copytree(str(model_dir), str(target), threads=4)
+
+    assert _tree(target) == _tree(model_dir)
+    assert stats.files == 3
+    assert stats.bytes == sum(len(content) for content in _tree(model_dir).values())
+    assert os.stat(target / WEIGHTS).st_mtime_ns == 1_000_000_000
+    assert os.stat(target / WEIGHTS).st_ino != os.stat(model_dir / WEIGHTS).st_ino
+
+
+def test_copytree_merges_into_existing_directories(model_dir, tmp_path):
+    target = tmp_path / 'target'
+    copytree(str(model_dir), str(target))
+
+    copytree(str(model_dir), str(target))
+
+    assert _tree(target) == _tree(model_dir)
+
+
+def test_copytree_links_files(model_dir, tmp_path):
+    target = tmp_path / 'target'
+    copytree(str(model_dir), str(target))
+
+    copytree(str(model_dir), str(target), link=True)
+
+    assert _tree(target) == _tree(model_dir)
+    assert os.stat(target / WEIGHTS).st_ino == os.stat(model_dir / WEIGHTS).st_ino
+
+
+def test_copytree_falls_back_when_copy_file_range_stops_early(model_dir, tmp_path, monkeypatch):
+    # copy_file_range reports end of file without copying anything
+    monkeypatch.setattr(os, 'copy_file_range', lambda *_: 0, raising=False)
+    target = tmp_path / 'target'
+
+    copytree(str(model_dir), str(target))
+
+    assert _tree(target) == _tree(model_dir)
+
+
+def test_copytree_follows_symlinks_without_loops(model_dir, tmp_path):
+    data = model_dir / 'odahuflow_model' / 'data'
+    (model_dir / 'odahuflow_model' / 'loop').symlink_to('..')
+    (model_dir / 'data_link').symlink_to(data)
+    target = tmp_path / 'target'
+
+    stats = copytree(str(model_dir), str(target))
+
+    assert not (target / 'odahuflow_model' / 'loop').exists()
+    assert (target / 'data_link' / 'weights.bin').read_bytes() == (data / 'weights.bin').read_bytes()
+    assert not (target / 'data_link').is_symlink()
+    assert stats.files == 4
+
+
+def test_incremental_copytree_copies_changed_files_only(model_dir, tmp_path):
+    target = tmp_path / 'target'
+    manifest = str(tmp_path / 'sync.json')
+    copytree(str(model_dir), str(target), manifest=manifest)
+
+    (model_dir / 'odahuflow.project.yaml').write_text('name: changed')
+    (model_dir / 'odahuflow_model' / 'MLmodel').unlink()
+    # Rewritten with the same content
+    (model_dir / WEIGHTS).write_bytes((model_dir / WEIGHTS).read_bytes())
+
+    stats = copytree(str(model_dir), str(target), manifest=manifest)
+
+    assert _tree(target) == _tree(model_dir)
+    assert (stats.files, stats.skipped) == (1, 1)
+    assert os.stat(target / WEIGHTS).st_mtime_ns == os.stat(model_dir / WEIGHTS).st_mtime_ns
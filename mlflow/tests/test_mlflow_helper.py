@@ -0,0 +1,160 @@
+import json
+import os
+import shutil
+import tarfile
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+from odahuflow.sdk.models import ModelIdentity
+
+from odahuflow.trainer.helpers.mlflow_helper import convert_mlflow_model, discover_pyfunc_models, mlflow_to_gppi, \
+    mlflow_to_gppi_archive, select_model, validate_gppi_archive, validate_gppi_entries, write_schema_file, \
+    MODEL_SUBFOLDER, ODAHUFLOW_PROJECT_DESCRIPTION, SCHEMA_VALIDATION
+from odahuflow.trainer.helpers.templates import entrypoint
+
+
+@pytest.fixture
+def clear_schema_caches():
+    caches = (entrypoint._schema_file, entrypoint._schema_plan, entrypoint.info)
+    for cache in caches:
+        cache.cache_clear()
+    yield
+    for cache in caches:
+        cache.cache_clear()
+
+
+@pytest.mark.usefixtures('clear_schema_caches')
+def test_schema_file_replaces_samples(tmp_path, monkeypatch):
+    input_sample = pd.DataFrame({'a': np.array([1], dtype='int32'), 'b': [1.5], 'c': ['x']})
+    output_sample = pd.DataFrame({'result': [1.]})
+    input_sample.to_pickle(tmp_path / entrypoint.MODEL_INPUT_SAMPLE_FILE_NAME)
+    output_sample.to_pickle(tmp_path / entrypoint.MODEL_OUTPUT_SAMPLE_FILE_NAME)
+
+    write_schema_file(str(tmp_path))
+
+    def fail():
+        raise AssertionError('Sample must not be loaded')
+
+    monkeypatch.setattr(entrypoint, 'MODEL_SCHEMA_FILE', str(tmp_path / entrypoint.MODEL_SCHEMA_FILE_NAME))
+    monkeypatch.setattr(entrypoint, '_input_df_sample', fail)
+    monkeypatch.setattr(entrypoint, '_output_df_sample', fail)
+
+    plan = entrypoint._schema_plan()
+    assert plan.input_columns == ('a', 'b', 'c')
+    assert plan.input_dtypes == (np.dtype('int32'), np.dtype('float64'), None)
+    assert plan.output_columns == ('result',)
+    assert entrypoint.info() == (entrypoint._extract_df_properties(input_sample),
+                                 entrypoint._extract_df_properties(output_sample))
+
+
+def test_schema_file_is_not_created_without_samples(tmp_path):
+    write_schema_file(str(tmp_path))
+
+    assert not (tmp_path / entrypoint.MODEL_SCHEMA_FILE_NAME).exists()
+
+
+def test_incremental_conversion_removes_outdated_schema(mlflow_model_dir, tmp_path):
+    model_meta = ModelIdentity(name='model', version='1')
+    schema_path = tmp_path / 'gppi' / MODEL_SUBFOLDER / entrypoint.MODEL_SCHEMA_FILE_NAME
+    mlflow_to_gppi(model_meta, str(mlflow_model_dir), str(tmp_path / 'gppi'), 'run-id', incremental=True,
+                   validation=SCHEMA_VALIDATION)
+    assert schema_path.exists()
+
+    (mlflow_model_dir / entrypoint.MODEL_INPUT_SAMPLE_FILE_NAME).unlink()
+    mlflow_to_gppi(model_meta, str(mlflow_model_dir), str(tmp_path / 'gppi'), 'run-id', incremental=True,
+                   validation=SCHEMA_VALIDATION)
+
+    assert not schema_path.exists()
+    assert not (tmp_path / 'gppi' / MODEL_SUBFOLDER / entrypoint.MODEL_INPUT_SAMPLE_FILE_NAME).exists()
+
+
+def test_mlflow_to_gppi_archive_streams_model(mlflow_model_dir, tmp_path):
+    archive_path = str(tmp_path / 'gppi.tgz')
+
+    stats = mlflow_to_gppi_archive(ModelIdentity(name='model', version='1'), str(mlflow_model_dir), archive_path,
+                                   'run-id', threads=2)
+
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        names = set(tar.getnames())
+        manifest = yaml.safe_load(tar.extractfile(ODAHUFLOW_PROJECT_DESCRIPTION))
+        schema = json.load(tar.extractfile(f'{MODEL_SUBFOLDER}/{entrypoint.MODEL_SCHEMA_FILE_NAME}'))
+
+    assert {MODEL_SUBFOLDER, f'{MODEL_SUBFOLDER}/MLmodel', f'{MODEL_SUBFOLDER}/entrypoint.py',
+            f'{MODEL_SUBFOLDER}/conda.yaml', f'{MODEL_SUBFOLDER}/model.pkl'} <= names
+    assert stats.files == len(names)
+    assert manifest['binaries']['conda_path'] == f'{MODEL_SUBFOLDER}/conda.yaml'
+    assert manifest['output']['run_id'] == 'run-id'
+    assert [prop['name'] for prop in schema['input']] == ['a', 'b']
+    assert not os.path.exists(tmp_path / 'gppi')
+
+
+def test_invalid_streamed_gppi_leaves_no_archive(mlflow_model_dir, tmp_path, caplog):
+    with open(mlflow_model_dir / 'MLmodel', 'a', encoding='utf-8') as mlmodel:
+        mlmodel.write('signature:\n'
+                      '  inputs: \'[{"name": "c", "type": "double"}]\'\n'
+                      '  outputs: null\n')
+
+    with pytest.raises(ValueError, match='misses columns of model signature'):
+        convert_mlflow_model(ModelIdentity(name='model', version='1'), str(mlflow_model_dir), str(tmp_path / 'gppi'),
+                             'run-id', stream=True, index=True)
+
+    assert os.listdir(tmp_path) == [mlflow_model_dir.name]
+    # Streamed GPPI is validated by schema by default
+    assert 'validation is used instead' not in caplog.text
+
+
+def test_indexed_gppi_archive_is_validated_without_unpacking(mlflow_model_dir, tmp_path):
+    archive_path = str(tmp_path / 'gppi.tgz')
+    mlflow_to_gppi_archive(ModelIdentity(name='model', version='1'), str(mlflow_model_dir), archive_path,
+                           'run-id', threads=2, index=True)
+
+    assert set(validate_gppi_archive(archive_path)) == {'manifest', 'schema'}
+
+
+def test_validate_gppi_entries_reports_missing_files():
+    manifest = yaml.dump({
+        'odahuflowVersion': '1.0',
+        'binaries': {'type': 'python', 'dependencies': 'conda', 'conda_path': f'{MODEL_SUBFOLDER}/conda.yaml'},
+        'model': {'name': 'model', 'version': '1', 'workDir': MODEL_SUBFOLDER, 'entrypoint': 'entrypoint'},
+        'toolchain': {'name': 'mlflow', 'version': '1.13.0'},
+        'output': {'run_id': 'run-id'},
+    }).encode('utf-8')
+
+    with pytest.raises(ValueError, match='entrypoint.py'):
+        validate_gppi_entries([ODAHUFLOW_PROJECT_DESCRIPTION, f'{MODEL_SUBFOLDER}/MLmodel',
+                               f'{MODEL_SUBFOLDER}/conda.yaml'], manifest)
+
+
+def test_discover_pyfunc_models_finds_nested_models(mlflow_model_dir, tmp_path):
+    nested = tmp_path / 'runs' / 'best'
+    shutil.copytree(mlflow_model_dir, nested / 'model')
+    (nested / 'metrics.json').write_text('{}')
+    (tmp_path / 'keras').mkdir()
+    (tmp_path / 'keras' / 'MLmodel').write_text('flavors:\n  keras: {}\n')
+
+    models = discover_pyfunc_models(str(tmp_path), threads=4)
+
+    assert [model.relative_path for model in models] == ['mlflow_model', os.path.join('runs', 'best', 'model')]
+    assert select_model(models, 'runs/best/model/').path == str(nested / 'model')
+    with pytest.raises(ValueError, match='exactly 1 model'):
+        select_model(models)
+    with pytest.raises(ValueError, match='not found'):
+        select_model(models, 'keras')
+
+
+def test_schema_validation_uses_model_signature(mlflow_model_dir, tmp_path):
+    model_meta = ModelIdentity(name='model', version='1')
+
+    timings = mlflow_to_gppi(model_meta, str(mlflow_model_dir), str(tmp_path / 'gppi'), 'run-id',
+                             validation=SCHEMA_VALIDATION)
+    assert set(timings) == {'manifest', 'schema'}
+
+    with open(mlflow_model_dir / 'MLmodel', 'a', encoding='utf-8') as mlmodel:
+        mlmodel.write('signature:\n'
+                      '  inputs: \'[{"name": "a", "type": "long"}, {"name": "c", "type": "double"}]\'\n'
+                      '  outputs: null\n')
+    with pytest.raises(ValueError, match=r"misses columns of model signature: \['c'\]"):
+        mlflow_to_gppi(model_meta, str(mlflow_model_dir), str(tmp_path / 'gppi_with_signature'), 'run-id',
+                       validation=SCHEMA_VALIDATION)
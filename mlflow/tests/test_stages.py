@@ -0,0 +1,29 @@
+import threading
+
+import pytest
+
+from odahuflow.trainer.helpers.stages import run_stages
+
+
+def test_stages_run_concurrently():
+    # Each stage waits for the other one, so stages pass only if they run at the same time
+    barrier = threading.Barrier(2, timeout=10)
+
+    def stage(result):
+        barrier.wait()
+        return result
+
+    assert run_stages({'first': lambda: stage(1), 'second': lambda: stage(2)}) == {'first': 1, 'second': 2}
+
+
+def test_failed_stage_cancels_pending_stages():
+    started = []
+
+    def fail():
+        started.append('fail')
+        raise ValueError('stage failed')
+
+    with pytest.raises(ValueError, match='stage failed'):
+        run_stages({'fail': fail, 'pending': lambda: started.append('pending')}, threads=1)
+
+    assert started == ['fail']
@@ -0,0 +1,116 @@
+import os
+import threading
+import types
+
+import pytest
+
+from odahuflow.trainer.helpers import sweep as sweep_module
+from odahuflow.trainer.helpers.sweep import cpu_quota, read_sweep, run_sweep, select_best_run, Sweep, \
+    BEST_RUN_TAG, MINIMIZE
+
+
+def test_grid_sweep_runs_all_combinations(tmp_path):
+    sweep_file = tmp_path / 'sweep.yaml'
+    sweep_file.write_text('metric: rmse\ngoal: minimize\nworkers: 2\ngrid: {alpha: [0.1, 0.5], l1_ratio: [1]}\n')
+
+    sweep = read_sweep(str(sweep_file))
+
+    assert sweep.parameter_sets == [{'alpha': '0.1', 'l1_ratio': '1'}, {'alpha': '0.5', 'l1_ratio': '1'}]
+    assert (sweep.metric, sweep.goal, sweep.workers) == ('rmse', MINIMIZE, 2)
+
+
+def test_sweep_requires_grid_or_parameters(tmp_path):
+    sweep_file = tmp_path / 'sweep.json'
+    sweep_file.write_text('{"metric": "rmse", "grid": {"alpha": [1]}, "parameters": [{"alpha": 2}]}')
+
+    with pytest.raises(ValueError, match='either grid or parameters'):
+        read_sweep(str(sweep_file))
+
+
+@pytest.mark.parametrize('content, message', [
+    ('{"metric": "rmse", "parameters": [{"alpha": 1}, 2]}', 'list of parameter mappings'),
+    ('{"metric": "rmse", "parameters": {"alpha": 1}}', 'list of parameter mappings'),
+    ('{"metric": "rmse", "grid": {"alpha": 1}}', 'lists of values'),
+    ('{"metric": "rmse", "grid": {"alpha": [1]}, "workers": 0}', 'positive integer'),
+    ('{"metric": "rmse", "grid": {"alpha": [1]}, "workers": "2"}', 'positive integer'),
+])
+def test_invalid_sweep_is_rejected(tmp_path, content, message):
+    sweep_file = tmp_path / 'sweep.json'
+    sweep_file.write_text(content)
+
+    with pytest.raises(ValueError, match=message):
+        read_sweep(str(sweep_file))
+
+
+class _TrackingClient:
+    """
+    MlflowClient stub with metrics of finished runs
+    """
+
+    metrics = {}
+    tags = []
+
+    def get_run(self, run_id):
+        return types.SimpleNamespace(data=types.SimpleNamespace(metrics=self.metrics[run_id]))
+
+    def set_tag(self, run_id, key, value):
+        self.tags.append((run_id, key, value))
+
+
+def test_sweep_runs_concurrently_and_tags_best_run(tmp_path, monkeypatch):
+    # The first two runs wait for each other, so they pass only if they run at the same time
+    barrier = threading.Barrier(2, timeout=10)
+    wrapper_dirs = []
+
+    def train_models(_, experiment_id, hyper_parameters, wrapper_dir, work_dir):
+        assert experiment_id == 'experiment'
+        wrapper_dirs.append(wrapper_dir)
+        # Every run works in its own copy of the project
+        assert os.path.dirname(work_dir) == wrapper_dir
+        assert os.listdir(work_dir) == ['MLproject']
+        with open(os.path.join(work_dir, 'output.txt'), 'x', encoding='utf-8') as output:
+            output.write(hyper_parameters['alpha'])
+        if hyper_parameters['alpha'] == '3':
+            raise ValueError('run failed')
+        barrier.wait()
+        run_id = f'run-{hyper_parameters["alpha"]}-{hyper_parameters["l1_ratio"]}'
+        _TrackingClient.metrics[run_id] = {'rmse': float(hyper_parameters['alpha'])}
+        return run_id
+    monkeypatch.setattr(sweep_module, 'train_models', train_models)
+    monkeypatch.setattr(sweep_module, 'MlflowClient', _TrackingClient)
+    monkeypatch.setattr(_TrackingClient, 'metrics', {})
+    monkeypatch.setattr(_TrackingClient, 'tags', [])
+    (tmp_path / 'project').mkdir()
+    (tmp_path / 'project' / 'MLproject').write_text('name: project')
+    model_training = types.SimpleNamespace(spec=types.SimpleNamespace(hyper_parameters={'l1_ratio': '1'},
+                                                                      work_dir=str(tmp_path / 'project')))
+
+    best_run_id = run_sweep(model_training, 'experiment',
+                            Sweep(parameter_sets=[{'alpha': '2'}, {'alpha': '1'}, {'alpha': '3'}], metric='rmse',
+                                  goal=MINIMIZE, workers=2))
+
+    assert best_run_id == 'run-1-1'
+    assert _TrackingClient.tags == [('run-1-1', BEST_RUN_TAG, 'true')]
+    assert len(set(wrapper_dirs)) == 3
+    assert not any(os.path.exists(wrapper_dir) for wrapper_dir in wrapper_dirs)
+    assert os.listdir(tmp_path / 'project') == ['MLproject']
+
+
+def test_cpu_quota_of_cgroups(tmp_path):
+    cpus = len(os.sched_getaffinity(0))
+    (tmp_path / 'cpu').mkdir()
+    (tmp_path / 'cpu' / 'cpu.cfs_quota_us').write_text('-1\n')
+    (tmp_path / 'cpu' / 'cpu.cfs_period_us').write_text('100000\n')
+    assert cpu_quota(str(tmp_path)) == cpus
+
+    (tmp_path / 'cpu.max').write_text('50000 100000\n')
+    assert cpu_quota(str(tmp_path)) == 1
+
+
+def test_best_run_is_selected_by_goal():
+    metrics = {'first': 0.5, 'second': 0.7, 'failed': None}
+
+    assert select_best_run(metrics) == 'second'
+    assert select_best_run(metrics, MINIMIZE) == 'first'
+    with pytest.raises(ValueError):
+        select_best_run({'failed': None})
@@ -0,0 +1,102 @@
+import json
+import os
+import socket
+import threading
+import time
+import types
+
+import pytest
+from odahuflow.sdk import io_proc_utils
+
+from odahuflow.trainer.helpers import conda
+from odahuflow.trainer.helpers.conda import request_mlflow_wrapper
+from odahuflow.trainer.helpers.wrapper import wrapper
+
+import mlflow.projects
+
+
+def test_wrapper_server_runs_projects_until_shutdown(tmp_path, monkeypatch, capsys):
+    def run(**mlflow_input):
+        if mlflow_input['entry_point'] == 'broken':
+            raise ValueError('entry point is broken')
+        return types.SimpleNamespace(run_id=f'run-{mlflow_input["entry_point"]}')
+    monkeypatch.setattr(wrapper, 'check_mlflow_version', lambda: None)
+    monkeypatch.setattr(mlflow.projects, 'run', run)
+    socket_path = str(tmp_path / 'wrapper.sock')
+
+    server = threading.Thread(target=wrapper.serve, args=(socket_path,))
+    server.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    # Readiness probe sends no request
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        probe.connect(socket_path)
+    assert request_mlflow_wrapper(socket_path, {'input': {'entry_point': 'main'}}).run_id == 'run-main'
+    assert request_mlflow_wrapper(socket_path, {'input': {'entry_point': 'broken'}}).error == \
+        'ValueError: entry point is broken'
+    request_mlflow_wrapper(socket_path, {'shutdown': True})
+
+    server.join(timeout=10)
+    assert not server.is_alive()
+    assert not os.path.exists(socket_path)
+    assert 'Traceback' not in capsys.readouterr().err
+
+
+class _DyingServer:
+    """
+    Wrapper server stub that dies during the first run
+    """
+
+    def __init__(self, alive: bool = True):
+        self.alive = alive
+
+    def run(self, _):
+        self.alive = False
+        raise ConnectionError('MLflow wrapper server closed connection without response')
+
+
+def test_dead_wrapper_server_falls_back_to_subprocess(tmp_path, monkeypatch):
+    def run_wrapper(*_):
+        with open(tmp_path / conda.MLFLOW_WRAPPER_OUTPUT_FILE_PATH, 'w', encoding='utf-8') as output:
+            json.dump({'run_id': f'subprocess-run-{len(runs)}'}, output)
+        runs.append(None)
+    runs = []
+    monkeypatch.setattr(io_proc_utils, 'run', run_wrapper)
+    monkeypatch.setattr(conda, '_get_conda_command', lambda _: ['true'])
+    monkeypatch.setattr(conda, 'MLFLOW_WRAPPER_SERVER_ENABLED', True)
+    monkeypatch.setattr(conda, '_mlflow_wrapper_server_failed', False)
+
+    server = _DyingServer()
+    monkeypatch.setattr(conda, '_mlflow_wrapper_server', server)
+    assert conda.run_mlflow_wrapper({'entry_point': 'main'}, str(tmp_path)) == 'subprocess-run-0'
+    assert not server.alive
+
+    # Dead server is detected before run and is not requested anymore
+    assert conda.run_mlflow_wrapper({'entry_point': 'main'}, str(tmp_path)) == 'subprocess-run-1'
+    assert conda.get_mlflow_wrapper_server() is None
+
+
+def _running(pid):
+    try:
+        with open(f'/proc/{pid}/stat', encoding='utf-8') as stat:
+            # Killed orphans may stay zombies until init reaps them
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_wrapper_server_that_is_not_started_is_killed_with_its_children(tmp_path, monkeypatch):
+    wrapper_script = tmp_path / 'odahu-flow-mlflow-wrapper'
+    wrapper_script.write_text(f'#!/bin/sh\necho $$ > {tmp_path}/server.pid\n'
+                              f'sleep 60 &\necho $! > {tmp_path}/child.pid\nwait\n')
+    wrapper_script.chmod(0o755)
+    monkeypatch.setattr(conda.shutil, 'which', lambda _: str(wrapper_script))
+    monkeypatch.setattr(conda, '_get_conda_command', lambda _: ['true'])
+    monkeypatch.setattr(conda, 'MLFLOW_WRAPPER_SERVER_START_TIMEOUT', 1)
+
+    with pytest.raises(ValueError, match='not started in time'):
+        conda.MLFlowWrapperServer()
+
+    for name in ('server.pid', 'child.pid'):
+        assert not _running(int((tmp_path / name).read_text()))